@@ -0,0 +1,135 @@
+"""Month-over-month movers: which accounts' debits changed most since last month.
+
+The report is built from the TotalDue, PrevMonthTotalDue and Difference
+arrays of the reconciled results. Each top-N list (increases, decreases,
+largest percentage changes) is picked with np.argpartition, so only the n
+rows kept are ever sorted, whatever the number of accounts. Newly zeroed
+accounts (billed last month, nothing now) and new accounts (nothing last
+month) are boolean masks over the same arrays, counted with
+np.count_nonzero; only their first n rows are listed.
+"""
+import numpy as np
+import pandas as pd
+
+# Columns listed for every account in the movers report
+MOVER_COLUMNS = ["SabreCode", "CompanyName", "TotalDue", "PrevMonthTotalDue", "Difference", "PctChange"]
+
+
+def _top_n(values, n, largest=True):
+    """Return the positions of the n largest (or smallest) values, best first.
+
+    Uses argpartition so only the selected n values are ever sorted.
+    """
+    valid = np.flatnonzero(~np.isnan(values))
+    if n <= 0 or len(valid) == 0:
+        return np.array([], dtype=np.intp)
+
+    keyed = values[valid] if largest else -values[valid]
+    n = min(n, len(valid))
+    if n < len(valid):
+        picked = np.argpartition(-keyed, n - 1)[:n]
+    else:
+        picked = np.arange(len(valid))
+    picked = picked[np.argsort(-keyed[picked], kind="stable")]
+    return valid[picked]
+
+
+def movers_report(results_df, top_n=25, pct_threshold=50.0):
+    """Summarise month-over-month movement in the reconciled results.
+
+    Returns a dict with the top increases and decreases, the largest percentage
+    changes above pct_threshold, newly zeroed accounts, new accounts and the
+    overall counts and totals.
+    """
+    new = results_df["TotalDue"].to_numpy(dtype=float)
+    prev = results_df["PrevMonthTotalDue"].to_numpy(dtype=float)
+    difference = results_df["Difference"].to_numpy(dtype=float)
+
+    prev_filled = np.nan_to_num(prev)
+    new_filled = np.nan_to_num(new)
+
+    # Percentage change only makes sense against a positive previous amount
+    pct_change = np.full(len(difference), np.nan)
+    has_prev = prev_filled > 0
+    pct_change[has_prev] = difference[has_prev] / prev_filled[has_prev] * 100
+
+    zeroed_mask = (new_filled == 0) & (prev_filled > 0)
+    new_mask = (prev_filled == 0) & (new_filled > 0)
+    pct_mask = np.abs(np.nan_to_num(pct_change)) >= pct_threshold
+
+    increases = _top_n(np.where(difference > 0, difference, np.nan), top_n)
+    decreases = _top_n(np.where(difference < 0, difference, np.nan), top_n, largest=False)
+    pct_rows = np.flatnonzero(pct_mask)
+    pct_rows = pct_rows[_top_n(np.abs(pct_change[pct_rows]), top_n)]
+
+    def rows(positions):
+        frame = results_df.iloc[positions][MOVER_COLUMNS[:-1]].copy()
+        frame["PctChange"] = pct_change[positions]
+        return frame.reset_index(drop=True)
+
+    return {
+        "top_n": top_n,
+        "pct_threshold": pct_threshold,
+        "row_count": len(difference),
+        "changed_count": int(np.count_nonzero(np.nan_to_num(difference))),
+        "total_due": float(new_filled.sum()),
+        "prev_total_due": float(prev_filled.sum()),
+        "pct_count": int(np.count_nonzero(pct_mask)),
+        "zeroed_count": int(np.count_nonzero(zeroed_mask)),
+        "new_count": int(np.count_nonzero(new_mask)),
+        "top_increases": rows(increases),
+        "top_decreases": rows(decreases),
+        "pct_changes": rows(pct_rows),
+        "newly_zeroed": rows(np.flatnonzero(zeroed_mask)[:top_n]),
+        "new_accounts": rows(np.flatnonzero(new_mask)[:top_n]),
+    }
+
+
+# Report sections as (title, report key) in display order
+REPORT_SECTIONS = [
+    ("Top increases", "top_increases"),
+    ("Top decreases", "top_decreases"),
+    ("Largest percentage changes", "pct_changes"),
+    ("Newly zeroed accounts", "newly_zeroed"),
+    ("New accounts", "new_accounts"),
+]
+
+
+def summary_lines(report):
+    """Return the headline figures of a movers report as (label, value) pairs"""
+    return [
+        ("Accounts", report["row_count"]),
+        ("Changed accounts", report["changed_count"]),
+        ("Total due", round(report["total_due"], 2)),
+        ("Previous total due", round(report["prev_total_due"], 2)),
+        ("Net difference", round(report["total_due"] - report["prev_total_due"], 2)),
+        (f"Changes of {report['pct_threshold']:g}% or more", report["pct_count"]),
+        ("Newly zeroed accounts", report["zeroed_count"]),
+        ("New accounts", report["new_count"]),
+    ]
+
+
+def format_movers_report(report):
+    """Render a movers report as plain text for the console"""
+    lines = ["Month-over-month summary", "=" * 24]
+    for label, value in summary_lines(report):
+        lines.append(f"{label:<32}{value:>16,}" if isinstance(value, int) else f"{label:<32}{value:>16,.2f}")
+
+    for title, key in REPORT_SECTIONS:
+        frame = report[key]
+        lines.append("")
+        lines.append(f"{title} ({len(frame)} shown)")
+        lines.append("-" * len(lines[-1]))
+        if frame.empty:
+            lines.append("  none")
+            continue
+        for row in frame.itertuples(index=False):
+            pct = "" if pd.isna(row.PctChange) else f"{row.PctChange:+.1f}%"
+            lines.append(
+                f"  {row.SabreCode:<9}{str(row.CompanyName)[:20]:<22}"
+                f"{row.PrevMonthTotalDue:>12,.2f} -> {row.TotalDue:>12,.2f}"
+                f"{row.Difference:>+14,.2f}  {pct}"
+            )
+
+    return "\n".join(lines)
+
@@ -0,0 +1,259 @@
+"""Compressed archive of historical .eft files with a per-archive SabreCode index.
+
+Each archive file holds one .eft file, stored as independently compressed
+blocks of records followed by an index and a fixed size footer:
+
+    MAGIC | block 0 | block 1 | ... | index | footer (index offset, length, codec, MAGIC)
+
+The index lists every SabreCode (sorted, fixed width) with the block it lives
+in, so a lookup reads the footer and the index, then decompresses only the
+blocks holding the requested code. Archives are named
+"<period>_<source>_<digest>.efta", the digest being the start of the file's
+SHA-256, so a lookup limited to one period only opens that period's archives
+and two different files with the same name never replace each other (the
+same file archived twice does). The encoding sniffed from the file is kept
+with the index, so legacy Windows-1252 files are decoded as they were read.
+"""
+import datetime
+import glob
+import hashlib
+import json
+import os
+import struct
+import zlib
+
+import numpy as np
+
+import eft_io
+from keys import normalize_code
+from layouts import DEFAULT_LAYOUT, get_layout
+
+try:
+    import zstandard
+except ImportError:  # zstd is optional, zlib is always available
+    zstandard = None
+
+MAGIC = b"EFTARC01"
+ARCHIVE_EXTENSION = ".efta"
+RECORDS_PER_BLOCK = 2048
+# Hex digits of the file's SHA-256 in the archive name
+DIGEST_LENGTH = 12
+_FOOTER = struct.Struct("<QQ4s8s")
+_META_LENGTH = struct.Struct("<I")
+
+
+def _compress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=10).compress(data)
+    return zlib.compress(data, 9)
+
+
+def _decompress(data, codec):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data)
+
+
+def default_codec():
+    """Return the best compression codec available in this environment"""
+    return "zstd" if zstandard is not None else "zlib"
+
+
+def period_from_mtime(file_path):
+    """Return the YYYY-MM period of a file's modification time"""
+    return datetime.datetime.fromtimestamp(os.path.getmtime(file_path)).strftime("%Y-%m")
+
+
+def record_code(line, encoding=eft_io.UTF8):
+    """Return the SabreCode (first field) of a raw .eft record"""
+    text = line.decode(encoding, errors="replace").strip()
+    return text.split("  ", 1)[0].strip() if text else ""
+
+
+def write_archive(eft_path, archive_dir, period=None, codec=None, records_per_block=RECORDS_PER_BLOCK):
+    """Store an .eft file as a compressed, indexed archive and return the archive path"""
+    codec = codec or default_codec()
+    period = period or period_from_mtime(eft_path)
+
+    with open(eft_path, "rb") as file:
+        data = file.read()
+    encoding = eft_io.sniff(data[:eft_io.SNIFF_BYTES]).encoding
+    lines = data.splitlines(keepends=True)
+
+    header = lines[0] if lines else b""
+    records = lines[1:]
+
+    os.makedirs(archive_dir, exist_ok=True)
+    source = os.path.basename(eft_path)
+    digest = hashlib.sha256(data).hexdigest()[:DIGEST_LENGTH]
+    archive_path = os.path.join(archive_dir,
+                                f"{period}_{os.path.splitext(source)[0]}_{digest}{ARCHIVE_EXTENSION}")
+    temp_path = archive_path + ".tmp"
+    try:
+        _write_blocks(temp_path, header, records, codec, records_per_block,
+                      {"period": period, "source": source, "encoding": encoding})
+        os.replace(temp_path, archive_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+    return archive_path
+
+
+def _write_blocks(file_path, header, records, codec, records_per_block, info):
+    """Write the compressed blocks, index and footer of an archive"""
+    blocks = []
+    codes = []
+    block_ids = []
+    with open(file_path, "wb") as out:
+        out.write(MAGIC)
+        offset = len(MAGIC)
+        for block_id, start in enumerate(range(0, len(records), records_per_block)):
+            chunk = records[start:start + records_per_block]
+            payload = _compress(b"".join(chunk), codec)
+            out.write(payload)
+            blocks.append([offset, len(payload), len(chunk)])
+            offset += len(payload)
+            for line in chunk:
+                code = record_code(line, info["encoding"])
+                if code:
+                    codes.append(normalize_code(code).encode("utf-8"))
+                    block_ids.append(block_id)
+
+        # Sorted fixed width code array with the block of each code, for binary search
+        code_array = np.array(codes, dtype=bytes) if codes else np.array([], dtype="S7")
+        order = np.argsort(code_array, kind="stable")
+        code_array = code_array[order]
+        block_array = np.asarray(block_ids, dtype=np.int32)[order]
+
+        meta = json.dumps({
+            "version": 1,
+            "codec": codec,
+            **info,
+            "header_bytes": header.hex(),
+            "record_count": len(records),
+            "blocks": blocks,
+            "code_width": code_array.dtype.itemsize,
+            "code_count": len(code_array),
+        }).encode("utf-8")
+        index = _compress(_META_LENGTH.pack(len(meta)) + meta + code_array.tobytes() + block_array.tobytes(), codec)
+        out.write(index)
+        out.write(_FOOTER.pack(offset, len(index), codec.encode("ascii"), MAGIC))
+
+
+def archive_log_file(log_path, archive_dir, codec=None):
+    """Compress a debug log into the archive directory and return the compressed path"""
+    codec = codec or default_codec()
+    os.makedirs(archive_dir, exist_ok=True)
+    suffix = ".zst" if codec == "zstd" else ".zz"
+    target = os.path.join(archive_dir, os.path.basename(log_path) + suffix)
+    with open(log_path, "rb") as file:
+        data = _compress(file.read(), codec)
+    with open(target, "wb") as out:
+        out.write(data)
+    return target
+
+
+class EftArchive:
+    """Read access to one archive file; the index is loaded once on first use"""
+
+    def __init__(self, path):
+        self.path = path
+        self.meta = None
+        self._codes = None
+        self._block_ids = None
+
+    def _load_index(self):
+        if self.meta is not None:
+            return
+        with open(self.path, "rb") as file:
+            file.seek(-_FOOTER.size, os.SEEK_END)
+            index_offset, index_length, codec, magic = _FOOTER.unpack(file.read(_FOOTER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{self.path} is not an EFT archive")
+            file.seek(index_offset)
+            raw_index = file.read(index_length)
+
+        codec = codec.decode("ascii")
+        if codec == "zstd" and zstandard is None:
+            raise ValueError(f"{self.path} needs the zstandard package to be read")
+        index = _decompress(raw_index, codec)
+
+        (meta_length,) = _META_LENGTH.unpack_from(index)
+        meta_end = _META_LENGTH.size + meta_length
+        self.meta = json.loads(index[meta_end - meta_length:meta_end])
+        width = self.meta["code_width"]
+        count = self.meta["code_count"]
+        codes_end = meta_end + width * count
+        self._codes = np.frombuffer(index[meta_end:codes_end], dtype=f"S{width}") if width else np.array([], dtype="S1")
+        self._block_ids = np.frombuffer(index[codes_end:codes_end + 4 * count], dtype=np.int32)
+
+    @property
+    def period(self):
+        self._load_index()
+        return self.meta["period"]
+
+    @property
+    def encoding(self):
+        """Encoding of the archived file (archives written before it was recorded are sniffed)"""
+        self._load_index()
+        if "encoding" not in self.meta:
+            self.meta["encoding"] = eft_io.sniff(self.read_bytes()[:eft_io.SNIFF_BYTES]).encoding
+        return self.meta["encoding"]
+
+    def _read_block(self, file, block_id):
+        offset, length, _ = self.meta["blocks"][block_id]
+        file.seek(offset)
+        return _decompress(file.read(length), self.meta["codec"])
+
+    def lookup(self, sabre_code):
+        """Return the raw record lines for a SabreCode, reading only the blocks that hold it"""
+        self._load_index()
+        key = normalize_code(sabre_code).encode("utf-8")
+        left = np.searchsorted(self._codes, key, side="left")
+        right = np.searchsorted(self._codes, key, side="right")
+        if left == right:
+            return []
+
+        lines = []
+        encoding = self.encoding
+        with open(self.path, "rb") as file:
+            for block_id in np.unique(self._block_ids[left:right]):
+                for line in self._read_block(file, int(block_id)).splitlines(keepends=True):
+                    if normalize_code(record_code(line, encoding)).encode("utf-8") == key:
+                        lines.append(line)
+        return lines
+
+    def read_bytes(self):
+        """Return the original .eft file content, byte for byte"""
+        self._load_index()
+        parts = [bytes.fromhex(self.meta["header_bytes"])]
+        with open(self.path, "rb") as file:
+            for block_id in range(len(self.meta["blocks"])):
+                parts.append(self._read_block(file, block_id))
+        return b"".join(parts)
+
+    def read_text(self):
+        """Return the original .eft file content decoded with its own encoding"""
+        text = self.read_bytes().decode(self.encoding, errors="replace")
+        return text[1:] if text.startswith("\ufeff") else text
+
+
+def list_archives(archive_dir, period=None):
+    """Return the archive paths in archive_dir, optionally limited to a YYYY-MM period"""
+    pattern = f"{period}_*{ARCHIVE_EXTENSION}" if period else f"*{ARCHIVE_EXTENSION}"
+    return sorted(glob.glob(os.path.join(archive_dir, pattern)))
+
+
+def find_records(archive_dir, sabre_code, period=None, layout=DEFAULT_LAYOUT):
+    """Find every archived record for a SabreCode, returning one dict per record (oldest first)"""
+    layout = get_layout(layout)
+    results = []
+    for path in list_archives(archive_dir, period):
+        archive = EftArchive(path)
+        for line in archive.lookup(sabre_code):
+            record = layout.parse_line(line.decode(archive.encoding, errors="replace"))
+            record["Period"] = archive.period
+            record["Source"] = archive.meta["source"]
+            results.append(record)
+    return results
@@ -0,0 +1,250 @@
+"""Crash-safe writing of .eft files.
+
+Records go to a hidden temporary file next to the destination. The file only
+replaces the destination (with os.replace, after an fsync) once it is
+complete and its contents have been verified against the running SHA-256 and
+record count kept while writing, so a half-written .eft can never appear
+under the name the user chose.
+
+When the writer is given a fingerprint of its input, it also commits a
+checkpoint every few thousand records: the record count, byte offset and
+digest of everything written so far. If the run is interrupted, writing the
+same input to the same path again resumes after the last checkpoint instead
+of starting over. The .eft body itself never gets a trailer, since the bank
+format has no room for one; the integrity data lives in the checkpoint file.
+"""
+import codecs
+import hashlib
+import json
+import logging
+import os
+
+import pandas as pd
+
+# Records written between checkpoints
+CHECKPOINT_RECORDS = 20_000
+
+CHECKPOINT_VERSION = 1
+
+
+def frame_fingerprint(header_line, frame, eft_format=None, raw_digest=None):
+    """Return a digest identifying the header, the contents of a frame and the output format.
+
+    raw_digest identifies the original lines of a verbatim write.
+    """
+    digest = hashlib.sha256(header_line.rstrip("\r\n").encode("utf-8"))
+    if eft_format is not None:
+        digest.update(repr(eft_format).encode("utf-8"))
+    if raw_digest is not None:
+        digest.update(f"verbatim {raw_digest}".encode("utf-8"))
+    digest.update(str(list(frame.columns)).encode("utf-8"))
+    digest.update(pd.util.hash_pandas_object(frame, index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def _fsync_directory(directory):
+    """Make a rename durable; not every platform can open a directory"""
+    try:
+        fd = os.open(directory, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+
+def _scan_prefix(path, length, newline=b"\n", chunk_size=1 << 20):
+    """Return the SHA-256 object and the number of lines of the first length bytes of a file"""
+    digest = hashlib.sha256()
+    lines = 0
+    with open(path, "rb") as file:
+        remaining = length
+        while remaining:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            digest.update(chunk)
+            lines += chunk.count(newline)
+            remaining -= len(chunk)
+    return digest, lines
+
+
+class AtomicEftWriter:
+    """Write an .eft file through a temporary file, with optional checkpoints for resuming"""
+
+    def __init__(self, save_path, fingerprint=None, checkpoint_every=CHECKPOINT_RECORDS, encoding="utf-8",
+                 newline="\n", bom=False):
+        self.save_path = os.path.abspath(save_path)
+        self.fingerprint = fingerprint
+        self.checkpoint_every = checkpoint_every
+        self.encoding = encoding
+        self.newline = newline.encode("ascii")
+        self.bom = bom
+        directory, name = os.path.split(self.save_path)
+        self.directory = directory
+        self.temp_path = os.path.join(directory, f".{name}.part")
+        self.checkpoint_path = os.path.join(directory, f".{name}.ckpt")
+
+        self.records = 0
+        self.lines = 0
+        self.offset = 0
+        self.resumed = False
+        self._digest = hashlib.sha256()
+        self._file = None
+
+    @property
+    def start_record(self):
+        """Number of records already written by an interrupted run (0 for a fresh file)"""
+        return self.records if self.resumed else 0
+
+    def open(self):
+        checkpoint = self._load_checkpoint()
+        if checkpoint is not None:
+            self._file = open(self.temp_path, "r+b")
+            self._file.truncate(checkpoint["offset"])
+            self._file.seek(checkpoint["offset"])
+            self.records = checkpoint["records"]
+            self.lines = checkpoint["lines"]
+            self.offset = checkpoint["offset"]
+            self.resumed = True
+            logging.info(f"Resuming {self.save_path} after record {self.records:,}")
+        else:
+            self._remove(self.checkpoint_path)
+            self._file = open(self.temp_path, "wb")
+        return self
+
+    def _load_checkpoint(self):
+        """Return the checkpoint to resume from, or None if there is no usable one"""
+        if self.fingerprint is None or not os.path.exists(self.checkpoint_path):
+            return None
+        try:
+            with open(self.checkpoint_path, encoding="utf-8") as file:
+                checkpoint = json.load(file)
+            if checkpoint.get("version") != CHECKPOINT_VERSION or checkpoint.get("fingerprint") != self.fingerprint:
+                logging.info(f"Checkpoint for {self.save_path} belongs to different input, starting over")
+                return None
+            if os.path.getsize(self.temp_path) < checkpoint["offset"]:
+                logging.warning(f"Partial file for {self.save_path} is shorter than its checkpoint, starting over")
+                return None
+            digest, lines = _scan_prefix(self.temp_path, checkpoint["offset"], self.newline)
+            if digest.hexdigest() != checkpoint["sha256"] or lines != checkpoint["lines"]:
+                logging.warning(f"Partial file for {self.save_path} does not match its checkpoint, starting over")
+                return None
+        except (OSError, ValueError, KeyError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint for {self.save_path}: {e}")
+            return None
+        self._digest = digest
+        return checkpoint
+
+    def _encode(self, line):
+        """A line as bytes; bytes lines are already in the writer's encoding"""
+        return line if isinstance(line, bytes) else line.encode(self.encoding)
+
+    def _write_line(self, line, prefix=b""):
+        data = prefix + self._encode(line) + self.newline
+        self._file.write(data)
+        self._digest.update(data)
+        self.offset += len(data)
+        self.lines += 1
+
+    def write_header(self, header_line):
+        self._write_line(header_line.rstrip("\r\n"), codecs.BOM_UTF8 if self.bom else b"")
+
+    def write_record(self, line):
+        self._write_line(line)
+        self.records += 1
+        if self.fingerprint is not None and self.records % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def write_records(self, lines):
+        """Write a block of record lines (text, or bytes in the writer's encoding) in one write.
+
+        A checkpoint is committed if the block ends on a checkpoint boundary,
+        so blocks of checkpoint_every records keep the same resume points.
+        """
+        if not lines:
+            return
+        data = self.newline.join(map(self._encode, lines)) + self.newline
+        self._file.write(data)
+        self._digest.update(data)
+        self.offset += len(data)
+        self.lines += len(lines)
+        self.records += len(lines)
+        if self.fingerprint is not None and self.records % self.checkpoint_every == 0:
+            self.checkpoint()
+
+    def _sync(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def checkpoint(self):
+        """Make everything written so far durable and record where to resume from"""
+        self._sync()
+        state = {
+            "version": CHECKPOINT_VERSION,
+            "fingerprint": self.fingerprint,
+            "records": self.records,
+            "lines": self.lines,
+            "offset": self.offset,
+            "sha256": self._digest.hexdigest(),
+        }
+        temp_checkpoint = self.checkpoint_path + ".tmp"
+        with open(temp_checkpoint, "w", encoding="utf-8") as file:
+            json.dump(state, file)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(temp_checkpoint, self.checkpoint_path)
+
+    def verify(self):
+        """Check the temporary file against the running digest and line count"""
+        size = os.path.getsize(self.temp_path)
+        digest, lines = _scan_prefix(self.temp_path, size, self.newline)
+        if size != self.offset or digest.hexdigest() != self._digest.hexdigest() or lines != self.lines:
+            raise ValueError(f"Integrity check failed for {self.save_path}: expected {self.lines:,} lines "
+                             f"and {self.offset:,} bytes, found {lines:,} lines and {size:,} bytes")
+
+    def commit(self):
+        """Verify the finished file and move it into place"""
+        self._sync()
+        self._file.close()
+        self._file = None
+        try:
+            self.verify()
+        except ValueError:
+            # A file that fails verification is never resumed from either
+            self._remove(self.temp_path)
+            self._remove(self.checkpoint_path)
+            raise
+        os.replace(self.temp_path, self.save_path)
+        _fsync_directory(self.directory)
+        self._remove(self.checkpoint_path)
+        logging.info(f"Wrote {self.records:,} records to {self.save_path} (sha256 {self._digest.hexdigest()[:12]})")
+
+    def abort(self):
+        """Stop after a failure, keeping the checkpointed part of the file if the run can be resumed"""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self.fingerprint is None or not os.path.exists(self.checkpoint_path):
+            self._remove(self.temp_path)
+            self._remove(self.checkpoint_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self.open()
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.commit()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,572 @@
+"""Command line interface for running the debit order pipeline without the GUI.
+
+Usage examples (run from the repository root):
+    python DebitOrderApp/src/cli.py report --csv billrun.csv --eft previous.eft
+    python DebitOrderApp/src/cli.py report --csv billrun.csv --eft previous.eft --top 50 --excel summary.xlsx
+    python DebitOrderApp/src/cli.py report --csv billrun.csv --eft previous.eft --history archive --excel summary.xlsx
+    python DebitOrderApp/src/cli.py run --csv billrun.csv --eft previous.eft --out new.eft [--excel new.xlsx] [--layout sabre_standard] [--verbatim] [--stream]
+    python DebitOrderApp/src/cli.py dry-run --csv billrun.csv --eft previous.eft [--sample 20]
+    python DebitOrderApp/src/cli.py rollup --csv billrun.csv --eft previous.eft [--by bank] [--export banks.csv]
+    python DebitOrderApp/src/cli.py issues --eft previous.eft [--code TOO_LONG] [--export issues.csv]
+    python DebitOrderApp/src/cli.py duplicates --eft previous.eft [--csv billrun.csv] [--export duplicates.csv]
+    python DebitOrderApp/src/cli.py gaps --csv billrun.csv --eft previous.eft [--export gaps.csv]
+    python DebitOrderApp/src/cli.py watch --inbox inbox --outbox outbox
+    python DebitOrderApp/src/cli.py --metrics-port 9464 watch --inbox inbox --outbox outbox
+    python DebitOrderApp/src/cli.py master refresh --db customers.db January.eft February.eft
+    python DebitOrderApp/src/cli.py run --csv billrun.csv --eft previous.eft --out new.eft --master customers.db
+    python DebitOrderApp/src/cli.py run --csv billrun.csv --eft previous.eft --out new.eft --policy client_b --period 2025-05
+    python DebitOrderApp/src/cli.py run --csv billrun.csv --eft previous.eft --out new.eft --registry shared/runs.db --period 2025-05
+    python DebitOrderApp/src/cli.py registry list --db shared/runs.db [--client default] [--period 2025-05]
+    python DebitOrderApp/src/cli.py policies
+    python DebitOrderApp/src/cli.py compare expected.eft new.eft
+    python DebitOrderApp/src/cli.py archive add --dir archive --period 2023-03 March2023.eft
+    python DebitOrderApp/src/cli.py archive find --dir archive 0001234 [--period 2023-03]
+"""
+import argparse
+import contextlib
+import logging
+import os
+import sys
+import time
+
+import archive
+import customer_master
+import dry_run
+import eft_io
+import gaps
+import golden
+import metrics
+import policy
+import processing
+import rollups
+import run_registry
+import streaming
+import trends
+import watcher
+from analytics import movers_report, format_movers_report
+from duplicates import DuplicateRecordsError, find_duplicates
+from format_issues import ISSUE_CODES
+from keys import normalize_code
+from layouts import DEFAULT_LAYOUT, available_layouts
+
+
+def load_records(args, billing_df):
+    """Load the previous .eft file, adding billed customers from the customer master if one is given"""
+    header_line, eft_file_df, format_issues = processing.load_eft_file(args.eft, layout=args.layout)
+    if args.master:
+        with customer_master.CustomerMaster(args.master) as master:
+            eft_file_df, _ = processing.add_master_records(eft_file_df, billing_df, master, os.path.basename(args.eft))
+    return header_line, eft_file_df, format_issues
+
+
+def load_and_reconcile(args):
+    """Load both input files and return the reconciled results frame and the reconciliation gaps"""
+    billing_df = processing.load_billing_csv(args.csv, args.policy, args.period)
+    _, eft_file_df, _ = load_records(args, billing_df)
+    updated_df, matched_mask = processing.update_data(eft_file_df, billing_df)
+    results_df = processing.build_results_frame(eft_file_df, updated_df, matched_mask)
+    return results_df, gaps.find_gaps(eft_file_df, billing_df)
+
+
+def cmd_report(args):
+    """Print the month-over-month movers report"""
+    results_df, run_gaps = load_and_reconcile(args)
+
+    start = time.perf_counter()
+    report = movers_report(results_df, top_n=args.top, pct_threshold=args.pct)
+    logging.info(f"Movers report computed in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(format_movers_report(report))
+
+    history = None
+    if args.history:
+        history = trends.load_history(args.history, layout=args.layout)
+        print()
+        print(trends.format_trend_flags(trends.trend_frame(results_df, history), limit=args.top))
+
+    if args.excel:
+        processing.export_results_to_excel(args.excel, results_df, report, history, run_gaps)
+        print(f"\nExcel report written to {args.excel}")
+    return 0
+
+
+@contextlib.contextmanager
+def registered_run(args):
+    """Hold the run registry lock of the client and period while a run writes its files (if --registry is given)"""
+    if not args.registry:
+        yield {}
+        return
+    with run_registry.RunRegistry(args.registry, journal_mode=args.registry_journal) as registry, \
+            registry.run(args.client or args.policy, args.period, args.csv, args.eft, args.out,
+                         rerun=args.rerun) as summary:
+        yield summary
+
+
+def cmd_run(args):
+    """Create the new .eft file (and optionally the Excel export) in one go"""
+    if args.stream:
+        if args.history or args.block_duplicates:
+            print("--stream cannot add trends (--history) or check duplicates (--block-duplicates)")
+            return 2
+    try:
+        with registered_run(args) as summary:
+            if args.stream:
+                summary.update(streaming.run_streaming(args.csv, args.eft, args.out, args.excel, layout=args.layout,
+                                                       master_path=args.master, verbatim_records=args.verbatim,
+                                                       policy=args.policy, period=args.period))
+            else:
+                summary.update(processing.run_pipeline(args.csv, args.eft, args.out, args.excel, layout=args.layout,
+                                                       history_dir=args.history,
+                                                       block_duplicates=args.block_duplicates,
+                                                       master_path=args.master, verbatim_records=args.verbatim,
+                                                       policy=args.policy, period=args.period))
+    except run_registry.RunLockError as e:
+        print(e)
+        return 1
+    except DuplicateRecordsError as e:
+        blocking = e.blocking
+        print(f"No .eft file written: {blocking.group_count():,} duplicate groups would debit an account "
+              f"more than once (see the duplicates command)")
+        for description in blocking.describe():
+            print(f"  {description}")
+        return 1
+    print(f"Wrote {summary['rows']:,} records to {args.out} "
+          f"({summary['matched']:,} matched, {summary['unmatched']:,} unmatched)")
+    if summary["master_added"]:
+        print(f"{summary['master_added']:,} billed customers were added from the customer master")
+    if summary["uncollected"]:
+        print(f"{summary['billing_only']:,} billed customers have no EFT record, "
+              f"R {summary['billing_only_cents'] / 100:,.2f} is not in {args.out} (see the gaps command)")
+    return 1 if summary["uncollected"] else 0
+
+
+def cmd_dry_run(args):
+    """Print what the new .eft file would contain without writing any file"""
+    billing_df = processing.load_billing_csv(args.csv, args.policy, args.period)
+    header_line, eft_file_df, _ = load_records(args, billing_df)
+    updated_df, matched_mask = processing.update_data(eft_file_df, billing_df)
+    summary = dry_run.simulate(eft_file_df, updated_df, matched_mask, layout=args.layout, header_line=header_line,
+                               eft_format=eft_io.sniff_file(args.eft), sample_lines=args.sample)
+    print(dry_run.format_dry_run(summary))
+    return 1 if summary["duplicate_groups"] else 0
+
+
+def cmd_rollup(args):
+    """Print totals, counts and month-over-month deltas per branch or per bank"""
+    results_df, _ = load_and_reconcile(args)
+
+    start = time.perf_counter()
+    frame = rollups.rollup(results_df)[args.by]
+    logging.info(f"Rollup computed in {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    print(rollups.format_rollup(frame))
+
+    if args.export:
+        if args.export.lower().endswith(".xlsx"):
+            frame.to_excel(args.export, index=False, sheet_name=f"{args.by.title()} Totals")
+        else:
+            frame.to_csv(args.export, index=False)
+        print(f"\nRollup written to {args.export}")
+    return 0
+
+
+def cmd_issues(args):
+    """List the format issues of an .eft file"""
+    _, _, format_issues = processing.load_eft_file(args.eft, layout=args.layout)
+    selected = format_issues.query(code=args.code, line=args.line, field=args.field)
+
+    counts = selected.counts()
+    print(f"{len(selected):,} format issues on {selected.affected_lines():,} lines")
+    for name, count in counts.items():
+        print(f"  {name:<14}{count:>10,}")
+    for description in selected.describe(limit=args.limit):
+        print(f"  {description}")
+
+    if args.export:
+        selected.export(args.export)
+        print(f"Issues written to {args.export}")
+    return 1 if len(selected) else 0
+
+
+def cmd_duplicates(args):
+    """List the SabreCodes and bank accounts that occur on more than one EFT line"""
+    _, eft_file_df, _ = processing.load_eft_file(args.eft, layout=args.layout)
+    if args.csv:
+        # Check the amounts the new .eft file would carry
+        eft_file_df, _ = processing.update_data(eft_file_df, processing.load_billing_csv(args.csv, args.policy, args.period))
+    duplicates = find_duplicates(eft_file_df)
+    blocking = duplicates.blocking()
+
+    print(f"{duplicates.group_count():,} duplicate groups covering {len(duplicates):,} records, "
+          f"{blocking.group_count():,} of them debit more than once")
+    for name, count in duplicates.counts().items():
+        print(f"  {name:<16}{count:>10,}")
+    for description in (blocking if len(blocking) else duplicates).describe(limit=args.limit):
+        print(f"  {description}")
+
+    if args.export:
+        duplicates.export(args.export)
+        print(f"\nDuplicates written to {args.export}")
+    return 1 if len(blocking) else 0
+
+
+def cmd_gaps(args):
+    """List the EFT records without a billing record and the billed customers without an EFT record"""
+    _, run_gaps = load_and_reconcile(args)
+    print(gaps.format_gaps(run_gaps, limit=args.limit))
+
+    if args.export:
+        frame = run_gaps.frame()
+        if args.export.lower().endswith(".xlsx"):
+            frame.to_excel(args.export, index=False, sheet_name="Reconciliation Gaps")
+        else:
+            frame.to_csv(args.export, index=False)
+        print(f"\nGaps written to {args.export}")
+    return 1 if len(run_gaps.uncollected()) else 0
+
+
+def cmd_watch(args):
+    """Process bill runs from the inbox as they arrive"""
+    inbox_watcher = watcher.InboxWatcher(args.inbox, args.outbox, debounce=args.debounce,
+                                         interval=args.interval, excel=not args.no_excel,
+                                         block_duplicates=args.block_duplicates, master_path=args.master,
+                                         verbatim_records=args.verbatim, policy=args.policy,
+                                         registry_path=args.registry, client=args.client, rerun=args.rerun, period=args.period,
+                                         registry_journal=args.registry_journal, pair_any=args.pair_any)
+    if args.once:
+        for record in inbox_watcher.scan_once():
+            print(f"{record['csv']}: {record['status']}")
+        return 0
+    inbox_watcher.run_forever()
+    return 0
+
+
+def cmd_archive_add(args):
+    """Archive .eft files (and compress debug logs) into the archive directory"""
+    for path in args.files:
+        if path.endswith(".log"):
+            target = archive.archive_log_file(path, args.dir)
+        else:
+            target = archive.write_archive(path, args.dir, period=args.period)
+        print(f"{path} -> {target} ({os.path.getsize(path):,} -> {os.path.getsize(target):,} bytes)")
+    return 0
+
+
+def cmd_archive_find(args):
+    """Print every archived record for a SabreCode"""
+    start = time.perf_counter()
+    records = archive.find_records(args.dir, args.code, period=args.period, layout=args.layout)
+    logging.info(f"Archive lookup took {(time.perf_counter() - start) * 1000:.1f} ms")
+
+    if not records:
+        print(f"No archived records for {args.code}")
+        return 1
+    for record in records:
+        amount = record.get("TotalDue", "")
+        print(f"{record['Period']}  {record['Source']:<30}  {record['SabreCode']:<9}"
+              f"{record.get('CompanyName', ''):<22}{amount}")
+    return 0
+
+
+def cmd_archive_extract(args):
+    """Restore the original .eft file from an archive"""
+    with open(args.output, "wb") as out:
+        out.write(archive.EftArchive(args.archive).read_bytes())
+    print(f"Restored {args.archive} -> {args.output}")
+    return 0
+
+
+def cmd_master_refresh(args):
+    """Store the customers of .eft files in the customer master"""
+    with customer_master.CustomerMaster(args.db) as master:
+        for path in args.files:
+            _, eft_file_df, _ = processing.load_eft_file(path, layout=args.layout)
+            changed = master.refresh(eft_file_df, source=os.path.basename(path))
+            print(f"{path}: {changed:,} of {len(eft_file_df):,} records added or updated customers")
+        print(f"{len(master):,} customers in {args.db}")
+    return 0
+
+
+def cmd_master_show(args):
+    """Print the stored record fields of SabreCodes"""
+    with customer_master.CustomerMaster(args.db) as master:
+        found = master.lookup(args.codes)
+    missing = 0
+    for code in args.codes:
+        fields = found.get(normalize_code(code))
+        if fields is None:
+            print(f"{code}: not in the customer master")
+            missing += 1
+            continue
+        print(f"{code}:")
+        for name, value in fields.items():
+            print(f"  {name:<14}{value}")
+    return 1 if missing else 0
+
+
+def cmd_compare(args):
+    """Compare outputs byte for byte (.xlsx files member by member)"""
+    start = time.perf_counter()
+    differences = golden.compare_outputs(args.expected, args.actual)
+    logging.info(f"Compared in {(time.perf_counter() - start) * 1000:.1f} ms")
+    if not differences:
+        print(f"{args.actual} is identical to {args.expected}")
+        return 0
+    for difference in differences:
+        print(difference.describe())
+    return 1
+
+
+def cmd_registry_list(args):
+    """List the runs in the run registry, newest first, with the locks currently held"""
+    with run_registry.RunRegistry(args.db, journal_mode=args.registry_journal) as registry:
+        runs = registry.runs(client=args.client, period=args.period, limit=args.limit)
+    print(run_registry.format_runs(runs) if runs else "No runs registered")
+    return 0
+
+
+def cmd_registry_release(args):
+    """Remove a run lock by hand, e.g. one left behind by a crashed run"""
+    with run_registry.RunRegistry(args.db, journal_mode=args.registry_journal) as registry:
+        released = registry.release(args.client, args.period)
+    key = run_registry.period_key(args.period)
+    print(f"Lock of {args.client} {key} released" if released else f"{args.client} {key} was not locked")
+    return 0
+
+
+def cmd_policies(args):
+    """Print the VAT and rounding rules of every policy (or of the named ones)"""
+    for name in args.names or policy.available_policies():
+        client_policy = policy.get_policy(name)
+        print(f"{client_policy.name}: {client_policy.description}")
+        for rule in client_policy.rules:
+            print(f"  {rule.describe()}")
+    return 0
+
+
+def add_policy_arguments(parser, period=True):
+    """Add the options selecting the VAT and rounding rule of the bill run"""
+    parser.add_argument("--policy", default=policy.DEFAULT_POLICY,
+                        help=f"VAT and rounding policy, one of {', '.join(policy.available_policies())} or a .json file")
+    if period:
+        parser.add_argument("--period", help="Billing period as YYYY-MM, selects the policy rule (defaults to today)")
+
+
+def add_registry_arguments(parser):
+    """Add the options registering a run in a shared run registry"""
+    parser.add_argument("--registry", help="Shared run registry database; locks the client and period while running")
+    parser.add_argument("--client", help="Client the run is registered under (defaults to the --policy name)")
+    parser.add_argument("--rerun", action="store_true",
+                        help="Run even if the client and period was already processed")
+    parser.add_argument("--registry-journal", choices=run_registry.JOURNAL_MODES, default=run_registry.DELETE,
+                        help="SQLite journal mode of the registry (wal only if every operator runs on this host)")
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Debit order EFT processing")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Enable debug logging")
+    parser.add_argument("--metrics-port", type=int,
+                        help="Serve progress and throughput metrics at http://127.0.0.1:PORT/metrics")
+    parser.add_argument("--metrics-file", help="Write the metrics to this file (Prometheus text format)")
+    parser.add_argument("--metrics-interval", type=float, default=metrics.FILE_INTERVAL,
+                        help="Seconds between rewrites of --metrics-file")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    report_parser = subparsers.add_parser("report", help="Show the top month-over-month movers")
+    report_parser.add_argument("--csv", required=True, help="Bill run CSV file")
+    report_parser.add_argument("--eft", required=True, help="Previous month .eft file")
+    report_parser.add_argument("--top", type=int, default=25, help="Number of accounts per section")
+    report_parser.add_argument("--pct", type=float, default=50.0, help="Percentage change threshold")
+    report_parser.add_argument("--excel", help="Also write the Excel report to this .xlsx file")
+    report_parser.add_argument("--history", help="Archive directory of past runs, adds multi-month trends")
+    report_parser.add_argument("--master", help="Customer master database; adds billed customers missing from the .eft file")
+    report_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                               help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    add_policy_arguments(report_parser)
+    report_parser.set_defaults(func=cmd_report)
+
+    run_parser = subparsers.add_parser("run", help="Create the new .eft file without the GUI")
+    run_parser.add_argument("--csv", required=True, help="Bill run CSV file")
+    run_parser.add_argument("--eft", required=True, help="Previous month .eft file")
+    run_parser.add_argument("--out", required=True, help="Path of the new .eft file")
+    run_parser.add_argument("--excel", help="Also write the Excel export to this .xlsx file")
+    run_parser.add_argument("--history", help="Archive directory of past runs, adds multi-month trends")
+    run_parser.add_argument("--block-duplicates", action="store_true",
+                            help="Refuse to write the .eft file if any account would be debited twice")
+    run_parser.add_argument("--master", help="Customer master database; adds billed customers missing from the .eft file")
+    run_parser.add_argument("--verbatim", action="store_true",
+                            help="Keep the original record lines and only replace their TotalDue")
+    run_parser.add_argument("--stream", action="store_true",
+                            help="Process the .eft file in batches with bounded memory (Excel: detail and gaps sheets only)")
+    run_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                            help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    add_policy_arguments(run_parser)
+    add_registry_arguments(run_parser)
+    run_parser.set_defaults(func=cmd_run)
+
+    dry_run_parser = subparsers.add_parser("dry-run", help="Show what the new .eft file would contain without writing it")
+    dry_run_parser.add_argument("--csv", required=True, help="Bill run CSV file")
+    dry_run_parser.add_argument("--eft", required=True, help="Previous month .eft file")
+    dry_run_parser.add_argument("--sample", type=int, default=dry_run.SAMPLE_LINES,
+                                help="Number of record lines to render as a preview")
+    dry_run_parser.add_argument("--master", help="Customer master database; adds billed customers missing from the .eft file")
+    dry_run_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                                help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    add_policy_arguments(dry_run_parser)
+    dry_run_parser.set_defaults(func=cmd_dry_run)
+
+    rollup_parser = subparsers.add_parser("rollup", help="Show totals per branch or per bank")
+    rollup_parser.add_argument("--csv", required=True, help="Bill run CSV file")
+    rollup_parser.add_argument("--eft", required=True, help="Previous month .eft file")
+    rollup_parser.add_argument("--by", choices=["branch", "bank"], default="branch", help="Group by BranchCode or bank")
+    rollup_parser.add_argument("--export", help="Write the rollup to this .csv or .xlsx file")
+    rollup_parser.add_argument("--master", help="Customer master database; adds billed customers missing from the .eft file")
+    rollup_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                               help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    add_policy_arguments(rollup_parser)
+    rollup_parser.set_defaults(func=cmd_rollup)
+
+    issues_parser = subparsers.add_parser("issues", help="List the format issues of an .eft file")
+    issues_parser.add_argument("--eft", required=True, help=".eft file to check")
+    issues_parser.add_argument("--code", choices=ISSUE_CODES, help="Only show this kind of issue")
+    issues_parser.add_argument("--line", type=int, help="Only show issues on this line")
+    issues_parser.add_argument("--field", type=int, help="Only show issues in this field (1-based)")
+    issues_parser.add_argument("--limit", type=int, default=20, help="Number of issues to print")
+    issues_parser.add_argument("--export", help="Write the issues to this .csv or .xlsx file")
+    issues_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                               help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    issues_parser.set_defaults(func=cmd_issues)
+
+    duplicates_parser = subparsers.add_parser("duplicates", help="Find SabreCodes and bank accounts on several EFT lines")
+    duplicates_parser.add_argument("--eft", required=True, help=".eft file to check")
+    duplicates_parser.add_argument("--csv", help="Bill run CSV file, to check the new amounts instead of the previous ones")
+    duplicates_parser.add_argument("--limit", type=int, default=20, help="Number of groups to print")
+    duplicates_parser.add_argument("--export", help="Write the groups to this .csv or .xlsx file")
+    duplicates_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                                   help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    add_policy_arguments(duplicates_parser)
+    duplicates_parser.set_defaults(func=cmd_duplicates)
+
+    gaps_parser = subparsers.add_parser("gaps", help="Find customers that are only in the .eft file or only billed")
+    gaps_parser.add_argument("--csv", required=True, help="Bill run CSV file")
+    gaps_parser.add_argument("--eft", required=True, help="Previous month .eft file")
+    gaps_parser.add_argument("--limit", type=int, default=20, help="Number of billed customers to print")
+    gaps_parser.add_argument("--export", help="Write both sides to this .csv or .xlsx file")
+    gaps_parser.add_argument("--master", help="Customer master database; adds billed customers missing from the .eft file")
+    gaps_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                             help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    add_policy_arguments(gaps_parser)
+    gaps_parser.set_defaults(func=cmd_gaps)
+
+    watch_parser = subparsers.add_parser("watch", help="Process bill runs dropped into an inbox folder")
+    watch_parser.add_argument("--inbox", required=True, help="Folder where bill run CSV and .eft files land")
+    watch_parser.add_argument("--outbox", required=True, help="Folder for the generated files and run log")
+    watch_parser.add_argument("--debounce", type=float, default=10.0,
+                              help="Seconds a file must stay unchanged before it is processed")
+    watch_parser.add_argument("--interval", type=float, default=5.0, help="Polling interval in seconds")
+    watch_parser.add_argument("--no-excel", action="store_true", help="Only write the .eft file")
+    watch_parser.add_argument("--block-duplicates", action="store_true",
+                              help="Fail bill runs in which any account would be debited twice")
+    watch_parser.add_argument("--master", help="Customer master database; adds billed customers missing from the .eft file")
+    watch_parser.add_argument("--verbatim", action="store_true",
+                              help="Keep the original record lines and only replace their TotalDue")
+    watch_parser.add_argument("--once", action="store_true", help="Scan the inbox once and exit")
+    watch_parser.add_argument("--pair-any", action="store_true",
+                              help="Pair a lone CSV with a lone .eft file even if they share neither a name nor a period")
+    add_policy_arguments(watch_parser, period=False)
+    watch_parser.add_argument("--period", help="Billing period as YYYY-MM of bill runs whose file name has none "
+                                               "(defaults to the current month)")
+    add_registry_arguments(watch_parser)
+    watch_parser.set_defaults(func=cmd_watch)
+
+    master_parser = subparsers.add_parser("master", help="Maintain the customer master (banking details by SabreCode)")
+    master_commands = master_parser.add_subparsers(dest="master_command", required=True)
+
+    master_refresh_parser = master_commands.add_parser("refresh", help="Store the customers of .eft files")
+    master_refresh_parser.add_argument("--db", required=True, help="Customer master database (created if missing)")
+    master_refresh_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                                       help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    master_refresh_parser.add_argument("files", nargs="+", help=".eft files, oldest first (later files win)")
+    master_refresh_parser.set_defaults(func=cmd_master_refresh)
+
+    master_show_parser = master_commands.add_parser("show", help="Show the stored fields of SabreCodes")
+    master_show_parser.add_argument("--db", required=True, help="Customer master database")
+    master_show_parser.add_argument("codes", nargs="+", help="SabreCodes to look up")
+    master_show_parser.set_defaults(func=cmd_master_show)
+
+    registry_parser = subparsers.add_parser("registry", help="Show the shared run registry or release a lock")
+    registry_commands = registry_parser.add_subparsers(dest="registry_command", required=True)
+
+    registry_list_parser = registry_commands.add_parser("list", help="List registered runs, newest first")
+    registry_list_parser.add_argument("--db", required=True, help="Run registry database")
+    registry_list_parser.add_argument("--client", help="Only show runs of this client")
+    registry_list_parser.add_argument("--period", help="Only show runs of this YYYY-MM period")
+    registry_list_parser.add_argument("--limit", type=int, default=50, help="Number of runs to show")
+    registry_list_parser.set_defaults(func=cmd_registry_list)
+
+    registry_release_parser = registry_commands.add_parser("release", help="Remove the lock of a client and period")
+    registry_release_parser.add_argument("--db", required=True, help="Run registry database")
+    registry_release_parser.add_argument("--client", required=True, help="Client of the lock")
+    registry_release_parser.add_argument("--period", help="YYYY-MM period of the lock (defaults to this month)")
+    registry_release_parser.set_defaults(func=cmd_registry_release)
+
+    for registry_command_parser in (registry_list_parser, registry_release_parser):
+        registry_command_parser.add_argument("--registry-journal", choices=run_registry.JOURNAL_MODES,
+                                             default=run_registry.DELETE,
+                                             help="SQLite journal mode of the registry (wal only if every operator "
+                                                  "runs on this host)")
+
+    policies_parser = subparsers.add_parser("policies", help="Show the VAT and rounding rules of the policies")
+    policies_parser.add_argument("names", nargs="*", help="Policies to show (all by default)")
+    policies_parser.set_defaults(func=cmd_policies)
+
+    compare_parser = subparsers.add_parser("compare", help="Check that an output is byte-identical to an expected one")
+    compare_parser.add_argument("expected", help="Expected .eft or .xlsx file")
+    compare_parser.add_argument("actual", help="File to check")
+    compare_parser.set_defaults(func=cmd_compare)
+
+    archive_parser = subparsers.add_parser("archive", help="Archive and search historical .eft files")
+    archive_commands = archive_parser.add_subparsers(dest="archive_command", required=True)
+
+    add_parser = archive_commands.add_parser("add", help="Archive .eft files or compress .log files")
+    add_parser.add_argument("--dir", required=True, help="Archive directory")
+    add_parser.add_argument("--period", help="Billing period as YYYY-MM (defaults to the file's month)")
+    add_parser.add_argument("files", nargs="+", help=".eft or eft_debug_*.log files")
+    add_parser.set_defaults(func=cmd_archive_add)
+
+    find_parser = archive_commands.add_parser("find", help="Find archived records for a SabreCode")
+    find_parser.add_argument("--dir", required=True, help="Archive directory")
+    find_parser.add_argument("--period", help="Only search this YYYY-MM period")
+    find_parser.add_argument("--layout", default=DEFAULT_LAYOUT,
+                             help=f"EFT record layout, one of {', '.join(available_layouts())} or a .json file")
+    find_parser.add_argument("code", help="SabreCode to look up")
+    find_parser.set_defaults(func=cmd_archive_find)
+
+    extract_parser = archive_commands.add_parser("extract", help="Restore the original .eft file from an archive")
+    extract_parser.add_argument("archive", help="Archive file (.efta)")
+    extract_parser.add_argument("output", help="Path of the restored .eft file")
+    extract_parser.set_defaults(func=cmd_archive_extract)
+
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    logging.basicConfig(
+        level=logging.DEBUG if args.verbose else logging.INFO,
+        format='%(asctime)s - %(levelname)s - %(message)s'
+    )
+    server = metrics.serve_http(args.metrics_port) if args.metrics_port is not None else None
+    metrics_file = metrics.MetricsFileWriter(args.metrics_file, args.metrics_interval).start() \
+        if args.metrics_file else None
+    try:
+        return args.func(args)
+    finally:
+        if server is not None:
+            server.shutdown()
+        if metrics_file is not None:
+            metrics_file.stop()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,170 @@
+"""Customer master data: the record fields of every customer seen in an .eft file.
+
+CompanyName, AccNumber and BranchCode only exist in the .eft records, so a
+customer who is billed but missing from last month's file (new, or returning
+after a break) has no banking details to be debited with. The master keeps
+the latest text fields of every SabreCode in a SQLite table keyed on the
+canonical code. It is refreshed from every loaded .eft file, and lookups go
+through an in-process LRU cache before they reach the index.
+"""
+import collections
+import datetime
+import json
+import logging
+import sqlite3
+from json.encoder import encode_basestring
+
+import numpy as np
+import pandas as pd
+
+from keys import intern_codes, normalize_codes
+
+# Customers kept in the in-process cache
+CACHE_SIZE = 50_000
+
+# Codes per SELECT ... IN (...) query, below SQLite's limit on bound parameters
+LOOKUP_BATCH = 500
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS customers (
+    sabre_code TEXT PRIMARY KEY,
+    fields TEXT NOT NULL,
+    source TEXT NOT NULL,
+    updated TEXT NOT NULL
+) WITHOUT ROWID
+"""
+
+_UPSERT = """
+INSERT INTO customers (sabre_code, fields, source, updated) VALUES (?, ?, ?, ?)
+ON CONFLICT(sabre_code) DO UPDATE SET fields = excluded.fields, source = excluded.source, updated = excluded.updated
+"""
+
+
+def _escaped_column(column):
+    """Return a column as JSON string contents, escaping each distinct value once"""
+    ids, uniques = pd.factorize(column.astype(object).where(column.notna(), ""))
+    escaped = np.array([encode_basestring(str(value))[1:-1] for value in uniques] + [""], dtype=object)
+    return escaped[ids]  # ids of -1 (missing) take the trailing ""
+
+
+def _fields_json(frame, names):
+    """Serialize the named columns of every row as a JSON object"""
+    template = "{" + ", ".join(f"{json.dumps(name)}: \"%s\"" for name in names) + "}"
+    columns = [_escaped_column(frame[name]) for name in names]
+    return [template % row for row in zip(*columns)] if names else ["{}"] * len(frame)
+
+
+class CustomerMaster:
+    """SQLite store of customer record fields by canonical SabreCode, with an LRU cache in front"""
+
+    def __init__(self, db_path, cache_size=CACHE_SIZE):
+        self.db_path = db_path
+        self.cache_size = cache_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = collections.OrderedDict()
+        self._connection = sqlite3.connect(db_path)
+        self._connection.execute(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def __len__(self):
+        return self._connection.execute("SELECT COUNT(*) FROM customers").fetchone()[0]
+
+    def refresh(self, eft_df, source=""):
+        """Store the text fields of every record (the last one wins for repeated codes).
+
+        Only customers whose fields changed are written. Returns the number of
+        customers added or updated.
+        """
+        # Codes repeat in the records, so only the distinct ones are normalized
+        ids, uniques = pd.factorize(eft_df["SabreCode"].astype(object))
+        codes = pd.Series(normalize_codes(pd.Series(uniques, dtype=object)).to_numpy()[ids], copy=False)
+        keep = ((codes != "") & ~codes.duplicated(keep="last")).to_numpy()
+        codes = codes[keep].tolist()
+        fields = _fields_json(eft_df[keep], [name for name in eft_df.columns if name != "TotalDue"])
+
+        stored = dict(self._select("sabre_code, fields", codes))
+        updated = datetime.datetime.now().isoformat(timespec="seconds")
+        rows = [(code, text, source, updated) for code, text in zip(codes, fields) if stored.get(code) != text]
+        with self._connection:
+            self._connection.executemany(_UPSERT, rows)
+        for row in rows:
+            self._cache.pop(row[0], None)
+        logging.info(f"Customer master {self.db_path}: {len(rows):,} of {len(codes):,} customers added or updated "
+                     f"from {source or 'records'}")
+        return len(rows)
+
+    def _select(self, columns, codes):
+        """Yield the selected columns of the stored customers among codes, in batches"""
+        for start in range(0, len(codes), LOOKUP_BATCH):
+            batch = codes[start:start + LOOKUP_BATCH]
+            query = f"SELECT {columns} FROM customers WHERE sabre_code IN ({','.join('?' * len(batch))})"
+            yield from self._connection.execute(query, batch)
+
+    def _remember(self, code, fields):
+        self._cache[code] = fields
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    def lookup(self, codes):
+        """Return a dict of canonical code to record fields for the codes in the master"""
+        found = {}
+        missing = []
+        for code in dict.fromkeys(normalize_codes(codes)):
+            if not code:
+                continue
+            if code in self._cache:
+                self._cache.move_to_end(code)
+                found[code] = self._cache[code]
+                self.hits += 1
+            else:
+                missing.append(code)
+                self.misses += 1
+
+        for code, fields in self._select("sabre_code, fields", missing):
+            found[code] = json.loads(fields)
+            self._remember(code, found[code])
+        return found
+
+    def get(self, code):
+        """Return the record fields of one SabreCode, or None"""
+        return self.lookup([code]).get(normalize_codes([code])[0])
+
+
+def missing_customers(eft_df, billing_df):
+    """Return the canonical codes of billed customers that have no record in eft_df"""
+    (eft_ids, billing_ids), categories = intern_codes(eft_df["SabreCode"], billing_df["SabreCode"])
+    present = np.zeros(len(categories), dtype=bool)
+    present[eft_ids] = True
+    missing = ~present[billing_ids] & (categories[billing_ids] != "")
+    return list(dict.fromkeys(categories[billing_ids[missing]]))
+
+
+def master_records(eft_df, billing_df, master):
+    """Build records for the billed customers missing from eft_df, filled from the master.
+
+    Returns the records (eft_df's columns, TotalDue unknown since they were
+    not in last month's file) and the codes the master does not know either.
+    """
+    return records_for_codes(missing_customers(eft_df, billing_df), list(eft_df.columns), master)
+
+
+def records_for_codes(codes, columns, master):
+    """Build records with the given columns for canonical codes from the master.
+
+    Returns the records (TotalDue unknown) and the codes the master does not know.
+    """
+    found = master.lookup(codes)
+    rows = [[found[code].get(name, "") for name in columns] for code in codes if code in found]
+    records = pd.DataFrame(rows, columns=columns, dtype=object)
+    records["TotalDue"] = pd.array([pd.NA] * len(records), dtype="Int64")
+    return records, [code for code in codes if code not in found]
@@ -0,0 +1,107 @@
+"""Dry run of a bill run: what the new .eft file would contain, without writing anything.
+
+Everything is computed from the reconciled columns already in memory: the
+totals and counts are a few vectorized passes, and only a small sample of
+records is rendered to show the exact lines that would be written.
+"""
+import codecs
+import logging
+import time
+
+import numpy as np
+
+from duplicates import find_duplicates
+from eft_io import EftFormat
+from layouts import DEFAULT_LAYOUT, get_layout
+from money import cents_to_rands
+
+# Records rendered as a preview of the new file
+SAMPLE_LINES = 10
+
+# Records, spread evenly over the file, encoded to estimate the size of the new file
+SIZE_SAMPLE_LINES = 2000
+
+
+def _estimate_bytes(updated_df, layout, eft_format):
+    """Estimate the size of the record lines from an evenly spread sample of records, encoded.
+
+    The encoded sample catches multi-byte characters and overlong fields; a
+    file small enough to be sampled whole is measured exactly. Records
+    written verbatim keep their original bytes, which the estimate ignores.
+    """
+    count = len(updated_df)
+    if count == 0:
+        return 0
+    positions = np.unique(np.linspace(0, count - 1, min(count, SIZE_SAMPLE_LINES)).astype(np.int64))
+    lines = layout.format_frame(updated_df.iloc[positions])
+    sizes = [len(line.encode(eft_format.encoding, errors="replace")) for line in lines]
+    return int(round(sum(sizes) / len(sizes) * count)) + count * len(eft_format.newline)
+
+
+def simulate(eft_file_df, updated_df, matched, layout=DEFAULT_LAYOUT, header_line=None, eft_format=None,
+             sample_lines=SAMPLE_LINES, duplicates=None):
+    """Project the new .eft file from the loaded and updated records.
+
+    Returns a dict with the record count, matched and unmatched records, the
+    new and previous totals (in cents), the zeroed, changed and new debits,
+    the duplicate groups that would debit an account twice, the estimated
+    file size (in eft_format, UTF-8 with LF line endings by default, see
+    _estimate_bytes) and the first sample_lines rendered record lines. Pass
+    the duplicates already found in updated_df to skip searching for them
+    again.
+    """
+    start = time.perf_counter()
+    layout = get_layout(layout)
+    new = np.asarray(updated_df["TotalDue"], dtype=np.int64)
+    prev = eft_file_df["TotalDue"].astype("Int64").to_numpy(dtype=np.int64, na_value=0)
+    matched = np.asarray(matched, dtype=bool)
+
+    sample = layout.format_frame(updated_df.head(sample_lines))
+    if duplicates is None:
+        duplicates = find_duplicates(updated_df)
+    eft_format = eft_format or EftFormat()
+    header_bytes = 0
+    if header_line is not None:
+        header_bytes = len(header_line.rstrip("\r\n").encode(eft_format.encoding)) + len(eft_format.newline)
+        header_bytes += len(codecs.BOM_UTF8) if eft_format.bom else 0
+
+    summary = {
+        "rows": len(new),
+        "matched": int(matched.sum()),
+        "unmatched": int((~matched).sum()),
+        "total_due_cents": int(new.sum()),
+        "prev_total_cents": int(prev.sum()),
+        "debits": int((new > 0).sum()),
+        "zeroed": int(((new == 0) & (prev > 0)).sum()),
+        "changed": int((new != prev).sum()),
+        "new_debits": int(((prev == 0) & (new > 0)).sum()),
+        "duplicate_groups": duplicates.blocking().group_count(),
+        "estimated_bytes": header_bytes + _estimate_bytes(updated_df, layout, eft_format),
+        "sample_lines": sample,
+    }
+    logging.info(f"Dry run of {len(new):,} records computed in {(time.perf_counter() - start) * 1000:.1f} ms")
+    return summary
+
+
+def format_dry_run(summary, sample=True):
+    """Render a dry run summary as plain text, with the sample lines unless sample is False"""
+    total = cents_to_rands(summary["total_due_cents"])
+    prev = cents_to_rands(summary["prev_total_cents"])
+    lines = [
+        "Dry run: no file was written",
+        f"  Records                 {summary['rows']:>14,}",
+        f"  Matched / unmatched     {summary['matched']:>14,} / {summary['unmatched']:,}",
+        f"  Total debit             {total:>14,.2f}",
+        f"  Previous month total    {prev:>14,.2f}",
+        f"  Difference              {total - prev:>+14,.2f}",
+        f"  Accounts debited        {summary['debits']:>14,}",
+        f"  Zeroed accounts         {summary['zeroed']:>14,}",
+        f"  Changed records         {summary['changed']:>14,}",
+        f"  New debits              {summary['new_debits']:>14,}",
+        f"  Duplicate debit groups  {summary['duplicate_groups']:>14,}",
+        f"  Estimated file size     {summary['estimated_bytes']:>14,} bytes",
+    ]
+    if sample and summary["sample_lines"]:
+        lines.append(f"First {len(summary['sample_lines'])} records:")
+        lines.extend(f"  {line}" for line in summary["sample_lines"])
+    return "\n".join(lines)
@@ -0,0 +1,137 @@
+"""Duplicate and collision detection for EFT records.
+
+Two kinds of collision groups are reported:
+
+    DUPLICATE_CODE   one SabreCode on several EFT lines; update_data gives every
+                     one of them the customer's billed amount
+    SHARED_ACCOUNT   one AccNumber/BranchCode pair under several SabreCodes, so
+                     the same bank account is debited for several customers
+
+Keys are interned through hash tables (pd.factorize), so finding every group
+is a single O(n) pass over the records. A group only blocks EFT generation
+when at least two of its lines would actually debit money.
+"""
+import numpy as np
+import pandas as pd
+
+from keys import intern_codes, normalize_codes
+from money import cents_to_rands
+from rollups import BRANCH_CODE_WIDTH
+
+# Collision kinds, stored as int8 in the table
+DUPLICATE_CODE = 0
+SHARED_ACCOUNT = 1
+
+DUPLICATE_KINDS = ["DUPLICATE_CODE", "SHARED_ACCOUNT"]
+
+RECORD_COLUMNS = ["SabreCode", "BranchCode", "AccNumber", "CompanyName", "TotalDue"]
+
+
+class DuplicateRecordsError(ValueError):
+    """EFT generation was blocked: the blocking Duplicates would debit an account more than once"""
+
+    def __init__(self, message, blocking):
+        super().__init__(message)
+        self.blocking = blocking
+
+
+class Duplicates:
+    """Collision groups held as parallel arrays, one entry per record in a group"""
+
+    def __init__(self, records, kind=None, group=None, row=None):
+        self.records = records
+        self.kind = np.asarray([] if kind is None else kind, dtype=np.int8)
+        self.group = np.asarray([] if group is None else group, dtype=np.int64)
+        self.row = np.asarray([] if row is None else row, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.row)
+
+    def take(self, positions):
+        """Return the entries at the given positions (or boolean mask)"""
+        return Duplicates(self.records, self.kind[positions], self.group[positions], self.row[positions])
+
+    def _group_ids(self):
+        """Dense ids of the (kind, group) pairs and the number of groups"""
+        ids, uniques = pd.factorize(self.group * len(DUPLICATE_KINDS) + self.kind)
+        return ids, len(uniques)
+
+    def group_count(self):
+        """Return the number of collision groups"""
+        return self._group_ids()[1]
+
+    def counts(self):
+        """Return the number of groups per kind name"""
+        starts = np.unique(self.group * len(DUPLICATE_KINDS) + self.kind) % len(DUPLICATE_KINDS)
+        counts = np.bincount(starts, minlength=len(DUPLICATE_KINDS))
+        return {name: int(count) for name, count in zip(DUPLICATE_KINDS, counts) if count}
+
+    def blocking(self):
+        """Return the groups in which more than one line would debit money"""
+        ids, count = self._group_ids()
+        amounts = self.records["TotalDue"].to_numpy(dtype=float, na_value=0)[self.row]
+        debits = np.bincount(ids, weights=amounts > 0, minlength=count)
+        return self.take(debits[ids] > 1)
+
+    def to_frame(self):
+        """Return one row per record in a collision group (amounts in Rands)"""
+        frame = self.records.iloc[self.row].reset_index(drop=True)
+        frame.insert(0, "Record", self.row + 1)
+        frame.insert(0, "Group", self._group_ids()[0] + 1)
+        frame.insert(0, "Kind", pd.Categorical.from_codes(self.kind, categories=DUPLICATE_KINDS))
+        frame["TotalDue"] = cents_to_rands(frame["TotalDue"].astype("Int64"))
+        return frame
+
+    def describe(self, limit=5):
+        """Return readable descriptions of the first few groups"""
+        lines = []
+        frame = self.to_frame()
+        for _, members in list(frame.groupby("Group", sort=True))[:limit]:
+            first = members.iloc[0]
+            records = ", ".join(str(record) for record in members["Record"])
+            if first["Kind"] == "DUPLICATE_CODE":
+                lines.append(f"SabreCode {first['SabreCode']} appears on records {records}")
+            else:
+                codes = ", ".join(members["SabreCode"].unique())
+                lines.append(f"Account {first['BranchCode']}/{first['AccNumber']} is used by SabreCodes {codes} "
+                             f"(records {records})")
+        return lines
+
+    def export(self, file_path):
+        """Write the collision groups to a .csv or .xlsx file"""
+        frame = self.to_frame()
+        if file_path.lower().endswith(".xlsx"):
+            frame.to_excel(file_path, index=False, sheet_name="Duplicates")
+        else:
+            frame.to_csv(file_path, index=False)
+
+
+def find_duplicates(eft_df):
+    """Find the collision groups in EFT records (as loaded, or updated with the new amounts)"""
+    records = eft_df[[name for name in RECORD_COLUMNS if name in eft_df.columns]]
+    (code_ids,), codes = intern_codes(records["SabreCode"])
+    has_code = (codes != "")[code_ids]
+    rows = np.arange(len(records))
+
+    # SabreCodes on more than one line
+    code_lines = np.bincount(code_ids[has_code], minlength=len(codes))
+    duplicate_code = has_code & (code_lines[code_ids] > 1)
+
+    # Bank accounts under more than one SabreCode: intern the pair, then count its distinct codes
+    account = records["AccNumber"].fillna("").astype(str).str.strip()
+    branch_ids, _ = pd.factorize(normalize_codes(records["BranchCode"], width=BRANCH_CODE_WIDTH))
+    account_ids, account_values = pd.factorize(account)
+    pair_ids, pairs = pd.factorize(branch_ids.astype(np.int64) * max(len(account_values), 1) + account_ids)
+    has_account = has_code & (account != "").to_numpy()
+
+    pair_codes, _ = pd.factorize(pair_ids[has_account].astype(np.int64) * len(codes) + code_ids[has_account])
+    pair_of_combo = np.zeros(int(pair_codes.max()) + 1 if len(pair_codes) else 0, dtype=np.int64)
+    pair_of_combo[pair_codes] = pair_ids[has_account]
+    codes_per_pair = np.bincount(pair_of_combo, minlength=len(pairs))
+    shared_account = has_account & (codes_per_pair[pair_ids] > 1)
+
+    kind = np.concatenate([np.full(duplicate_code.sum(), DUPLICATE_CODE), np.full(shared_account.sum(), SHARED_ACCOUNT)])
+    group = np.concatenate([code_ids[duplicate_code], pair_ids[shared_account]])
+    row = np.concatenate([rows[duplicate_code], rows[shared_account]])
+    order = np.lexsort((row, group, kind))
+    return Duplicates(records, kind[order], group[order], row[order])
@@ -0,0 +1,225 @@
+"""Byte-level reading of .eft files with encoding and line ending detection.
+
+Bank files come from different systems: UTF-8 (with or without a BOM) or a
+legacy Windows code page, and LF, CRLF or even CR line endings. The file is
+read as bytes and split on any line ending; the encoding and line ending are
+sniffed from the first block only. ASCII and single-byte encoded records stay
+bytes, so the layout can slice them as a byte matrix and only decode the
+field values that contain non-ASCII bytes. UTF-8 records with multi-byte
+characters are decoded line by line, since their byte offsets are not
+character offsets.
+
+The detected EftFormat is handed to the writer, so a new file keeps the
+encoding, BOM and line endings of the file it was made from.
+"""
+import codecs
+import logging
+
+# Bytes looked at to detect the encoding and line ending
+SNIFF_BYTES = 1 << 16
+
+# Bytes read at a time when an .eft file is read in batches
+READ_BLOCK = 1 << 20
+
+UTF8 = "utf-8"
+# Legacy exports are Windows-1252; latin-1 decodes any byte the code page leaves undefined
+FALLBACK_ENCODINGS = ["cp1252", "latin-1"]
+
+NEWLINES = ["\r\n", "\n", "\r"]
+
+
+class EftFormat:
+    """Encoding, BOM and line ending of an .eft file"""
+
+    def __init__(self, encoding=UTF8, newline="\n", bom=False):
+        if newline not in NEWLINES:
+            raise ValueError(f"Unsupported line ending {newline!r}")
+        self.encoding = encoding
+        self.newline = newline
+        self.bom = bom
+
+    def __repr__(self):
+        return f"EftFormat({self.encoding!r}, {self.newline!r}, bom={self.bom})"
+
+    def __eq__(self, other):
+        return isinstance(other, EftFormat) and \
+            (self.encoding, self.newline, self.bom) == (other.encoding, other.newline, other.bom)
+
+    def writer_options(self):
+        """Keyword arguments for AtomicEftWriter that reproduce this format"""
+        return {"encoding": self.encoding, "newline": self.newline, "bom": self.bom}
+
+
+def _is_utf8(head):
+    """True if head decodes as UTF-8 (a character cut off at the end of the block is allowed)"""
+    try:
+        codecs.getincrementaldecoder(UTF8)().decode(head, final=False)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def sniff(head):
+    """Detect the EftFormat from the first block of a file"""
+    bom = head.startswith(codecs.BOM_UTF8)
+    if bom:
+        head = head[len(codecs.BOM_UTF8):]
+
+    # The first line ending decides; a file without any is written with LF
+    newline = "\n"
+    cr, lf = head.find(b"\r"), head.find(b"\n")
+    if cr >= 0 and (lf < 0 or cr < lf):
+        newline = "\r\n" if lf == cr + 1 or cr == len(head) - 1 else "\r"
+
+    if bom or _is_utf8(head):
+        return EftFormat(UTF8, newline, bom)
+    for encoding in FALLBACK_ENCODINGS:
+        try:
+            head.decode(encoding)
+            return EftFormat(encoding, newline, bom)
+        except UnicodeDecodeError:
+            continue
+    return EftFormat(FALLBACK_ENCODINGS[-1], newline, bom)
+
+
+def sniff_file(file_path):
+    """Detect the EftFormat of a file from its first block"""
+    with open(file_path, "rb") as file:
+        return sniff(file.read(SNIFF_BYTES))
+
+
+def read_header(file_path):
+    """Return the EftFormat and the header line of a file, reading only its first block"""
+    with open(file_path, "rb") as file:
+        head = file.read(SNIFF_BYTES)
+    eft_format = sniff(head)
+    if eft_format.bom:
+        head = head[len(codecs.BOM_UTF8):]
+    lines = head.splitlines()
+    return eft_format, lines[0].decode(eft_format.encoding, errors="replace") if lines else ""
+
+
+class EftText:
+    """The lines of an .eft file.
+
+    header_line is text. lines holds the non-blank record lines (without line
+    endings) and line_numbers their 1-based line numbers in the file. The
+    lines are bytes in encoding when encoding is set (the file is ASCII or
+    single-byte encoded) and text otherwise.
+    """
+
+    def __init__(self, eft_format, header_line, lines, line_numbers, encoding=None):
+        self.format = eft_format
+        self.header_line = header_line
+        self.lines = lines
+        self.line_numbers = line_numbers
+        self.encoding = encoding
+
+    def decode_line(self, position):
+        """Return one record line as text"""
+        line = self.lines[position]
+        return line if self.encoding is None else line.decode(self.encoding, errors="replace")
+
+    def text_lines(self, mask):
+        """Return the record lines selected by mask as text and None for every other line"""
+        return [self.decode_line(position) if selected else None for position, selected in enumerate(mask)]
+
+
+def read_eft(file_path):
+    """Read an .eft file into an EftText.
+
+    Lines are split on LF, CRLF and CR alike and blank lines are skipped. If
+    the sniffed encoding is UTF-8 but a later part of the file is not, the
+    file is read with the legacy code page instead.
+    """
+    with open(file_path, "rb") as file:
+        data = file.read()
+    eft_format = sniff(data[:SNIFF_BYTES])
+    ascii_only = (data[len(codecs.BOM_UTF8):] if eft_format.bom else data).isascii()
+    lines = data.splitlines()
+    del data
+
+    header = lines[0] if lines else b""
+    if eft_format.bom:
+        header = header[len(codecs.BOM_UTF8):]
+
+    records = []
+    line_numbers = []
+    for line_num, line in enumerate(lines[1:], start=2):  # Skip header
+        if line.strip():
+            records.append(line)
+            line_numbers.append(line_num)
+    del lines
+
+    encoding = eft_format.encoding
+    if encoding == UTF8 and not ascii_only:
+        try:
+            records = [line.decode(UTF8) for line in records]
+            encoding = None
+        except UnicodeDecodeError as e:
+            logging.warning(f"{file_path} is not UTF-8 after all ({e}), reading it as {FALLBACK_ENCODINGS[0]}")
+            eft_format = EftFormat(FALLBACK_ENCODINGS[0], eft_format.newline, eft_format.bom)
+            encoding = eft_format.encoding
+
+    header_line = header.decode(eft_format.encoding, errors="replace")
+    logging.debug(f"Read {len(records):,} records from {file_path} as {eft_format}")
+    return EftText(eft_format, header_line, records, line_numbers, encoding)
+
+
+def _batch_text(eft_format, header_line, lines, line_numbers, file_path):
+    """Build the EftText of one batch, decoding it only if it is UTF-8 with non-ASCII bytes"""
+    if eft_format.encoding != UTF8 or all(line.isascii() for line in lines):
+        return EftText(eft_format, header_line, lines, line_numbers, eft_format.encoding)
+    try:
+        return EftText(eft_format, header_line, [line.decode(UTF8) for line in lines], line_numbers)
+    except UnicodeDecodeError as e:
+        # Earlier batches may already be written, so only this batch is read with the legacy code page
+        logging.warning(f"{file_path} is not UTF-8 near line {line_numbers[0]:,} ({e}), "
+                        f"reading that part as {FALLBACK_ENCODINGS[0]}")
+        return EftText(eft_format, header_line, [line.decode(FALLBACK_ENCODINGS[0], errors="replace")
+                                                 for line in lines], line_numbers)
+
+
+def read_eft_batches(file_path, batch_lines, block_size=READ_BLOCK):
+    """Read an .eft file in batches of up to batch_lines records, yielding an EftText per batch.
+
+    Only one block of the file and one batch of lines are held at a time. The
+    lines are split and blank lines skipped exactly as read_eft does. Every
+    batch carries the header line and the format sniffed from the first block.
+    """
+    with open(file_path, "rb") as file:
+        block = file.read(block_size)
+        eft_format = sniff(block[:SNIFF_BYTES])
+        if eft_format.bom:
+            block = block[len(codecs.BOM_UTF8):]
+        header_line = None
+        carry = b""
+        skip_lf = False  # A CR ended the previous block; an LF starting this one belongs to it
+        line_num = 0
+        batches = 0
+        lines = []
+        line_numbers = []
+        while block:
+            if skip_lf and block.startswith(b"\n"):
+                block = block[1:]
+            data = carry + block
+            block = file.read(block_size)
+            split = data.splitlines()
+            carry = b""
+            if block and split and not data.endswith((b"\n", b"\r")):
+                carry = split.pop()  # The last line continues in the next block
+            skip_lf = data.endswith(b"\r")
+            for line in split:
+                line_num += 1
+                if header_line is None:
+                    header_line = line.decode(eft_format.encoding, errors="replace")
+                elif line.strip():
+                    lines.append(line)
+                    line_numbers.append(line_num)
+            while len(lines) >= batch_lines:
+                yield _batch_text(eft_format, header_line, lines[:batch_lines], line_numbers[:batch_lines],
+                                  file_path)
+                del lines[:batch_lines], line_numbers[:batch_lines]
+                batches += 1
+        if lines or not batches:  # A file without records still yields its header
+            yield _batch_text(eft_format, header_line or "", lines, line_numbers, file_path)
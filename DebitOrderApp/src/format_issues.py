@@ -0,0 +1,216 @@
+"""Columnar index of per-row format issues found in .eft files.
+
+Each issue is one row of five parallel NumPy arrays: line number, field
+number (1-based, 0 for whole-line issues), issue code, expected value and
+actual value. Building the table costs a few array operations per file
+rather than one formatted string per issue, so it stays cheap even when
+most rows have issues.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# Issue codes, stored as int8 in the table
+MISALIGNED = 0      # Field starts at a different position than the header field
+TOO_LONG = 1        # Field is longer than the layout allows
+COLUMN_COUNT = 2    # Line has a different number of fields than most lines
+
+ISSUE_CODES = ["MISALIGNED", "TOO_LONG", "COLUMN_COUNT"]
+ISSUE_DESCRIPTIONS = {
+    "MISALIGNED": "Field starts at position {actual} but header field starts at {expected}",
+    "TOO_LONG": "Field is {actual} chars, expected at most {expected}",
+    "COLUMN_COUNT": "Line has {actual} fields, expected {expected}",
+}
+
+# Maximum field lengths of the April 2024 2.eft layout
+EXPECTED_FIELD_LENGTHS = [7, 1, 1, 6, 19, 20, 11, 15, 1]
+
+_NON_SPACE = re.compile(r"\S+")
+
+
+class FormatIssues:
+    """Table of format issues held as parallel arrays"""
+
+    def __init__(self, line=None, field=None, code=None, expected=None, actual=None):
+        self.line = np.asarray([] if line is None else line, dtype=np.int32)
+        self.field = np.asarray([] if field is None else field, dtype=np.int16)
+        self.code = np.asarray([] if code is None else code, dtype=np.int8)
+        self.expected = np.asarray([] if expected is None else expected, dtype=np.int32)
+        self.actual = np.asarray([] if actual is None else actual, dtype=np.int32)
+
+    def __len__(self):
+        return len(self.line)
+
+    @classmethod
+    def concat(cls, parts):
+        """Combine several issue tables, sorted by line and field"""
+        parts = [part for part in parts if len(part)]
+        if not parts:
+            return cls()
+        combined = cls(*(np.concatenate([getattr(part, name) for part in parts])
+                         for name in ("line", "field", "code", "expected", "actual")))
+        order = np.lexsort((combined.field, combined.line))
+        return combined.take(order)
+
+    def take(self, positions):
+        """Return the issues at the given positions (or boolean mask)"""
+        return FormatIssues(self.line[positions], self.field[positions], self.code[positions],
+                            self.expected[positions], self.actual[positions])
+
+    def query(self, code=None, line=None, field=None):
+        """Filter issues by code name, line number and/or field number"""
+        mask = np.ones(len(self), dtype=bool)
+        if code is not None:
+            mask &= self.code == ISSUE_CODES.index(code)
+        if line is not None:
+            mask &= self.line == line
+        if field is not None:
+            mask &= self.field == field
+        return self.take(mask)
+
+    def counts(self):
+        """Return the number of issues per code name"""
+        counts = np.bincount(self.code, minlength=len(ISSUE_CODES))
+        return {name: int(count) for name, count in zip(ISSUE_CODES, counts) if count}
+
+    def affected_lines(self):
+        """Return the number of distinct lines with at least one issue"""
+        return len(np.unique(self.line))
+
+    def to_frame(self):
+        """Return the issues as a DataFrame (issue codes as a categorical column)"""
+        return pd.DataFrame({
+            "Line": self.line,
+            "Field": self.field,
+            "Issue": pd.Categorical.from_codes(self.code, categories=ISSUE_CODES),
+            "Expected": self.expected,
+            "Actual": self.actual,
+        })
+
+    def describe(self, limit=5):
+        """Return readable descriptions of the first few issues"""
+        lines = []
+        for i in range(min(limit, len(self))):
+            name = ISSUE_CODES[self.code[i]]
+            detail = ISSUE_DESCRIPTIONS[name].format(expected=self.expected[i], actual=self.actual[i])
+            where = f"Line {self.line[i]}" + (f", field {self.field[i]}" if self.field[i] else "")
+            lines.append(f"{where}: {detail}")
+        return lines
+
+    def export(self, file_path):
+        """Write the issues to a .csv or .xlsx file"""
+        frame = self.to_frame()
+        if file_path.lower().endswith(".xlsx"):
+            frame.to_excel(file_path, index=False, sheet_name="Format Issues")
+        else:
+            frame.to_csv(file_path, index=False)
+
+
+def field_starts(line):
+    """Return the start positions of the space separated runs in a line"""
+    return [match.start() for match in _NON_SPACE.finditer(line)]
+
+
+def _flatten(per_line, line_numbers):
+    """Flatten a list of per-line lists into (values, line numbers, 1-based field numbers)"""
+    counts = np.fromiter((len(values) for values in per_line), dtype=np.int64, count=len(per_line))
+    values = np.fromiter((value for row in per_line for value in row), dtype=np.int64, count=int(counts.sum()))
+    lines = np.repeat(np.asarray(line_numbers, dtype=np.int32), counts)
+    offsets = np.repeat(np.cumsum(counts) - counts, counts)
+    fields = np.arange(len(values)) - offsets + 1
+    return values, lines, fields
+
+
+def alignment_issues(header_line, lines, line_numbers, clean=None, clean_starts=None):
+    """Find fields whose start position differs from the matching header field.
+
+    Lines flagged in clean are known to have their fields at clean_starts
+    (as checked by the record layout), so only the other lines are scanned.
+    """
+    header_positions = np.asarray(field_starts(header_line), dtype=np.int64)
+    if not len(lines) or not len(header_positions):
+        return FormatIssues()
+
+    line_numbers = np.asarray(line_numbers, dtype=np.int32)
+    clean = np.zeros(len(lines), dtype=bool) if clean is None else np.asarray(clean, dtype=bool)
+    scanned = [field_starts(line) for line, is_clean in zip(lines, clean) if not is_clean]
+    starts, issue_lines, fields = _flatten(scanned, line_numbers[~clean])
+
+    clean_count = int(clean.sum())
+    if clean_count:
+        template = np.asarray(clean_starts, dtype=np.int64)
+        starts = np.concatenate([starts, np.tile(template, clean_count)])
+        issue_lines = np.concatenate([issue_lines, np.repeat(line_numbers[clean], len(template))])
+        fields = np.concatenate([fields, np.tile(np.arange(1, len(template) + 1), clean_count)])
+
+    comparable = fields <= len(header_positions)
+    expected = np.zeros(len(starts), dtype=np.int64)
+    expected[comparable] = header_positions[fields[comparable] - 1]
+    mask = comparable & (starts != expected)
+    return FormatIssues(issue_lines[mask], fields[mask], np.full(mask.sum(), MISALIGNED),
+                        expected[mask], starts[mask])
+
+
+def length_issues(rows, line_numbers, expected_lengths=EXPECTED_FIELD_LENGTHS):
+    """Find fields longer than the layout allows, given the split fields of each row"""
+    if not len(rows):
+        return FormatIssues()
+
+    lengths, issue_lines, fields = _flatten([[len(field) for field in row] for row in rows], line_numbers)
+    limits = np.asarray(expected_lengths, dtype=np.int64)
+    comparable = fields <= len(limits)
+    expected = np.full(len(lengths), np.iinfo(np.int32).max, dtype=np.int64)
+    expected[comparable] = limits[fields[comparable] - 1]
+    mask = comparable & (lengths > expected)
+    return FormatIssues(issue_lines[mask], fields[mask], np.full(mask.sum(), TOO_LONG),
+                        expected[mask], lengths[mask])
+
+
+def column_count_issues(column_counts, line_numbers):
+    """Flag lines whose field count differs from the most common field count"""
+    column_counts = np.asarray(column_counts, dtype=np.int64)
+    if not len(column_counts):
+        return FormatIssues()
+
+    expected = np.bincount(column_counts).argmax()
+    mask = column_counts != expected
+    return FormatIssues(np.asarray(line_numbers, dtype=np.int32)[mask], np.zeros(mask.sum()),
+                        np.full(mask.sum(), COLUMN_COUNT), np.full(mask.sum(), expected), column_counts[mask])
+
+
+def collect_format_issues(header_line, lines, rows, line_numbers, expected_lengths=EXPECTED_FIELD_LENGTHS,
+                          clean=None, clean_starts=None):
+    """Collect every format issue of an .eft file.
+
+    lines are the raw data lines, rows their split fields and line_numbers
+    their 1-based line numbers in the file. Lines flagged in clean match the
+    record layout exactly (fields at clean_starts, none too long), so their
+    rows are not needed and may be None.
+    """
+    clean = np.zeros(len(lines), dtype=bool) if clean is None else np.asarray(clean, dtype=bool)
+    line_numbers = np.asarray(line_numbers, dtype=np.int32)
+    scanned = [row for row, is_clean in zip(rows, clean) if not is_clean]
+    column_counts = [len(clean_starts) if is_clean else len(row) for row, is_clean in zip(rows, clean)]
+    return FormatIssues.concat([
+        alignment_issues(header_line, lines, line_numbers, clean, clean_starts),
+        length_issues(scanned, line_numbers[~clean], expected_lengths),
+        column_count_issues(column_counts, line_numbers),
+    ])
+
+
+def width_issues(frame, widths):
+    """Find values in the first len(widths) columns of a frame that exceed the field widths.
+
+    Line numbers are 1-based row positions in the frame.
+    """
+    parts = []
+    row_numbers = np.arange(1, len(frame) + 1, dtype=np.int32)
+    for i, width in enumerate(widths[:frame.shape[1]]):
+        lengths = frame.iloc[:, i].astype(str).str.strip().str.len().to_numpy()
+        mask = lengths > width
+        if mask.any():
+            count = int(mask.sum())
+            parts.append(FormatIssues(row_numbers[mask], np.full(count, i + 1), np.full(count, TOO_LONG),
+                                      np.full(count, width), lengths[mask]))
+    return FormatIssues.concat(parts)
@@ -0,0 +1,113 @@
+"""Reconciliation gaps: the customers found on only one side of a bill run.
+
+EFT-only records are in the previous .eft file but not billed, so they are
+written with a TotalDue of 0. Billing-only codes are billed but have no EFT
+record (nor one from the customer master), so their amounts are in no .eft
+file at all: that is money the run would silently drop. Both directions come
+from one pass over the codes of both sides, interned against one dictionary
+(keys.intern_codes), with a presence flag per key, so finding them is linear
+in the number of records.
+"""
+import numpy as np
+import pandas as pd
+
+from keys import intern_codes
+from money import cents_to_rands
+
+EFT_ONLY = "EFT only"
+BILLING_ONLY = "Billing only"
+
+RECORD_COLUMNS = ["SabreCode", "BranchCode", "AccNumber", "CompanyName"]
+GAP_COLUMNS = ["Gap"] + RECORD_COLUMNS + ["TotalDue", "PrevMonthTotalDue"]
+
+
+class ReconciliationGaps:
+    """The EFT-only records and billing-only codes of a bill run (amounts in int64 cents).
+
+    eft_only holds the record columns and the previous TotalDue of each EFT
+    record without a billing record; billing_only holds the canonical
+    SabreCode and billed TotalDue of each billed customer without a record.
+    """
+
+    def __init__(self, eft_only, billing_only):
+        self.eft_only = eft_only.reset_index(drop=True)
+        self.billing_only = billing_only.reset_index(drop=True)
+
+    def eft_only_cents(self):
+        """Previous month total of the EFT-only records (missing amounts count as 0)"""
+        return int(self.eft_only["TotalDue"].astype("Int64").fillna(0).sum())
+
+    def billing_only_cents(self):
+        """Billed total that no record carries"""
+        return int(np.asarray(self.billing_only["TotalDue"], dtype=np.int64).sum())
+
+    def uncollected(self):
+        """The billing-only codes with a non-zero amount: money missing from the new .eft file"""
+        return self.billing_only[np.asarray(self.billing_only["TotalDue"], dtype=np.int64) != 0]
+
+    def summary(self):
+        """Counts and totals of both directions, for run summaries and logs"""
+        return {
+            "eft_only": len(self.eft_only),
+            "eft_only_cents": self.eft_only_cents(),
+            "billing_only": len(self.billing_only),
+            "billing_only_cents": self.billing_only_cents(),
+            "uncollected": len(self.uncollected()),
+        }
+
+    def frame(self):
+        """Both directions as one frame in Rands, with the Gap column naming the side each row is on"""
+        eft_only = self.eft_only[RECORD_COLUMNS].copy()
+        eft_only.insert(0, "Gap", EFT_ONLY)
+        eft_only["TotalDue"] = np.nan
+        eft_only["PrevMonthTotalDue"] = cents_to_rands(
+            self.eft_only["TotalDue"].astype("Int64").to_numpy(dtype=float, na_value=np.nan))
+
+        billing_only = pd.DataFrame({"Gap": BILLING_ONLY, "SabreCode": self.billing_only["SabreCode"].astype(str)})
+        for name in RECORD_COLUMNS[1:]:
+            billing_only[name] = ""
+        billing_only["TotalDue"] = cents_to_rands(np.asarray(self.billing_only["TotalDue"], dtype=np.int64))
+        billing_only["PrevMonthTotalDue"] = np.nan
+        return pd.concat([billing_only, eft_only], ignore_index=True)[GAP_COLUMNS]
+
+    def describe(self, limit=10):
+        """Return one line per billing-only code (largest amounts first), up to limit"""
+        billing_only = self.billing_only.sort_values("TotalDue", ascending=False, kind="stable").head(limit)
+        return [f"{code}: R {cents / 100:,.2f} billed, no EFT record"
+                for code, cents in zip(billing_only["SabreCode"], billing_only["TotalDue"])]
+
+
+def find_gaps(records, billing_df):
+    """Find the EFT-only records and the billing-only codes of a bill run.
+
+    records are the EFT records (after any customer master additions) with
+    their previous TotalDue, billing_df the consolidated bill run. Blank codes
+    never match, so a blank billed code is billing-only.
+    """
+    (record_ids, billing_ids), categories = intern_codes(records["SabreCode"], billing_df["SabreCode"])
+    blank = categories == ""
+    in_records = np.zeros(len(categories), dtype=bool)
+    in_billing = np.zeros(len(categories), dtype=bool)
+    in_records[record_ids] = True
+    in_billing[billing_ids] = True
+    in_records[blank] = in_billing[blank] = False
+
+    eft_only = records.loc[~in_billing[record_ids], RECORD_COLUMNS + ["TotalDue"]]
+    billing_mask = ~in_records[billing_ids]
+    billing_only = pd.DataFrame({
+        "SabreCode": categories[billing_ids[billing_mask]],
+        "TotalDue": np.asarray(billing_df["TotalDue"], dtype=np.int64)[billing_mask],
+    })
+    return ReconciliationGaps(eft_only, billing_only)
+
+
+def format_gaps(gaps, limit=10):
+    """Render the gaps of a bill run for the console"""
+    lines = [
+        f"{len(gaps.eft_only):,} EFT records without a billing record "
+        f"(previously R {gaps.eft_only_cents() / 100:,.2f}, now debited 0)",
+        f"{len(gaps.billing_only):,} billed customers without an EFT record "
+        f"(R {gaps.billing_only_cents() / 100:,.2f} not collected)",
+    ]
+    lines.extend(f"  {description}" for description in gaps.describe(limit))
+    return "\n".join(lines)
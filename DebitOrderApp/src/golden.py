@@ -0,0 +1,115 @@
+"""Golden-file comparison of generated .eft and .xlsx outputs.
+
+Files are compared as byte streams in large blocks, so checking a
+million-record .eft file against its golden copy is a few block compares
+that run at memory speed. Only when two blocks differ is the first differing
+byte located and turned into a line number and the two lines at that point.
+An .xlsx file is a zip archive whose entry timestamps change from run to run,
+so workbooks are compared member by member on their uncompressed contents.
+"""
+import hashlib
+import zipfile
+
+import numpy as np
+
+# Bytes compared per block
+CHUNK_SIZE = 1 << 20
+
+# Longest line fragment kept from the previous block to show a difference in context
+MAX_LINE_CONTEXT = 4096
+
+
+class Difference:
+    """The first point at which two byte streams differ"""
+
+    def __init__(self, offset, line, expected, actual, name=""):
+        self.offset = offset
+        self.line = line
+        self.expected = expected
+        self.actual = actual
+        self.name = name
+
+    def describe(self):
+        where = f"{self.name}: " if self.name else ""
+        return (f"{where}first difference at byte {self.offset:,} (line {self.line:,})\n"
+                f"  expected: {self.expected!r}\n"
+                f"  actual:   {self.actual!r}")
+
+
+def _line_at(tail, block, position):
+    """Return the line of block (preceded by the previous block's tail) that contains position"""
+    data = tail + block
+    position += len(tail)
+    start = data.rfind(b"\n", 0, position) + 1
+    end = data.find(b"\n", position)
+    return data[start:len(data) if end < 0 else end].rstrip(b"\r")
+
+
+def compare_streams(expected, actual, chunk_size=CHUNK_SIZE, name=""):
+    """Compare two binary file objects, returning the first Difference or None if they are identical"""
+    offset = 0
+    lines = 0
+    tail = b""  # Start of the current line, from the blocks already compared (they are identical)
+    while True:
+        expected_block = expected.read(chunk_size)
+        actual_block = actual.read(chunk_size)
+        if expected_block == actual_block:
+            if not expected_block:
+                return None
+        else:
+            length = min(len(expected_block), len(actual_block))
+            unequal = np.frombuffer(expected_block, np.uint8, length) != np.frombuffer(actual_block, np.uint8, length)
+            position = int(unequal.argmax()) if unequal.any() else length  # Otherwise one stream ended early
+            return Difference(offset + position, lines + expected_block.count(b"\n", 0, position) + 1,
+                              _line_at(tail, expected_block, position), _line_at(tail, actual_block, position), name)
+
+        offset += len(expected_block)
+        lines += expected_block.count(b"\n")
+        last_line = expected_block.rfind(b"\n")
+        tail = (tail + expected_block if last_line < 0 else expected_block[last_line + 1:])[-MAX_LINE_CONTEXT:]
+
+
+def compare_files(expected_path, actual_path, chunk_size=CHUNK_SIZE):
+    """Compare two files byte for byte, returning the first Difference or None"""
+    with open(expected_path, "rb") as expected, open(actual_path, "rb") as actual:
+        return compare_streams(expected, actual, chunk_size)
+
+
+def compare_xlsx(expected_path, actual_path, chunk_size=CHUNK_SIZE):
+    """Compare two workbooks member by member, returning a list of Differences (empty if identical)"""
+    differences = []
+    with zipfile.ZipFile(expected_path) as expected_zip, zipfile.ZipFile(actual_path) as actual_zip:
+        expected_names = set(expected_zip.namelist())
+        actual_names = set(actual_zip.namelist())
+        for name in sorted(expected_names ^ actual_names):
+            presence = {True: "present", False: "missing"}
+            differences.append(Difference(0, 0, presence[name in expected_names], presence[name in actual_names], name))
+        for name in sorted(expected_names & actual_names):
+            with expected_zip.open(name) as expected, actual_zip.open(name) as actual:
+                difference = compare_streams(expected, actual, chunk_size, name)
+            if difference is not None:
+                differences.append(difference)
+    return differences
+
+
+def compare_outputs(expected_path, actual_path, chunk_size=CHUNK_SIZE):
+    """Compare two outputs of the same kind (.xlsx by member, anything else by bytes); returns a list of Differences"""
+    if expected_path.lower().endswith(".xlsx"):
+        return compare_xlsx(expected_path, actual_path, chunk_size)
+    difference = compare_files(expected_path, actual_path, chunk_size)
+    return [] if difference is None else [difference]
+
+
+def file_digest(file_path, chunk_size=CHUNK_SIZE):
+    """Return the SHA-256 hex digest, size in bytes and line count of a file, read in blocks"""
+    digest = hashlib.sha256()
+    size = lines = 0
+    with open(file_path, "rb") as file:
+        while True:
+            block = file.read(chunk_size)
+            if not block:
+                break
+            digest.update(block)
+            size += len(block)
+            lines += block.count(b"\n")
+    return digest.hexdigest(), size, lines
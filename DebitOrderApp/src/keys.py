@@ -0,0 +1,69 @@
+"""Canonical SabreCode keys shared by the billing and EFT sides.
+
+Codes arrive as integers from the bill run CSV, as padded text from the .eft
+file and sometimes with stray whitespace or a float suffix. Every join goes
+through normalize_codes so both sides agree, and through intern_codes so the
+join itself runs on int32 ids instead of Python strings.
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+# SabreCodes are zero padded to this width
+CODE_WIDTH = 7
+
+
+def normalize_codes(values, width=CODE_WIDTH):
+    """Return the canonical text form of SabreCodes (or other codes): trimmed, upper case and zero padded"""
+    codes = pd.Series(values, copy=False).astype(object).fillna("").astype(str).str.strip().str.upper()
+    codes = codes.str.replace(r"\.0+$", "", regex=True)  # 1234.0 read from a CSV with blanks
+    codes = codes.where(~codes.isin(["", "NAN", "NONE", "<NA>"]), "")
+    return codes.str.zfill(width).where(codes != "", "")
+
+
+def normalize_code(code):
+    """Scalar version of normalize_codes for single lookups"""
+    if code is None or (isinstance(code, float) and np.isnan(code)):
+        return ""
+    text = re.sub(r"\.0+$", "", str(code).strip().upper())
+    return "" if text in ("", "NAN", "NONE", "<NA>") else text.zfill(CODE_WIDTH)
+
+
+def intern_codes(*columns):
+    """Normalize each column and intern them all against one shared dictionary.
+
+    Returns a list of int32 id arrays (one per column, in order) and the
+    dictionary of canonical codes, so that ids[i][j] == ids[k][l] exactly
+    when the two codes normalize to the same key.
+    """
+    normalized = [normalize_codes(column) for column in columns]
+    ids, categories = pd.factorize(pd.concat(normalized, ignore_index=True), sort=False)
+    ids = ids.astype(np.int32)
+    bounds = np.cumsum([0] + [len(column) for column in normalized])
+    return [ids[start:end] for start, end in zip(bounds[:-1], bounds[1:])], np.asarray(categories)
+
+
+def sum_by_key(codes, amounts):
+    """Sum int64 amounts per canonical code, returning (codes, sums) in first-seen order"""
+    (ids,), categories = intern_codes(codes)
+    # Float weights are exact for any realistic cent total (below 2**53)
+    sums = np.bincount(ids, weights=np.asarray(amounts, dtype=np.float64), minlength=len(categories))
+    return categories, np.rint(sums).astype(np.int64)
+
+
+def join_amounts(target_codes, source_codes, source_amounts, fill=0):
+    """Look up source_amounts for each target code on interned keys.
+
+    Returns the looked up int64 amounts (fill where there is no match) and
+    the boolean match mask. If a key occurs more than once in the source the
+    last amount wins.
+    """
+    (target_ids, source_ids), categories = intern_codes(target_codes, source_codes)
+    amounts_by_id = np.full(len(categories), fill, dtype=np.int64)
+    present = np.zeros(len(categories), dtype=bool)
+    amounts_by_id[source_ids] = np.asarray(source_amounts, dtype=np.int64)
+    present[source_ids] = True
+    present[categories == ""] = False  # Blank codes never match
+    matched = present[target_ids]
+    return np.where(matched, amounts_by_id[target_ids], fill), matched
@@ -0,0 +1,278 @@
+"""Record layouts of the bank EFT formats, declared as data.
+
+Each layout lives in DebitOrderApp/resources/layouts/<name>.json and lists its
+fields in order: name, width and optionally an explicit offset, alignment
+("left" or "right"), pad character, default value for records that lack the
+field, and type ("text" or "cents" for zero padded amounts). Fields are
+separated by the layout's separator unless offsets say otherwise. The last
+field is not padded unless "pad_last_field" is set.
+
+A layout is compiled once (and cached) into a slice table for parsing and a
+format string for writing. Parsing slices whole columns of correctly aligned
+lines at once and only falls back to splitting on double spaces for lines
+that do not fit the layout.
+"""
+import functools
+import glob
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+from money import parse_eft_cents
+
+LAYOUT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "layouts")
+DEFAULT_LAYOUT = "sabre_standard"
+
+TEXT = "text"
+CENTS = "cents"
+
+# Lines sliced at a time, bounding the size of the character matrix
+PARSE_CHUNK_LINES = 50_000
+
+
+def split_eft_line(line):
+    """Split one .eft record into its fields (fields are separated by double spaces)"""
+    return [item.strip() for item in line.strip().split('  ') if item.strip()]
+
+
+def _decode_chunk(lines, width, encoding):
+    """Decode a chunk of single-byte encoded lines into a text array of the given width.
+
+    ASCII lines are converted in one array cast; only lines with other bytes
+    are decoded one by one (each byte is still one character).
+    """
+    raw = np.asarray(lines, dtype=f"S{width}").reshape(len(lines))
+    non_ascii = (raw.view(np.uint8).reshape(len(lines), width) >= 0x80).any(axis=1) if width else \
+        np.zeros(len(lines), dtype=bool)
+    if not non_ascii.any():
+        return raw.astype(f"U{width}")
+    text = np.empty(len(lines), dtype=f"U{width}")
+    text[~non_ascii] = raw[~non_ascii].astype(f"U{width}")
+    text[non_ascii] = [line.decode(encoding, errors="replace") for line in raw[non_ascii]]
+    return text
+
+
+class ParsedRecords:
+    """Records parsed with a layout.
+
+    frame holds one row per line, clean flags the lines that match the layout
+    exactly, aligned the lines whose fields sit at the layout's offsets and
+    rows holds the split fields of every other line (None for clean lines).
+    """
+
+    def __init__(self, frame, clean, rows, aligned=None):
+        self.frame = frame
+        self.clean = clean
+        self.rows = rows
+        self.aligned = clean if aligned is None else aligned
+
+    def column_counts(self, field_count):
+        """Number of fields found on each line"""
+        return [field_count if row is None else len(row) for row in self.rows]
+
+
+class RecordLayout:
+    """A compiled fixed-width record layout"""
+
+    def __init__(self, name, fields, separator="  ", description="", pad_last_field=False):
+        self.name = name
+        self.description = description
+        self.separator = separator
+        self.pad_last_field = pad_last_field
+
+        self.names = [field["name"] for field in fields]
+        self.widths = [int(field["width"]) for field in fields]
+        self.types = [field.get("type", TEXT) for field in fields]
+        self.aligns = [field.get("align", "right" if field.get("type") == CENTS else "left") for field in fields]
+        self.pads = [field.get("pad", " ") for field in fields]
+        self.defaults = [field.get("default", "") for field in fields]
+
+        starts = []
+        position = 0
+        for field, width in zip(fields, self.widths):
+            position = int(field.get("offset", position))
+            starts.append(position)
+            position += width + len(separator)
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.ends = self.starts + np.asarray(self.widths, dtype=np.int64)
+        self.record_length = int(self.ends[-1])
+        self.gaps = [(int(end), int(start)) for end, start in zip(self.ends[:-1], self.starts[1:])]
+        if any(end > start for end, start in self.gaps):
+            raise ValueError(f"Fields of layout '{name}' overlap")
+
+        # Slice table for parsing and format string for writing, built once per layout
+        self.slices = [slice(int(start), int(end)) for start, end in zip(self.starts, self.ends)]
+        self.template = self._compile_template()
+
+        # Lines that split on double spaces exactly like the layout slices them
+        self._splits_cleanly = all(start - end >= 2 for end, start in self.gaps)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], data["fields"], separator=data.get("separator", "  "),
+                   description=data.get("description", ""), pad_last_field=data.get("pad_last_field", False))
+
+    def _compile_template(self):
+        parts = []
+        for i, (width, align, pad) in enumerate(zip(self.widths, self.aligns, self.pads)):
+            if i:
+                parts.append(" " * (self.gaps[i - 1][1] - self.gaps[i - 1][0]))
+            if i == len(self.widths) - 1 and not self.pad_last_field:
+                parts.append(f"{{{i}}}")
+            else:
+                parts.append(f"{{{i}:{pad}{'>' if align == 'right' else '<'}{width}}}")
+        return "".join(parts)
+
+    def column_headings(self, count):
+        """Column names for records with count fields"""
+        return [self.names[i] if i < len(self.names) else f"Column {i + 1}" for i in range(count)]
+
+    def _field_text(self, i, value):
+        if self.types[i] == CENTS:
+            # Missing amounts are written as zero
+            return f"{0 if value is None or pd.isna(value) else int(value):0{self.widths[i]}d}"
+        return str(value).strip()
+
+    def format_record(self, values):
+        """Format one record (a sequence of field values in layout order)"""
+        fields = [self._field_text(i, values[i]) if i < len(values) else self.defaults[i]
+                  for i in range(len(self.names))]
+        return self.template.format(*fields)
+
+    def format_frame(self, frame):
+        """Format every row of a frame (columns in layout order) into record lines at once"""
+        lines = None
+        for i, (width, align, pad) in enumerate(zip(self.widths, self.aligns, self.pads)):
+            if i < frame.shape[1]:
+                column = frame.iloc[:, i]
+                if self.types[i] == CENTS:
+                    cents = pd.Series(column, copy=False).astype("Int64").fillna(0).astype(np.int64)
+                    text = cents.astype(str).str.zfill(width)
+                else:
+                    text = column.fillna("").astype(str).str.strip()
+            else:
+                text = pd.Series(self.defaults[i], index=frame.index, dtype=object)
+
+            if i < len(self.widths) - 1 or self.pad_last_field:
+                text = text.str.rjust(width, pad) if align == "right" else text.str.ljust(width, pad)
+            if lines is None:
+                lines = text
+            else:
+                gap = self.gaps[i - 1]
+                lines = lines + " " * (gap[1] - gap[0]) + text
+        return [] if lines is None else lines.tolist()
+
+    def _slice_chunk(self, lines, encoding=None):
+        """Slice a chunk of lines as a character matrix.
+
+        Lines are text, or bytes in a single-byte encoding (see _decode_chunk).
+        Returns the aligned and clean masks and the stripped text of every
+        field (only meaningful for aligned lines).
+        """
+        count = len(lines)
+        length = np.fromiter(map(len, lines), dtype=np.int64, count=count)
+        # Longer lines are truncated here, but they are never aligned
+        if encoding is None:
+            text = np.asarray(lines, dtype=f"U{self.record_length}").reshape(count)
+        else:
+            text = _decode_chunk(lines, self.record_length, encoding)
+        chars = text.view(np.uint32).reshape(count, self.record_length)
+
+        # Aligned: the line fits the layout and every gap between fields is blank
+        if self.pad_last_field:
+            aligned = length == self.record_length
+        else:
+            aligned = (length > self.starts[-1]) & (length <= self.record_length)
+        for end, start in self.gaps:
+            aligned &= (chars[:, end:start] == ord(" ")).all(axis=1)
+
+        # Clean: aligned, and splitting on double spaces would give exactly the same fields
+        clean = aligned.copy() if self._splits_cleanly else np.zeros(count, dtype=bool)
+        values = []
+        for field_slice, width in zip(self.slices, self.widths):
+            raw = np.ascontiguousarray(chars[:, field_slice]).view(f"U{width}").reshape(count)
+            value = np.char.strip(raw)
+            raw_length = np.char.str_len(raw)
+            clean &= (raw_length > 0) & (np.char.str_len(np.char.lstrip(raw)) == raw_length)
+            clean &= np.char.find(value, "  ") < 0
+            values.append(value)
+        return aligned, clean, values
+
+    def parse_lines(self, lines, encoding=None):
+        """Parse raw record lines (without line endings) into a ParsedRecords.
+
+        With encoding, the lines are bytes in that single-byte encoding (or
+        ASCII); only lines with non-ASCII bytes are decoded one by one.
+        """
+        lines = list(lines)
+        count = len(lines)
+        chunks = []
+        for start in range(0, count, PARSE_CHUNK_LINES):
+            aligned, clean, values = self._slice_chunk(lines[start:start + PARSE_CHUNK_LINES], encoding)
+            # Fixed width text takes 4 bytes per character of field width, so it never outlives its chunk
+            chunks.append((aligned, clean, [value.astype(object) for value in values]))
+        if chunks:
+            aligned = np.concatenate([chunk[0] for chunk in chunks])
+            clean = np.concatenate([chunk[1] for chunk in chunks])
+            values = [np.concatenate([chunk[2][i] for chunk in chunks]) for i in range(len(self.names))]
+            del chunks
+        else:
+            aligned = clean = np.zeros(0, dtype=bool)
+            values = [np.zeros(0, dtype=object) for _ in self.names]
+
+        rows = [None] * count
+        for position in np.flatnonzero(~clean):
+            line = lines[position]
+            if encoding is not None:
+                line = line.decode(encoding, errors="replace")
+            rows[position] = split_eft_line(line)
+
+        fallback = np.flatnonzero(~aligned)
+        max_columns = max([len(self.names)] + [len(rows[position]) for position in fallback])
+        columns = {}
+        for i, name in enumerate(self.column_headings(max_columns)):
+            column = np.full(count, "", dtype=object)
+            if i < len(self.names):
+                column[aligned] = values[i][aligned]
+            for position in fallback:
+                row = rows[position]
+                column[position] = row[i] if i < len(row) else ""
+            columns[name] = column
+
+        frame = pd.DataFrame(columns)
+        for name, field_type in zip(self.names, self.types):
+            if field_type == CENTS:
+                frame[name] = parse_eft_cents(frame[name])
+        return ParsedRecords(frame, clean, rows, aligned)
+
+    def fits(self, line):
+        """True if a single line is aligned to the layout"""
+        if self.pad_last_field:
+            fits = len(line) == self.record_length
+        else:
+            fits = self.starts[-1] < len(line) <= self.record_length
+        return fits and all(not line[end:start].strip() for end, start in self.gaps)
+
+    def parse_line(self, line):
+        """Parse one record into a dict of field name to text"""
+        line = line.rstrip("\r\n")
+        fields = [line[s].strip() for s in self.slices] if self.fits(line) else split_eft_line(line)
+        return dict(zip(self.column_headings(len(fields)), fields))
+
+
+def available_layouts(layout_dir=LAYOUT_DIR):
+    """Return the names of the layouts in layout_dir"""
+    return sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(layout_dir, "*.json")))
+
+
+@functools.lru_cache(maxsize=None)
+def get_layout(name=DEFAULT_LAYOUT, layout_dir=LAYOUT_DIR):
+    """Return the compiled layout with this name (or the layout in this .json file)"""
+    path = name if name.lower().endswith(".json") else os.path.join(layout_dir, f"{name}.json")
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown EFT layout '{name}', available: {', '.join(available_layouts(layout_dir))}")
+    with open(path, encoding="utf-8") as file:
+        return RecordLayout.from_dict(json.load(file))
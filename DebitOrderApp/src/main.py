@@ -1,16 +1,25 @@
 import sys
 from PyQt5.QtWidgets import (QApplication, QMainWindow, QWidget, QVBoxLayout, 
                             QPushButton, QLabel, QFileDialog, QMessageBox,
-                            QProgressBar, QHBoxLayout)
+                            QProgressBar, QHBoxLayout, QInputDialog, QLineEdit)
 from PyQt5.QtCore import Qt, QSize
 from PyQt5.QtGui import QIcon, QPixmap
 import pandas as pd
-import sqlite3
 import os
 import re
-import openpyxl
-from openpyxl.styles import Font, PatternFill
-from openpyxl.styles.numbers import FORMAT_NUMBER_00
+import logging
+import eft_io
+import processing
+import run_registry
+import snapshot
+import trends
+from analytics import movers_report, format_movers_report
+from customer_master import CustomerMaster
+from policy import parse_period
+from dry_run import format_dry_run
+from results_view import ResultsDialog, FormatIssuesDialog
+from session import Session
+from watcher import period_from_name
 
 class DebitOrderApp(QMainWindow):
     def __init__(self):
@@ -28,10 +37,16 @@ class DebitOrderApp(QMainWindow):
             }
         """)
         
-        # Initialize dataframes
-        self.eft_file_df = None
-        self.billing_df = None 
-        self.updated_df = None
+        # One session holds the loaded records, the bill run and the reconciliation
+        self.session = Session()
+        self.history = None
+        self.history_dir = None
+        self.registry = None
+        self.csv_path = None
+        self.eft_path = None
+        self.duplicates = None
+        self.results_dialog = None
+        self.issues_dialog = None
         
         # Create main widget and layout
         self.main_widget = QWidget()
@@ -77,6 +92,20 @@ class DebitOrderApp(QMainWindow):
         file_layout = QVBoxLayout()
         file_section.setLayout(file_layout)
         
+        # Billing period of the run: picks the VAT and rounding rule and the registry lock
+        period_group = QWidget()
+        period_layout = QHBoxLayout()
+        period_group.setLayout(period_layout)
+        
+        self.period_edit = QLineEdit()
+        self.period_edit.setPlaceholderText("YYYY-MM (from the file name, else this month)")
+        self.period_edit.setMaximumWidth(300)
+        self.period_edit.editingFinished.connect(self.change_period)
+        
+        period_layout.addWidget(QLabel("Billing Period"))
+        period_layout.addWidget(self.period_edit)
+        period_layout.addStretch()
+        
         # CSV File Loading
         csv_group = QWidget()
         csv_layout = QHBoxLayout()
@@ -137,14 +166,68 @@ class DebitOrderApp(QMainWindow):
         self.eft_status = QLabel("Not loaded")
         self.eft_status.setStyleSheet("color: #f44336;")
         
+        self.issues_button = QPushButton("Format Issues")
+        self.issues_button.clicked.connect(self.show_format_issues)
+        self.issues_button.setEnabled(False)  # Enabled when the loaded EFT has issues
+        
         eft_layout.addWidget(self.eft_button)
         eft_layout.addWidget(self.eft_status)
         eft_layout.addStretch()
+        eft_layout.addWidget(self.issues_button)
+        
+        # Archive of past runs for the multi-month trends (optional)
+        history_group = QWidget()
+        history_layout = QHBoxLayout()
+        history_group.setLayout(history_layout)
+        
+        self.history_button = QPushButton("Load History")
+        self.history_button.clicked.connect(self.load_history)
+        
+        self.history_status = QLabel("Not loaded (optional)")
+        self.history_status.setStyleSheet("color: #757575;")
+        
+        history_layout.addWidget(self.history_button)
+        history_layout.addWidget(self.history_status)
+        history_layout.addStretch()
+        
+        # Customer master with the banking details of customers missing from the EFT file (optional)
+        master_group = QWidget()
+        master_layout = QHBoxLayout()
+        master_group.setLayout(master_layout)
+        
+        self.master_button = QPushButton("Customer Master")
+        self.master_button.clicked.connect(self.open_customer_master)
+        
+        self.master_status = QLabel("Not loaded (optional)")
+        self.master_status.setStyleSheet("color: #757575;")
+        
+        master_layout.addWidget(self.master_button)
+        master_layout.addWidget(self.master_status)
+        master_layout.addStretch()
+        
+        # Shared run registry that keeps two operators from creating files for the same month (optional)
+        registry_group = QWidget()
+        registry_layout = QHBoxLayout()
+        registry_group.setLayout(registry_layout)
+        
+        self.registry_button = QPushButton("Run Registry")
+        self.registry_button.clicked.connect(self.open_run_registry)
+        
+        self.registry_status = QLabel("Not loaded (optional)")
+        self.registry_status.setStyleSheet("color: #757575;")
+        
+        registry_layout.addWidget(self.registry_button)
+        registry_layout.addWidget(self.registry_status)
+        registry_layout.addStretch()
         
         # Add to main layout
         file_layout.addWidget(QLabel("<b>File Loading</b>"))
+        file_layout.addWidget(period_group)
         file_layout.addWidget(csv_group)
         file_layout.addWidget(eft_group)
+        file_layout.addWidget(history_group)
+        file_layout.addWidget(master_group)
+        file_layout.addWidget(registry_group)
         self.layout.addWidget(file_section)
         
     def add_processing_section(self):
@@ -178,10 +261,52 @@ class DebitOrderApp(QMainWindow):
         self.update_status = QLabel("Not processed")
         self.update_status.setStyleSheet("color: #f44336;")
         
+        # Dry Run button
+        self.dry_run_button = QPushButton("Dry Run")
+        self.dry_run_button.setStyleSheet("""
+            QPushButton {
+                background-color: #607D8B;
+                color: white;
+                border: none;
+                padding: 8px 16px;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background-color: #455A64;
+            }
+            QPushButton:disabled {
+                background-color: #CFD8DC;
+            }
+        """)
+        self.dry_run_button.clicked.connect(self.dry_run)
+        self.dry_run_button.setEnabled(False)  # Disabled until files are loaded
+        
+        # View Results button
+        self.view_results_button = QPushButton("View Results")
+        self.view_results_button.setStyleSheet("""
+            QPushButton {
+                background-color: #607D8B;
+                color: white;
+                border: none;
+                padding: 8px 16px;
+                font-size: 14px;
+            }
+            QPushButton:hover {
+                background-color: #455A64;
+            }
+            QPushButton:disabled {
+                background-color: #CFD8DC;
+            }
+        """)
+        self.view_results_button.clicked.connect(self.show_results)
+        self.view_results_button.setEnabled(False)  # Disabled until data is updated
+        
         # Add to layout
         process_layout.addWidget(QLabel("<b>Data Processing</b>"))
         process_layout.addWidget(self.update_button)
         process_layout.addWidget(self.update_status)
+        process_layout.addWidget(self.dry_run_button)
+        process_layout.addWidget(self.view_results_button)
         
         self.layout.addWidget(process_section)
         
@@ -265,18 +390,6 @@ class DebitOrderApp(QMainWindow):
         self.layout.addWidget(export_section)
         
     # Core functionality methods from original app
-    def round_amount(self, amount):
-        """Round amount according to business rules"""
-        amount = int(amount)
-        last_digit = amount % 10
-        
-        if last_digit in {4, 14, 24, 34, 44, 54, 64, 74, 84, 94}:
-            amount = (amount // 10) * 10 + 5
-        elif last_digit in {9, 19, 29, 39, 49, 59, 69, 79, 89, 99}:
-            amount = (amount // 10) * 10 + 10
-            
-        return f"{amount:011d}"
-        
     def load_csv_file(self):
         """Load and process CSV file"""
         try:
@@ -287,40 +400,22 @@ class DebitOrderApp(QMainWindow):
             
             if not file_path:
                 return
+            # The bill run is loaded next, so the one loaded before needs no reload for the new period
+            self.apply_period(file_path, reload_billing=False)
+            if not self.registry_allows_processing():
+                return
                 
             # Show loading state
             self.csv_status.setText("Loading...")
             self.csv_status.setStyleSheet("color: #FF9800;")
             QApplication.processEvents()
             
-            # Check if file has a sep=, line at the beginning
-            with open(file_path, 'r', encoding='utf-8') as f:
-                first_line = f.readline().strip()
-                
-            # Load the CSV into a DataFrame
-            if (first_line.startswith('sep=')):
-                # Skip the first line if it's a separator definition
-                self.billing_df = pd.read_csv(file_path, skiprows=1)
-            else:
-                self.billing_df = pd.read_csv(file_path)
-            
-            print("CSV columns found:", self.billing_df.columns.tolist())
-                
-            # Check if the DataFrame contains CustomerCode instead of SabreCode
-            if 'CustomerCode' in self.billing_df.columns:
-                # Rename CustomerCode to SabreCode for consistency
-                self.billing_df.rename(columns={'CustomerCode': 'SabreCode'}, inplace=True)
-                print("Renamed 'CustomerCode' column to 'SabreCode'")
-                
-            # Verify SabreCode column exists
-            if 'SabreCode' not in self.billing_df.columns:
-                raise ValueError("Required column 'SabreCode' or 'CustomerCode' not found in CSV file")
+            # Load, consolidate and apply VAT and rounding
+            self.session.load_billing(file_path)
+            self.csv_path = file_path
+            self.enable_export_buttons(False)
             
-            # Process the data
-            self.billing_df = self.billing_df.groupby('SabreCode', as_index=False)['TotalDue'].sum()
-            self.billing_df['SabreCode'] = self.billing_df['SabreCode'].apply(lambda x: f"{str(x).zfill(7)}")
-            self.billing_df['TotalDue'] = self.billing_df['TotalDue'] * 1.15 * 100
-            self.billing_df['TotalDue'] = self.billing_df['TotalDue'].apply(self.round_amount)
+            self.save_snapshot()
             
             # Update status
             self.csv_status.setText("Loaded")
@@ -328,8 +423,9 @@ class DebitOrderApp(QMainWindow):
             self.statusBar().showMessage(f"CSV loaded: {os.path.basename(file_path)}", 5000)
             
             # Enable update button if EFT file is also loaded
-            if self.eft_file_df is not None:
+            if self.session.has_records:
                 self.update_button.setEnabled(True)
+                self.dry_run_button.setEnabled(True)
             
             QMessageBox.information(self, "Success", "CSV data imported successfully!")
             
@@ -348,6 +444,9 @@ class DebitOrderApp(QMainWindow):
             
             if not file_path:
                 return
+            self.apply_period(file_path)
+            if not self.registry_allows_processing():
+                return
                 
             # Show loading state
             self.eft_status.setText("Loading...")
@@ -355,38 +454,12 @@ class DebitOrderApp(QMainWindow):
             QApplication.processEvents()
             
             # Process EFT file
-            with open(file_path, 'r', encoding='utf-8') as file:
-                lines = file.readlines()
-
-            data_lines = lines[1:]  # Skip header
-            processed_data = []
-            column_counts = set()
-            max_columns = 0
-
-            for line in data_lines:
-                line = line.strip()
-                if not line:
-                    continue
-                split_line = [item.strip() for item in line.split('  ') if item.strip()]
-                processed_data.append(split_line)
-                column_counts.add(len(split_line))
-                max_columns = max(max_columns, len(split_line))
-
-            # Normalize rows
-            for row in processed_data:
-                if len(row) < max_columns:
-                    row.extend([''] * (max_columns - len(row)))
-
-            # Create column headings
-            column_headings = [f"Column {i+1}" for i in range(max_columns)]
-            if max_columns >= 1: column_headings[0] = "SabreCode"
-            if max_columns >= 4: column_headings[3] = "BranchCode"
-            if max_columns >= 5: column_headings[4] = "AccNumber"
-            if max_columns >= 6: column_headings[5] = "CompanyName"
-            if max_columns >= 7: column_headings[6] = "TotalDue"
-
-            # Create DataFrame
-            self.eft_file_df = pd.DataFrame(processed_data, columns=column_headings)
+            self.session.load_eft(file_path)
+            self.eft_path = file_path
+            format_issues = self.session.format_issues
+            self.issues_button.setEnabled(len(format_issues) > 0)
+            self.enable_export_buttons(False)
+            self.save_snapshot()
 
             # Update status
             self.eft_status.setText("Loaded")
@@ -394,28 +467,268 @@ class DebitOrderApp(QMainWindow):
             self.statusBar().showMessage(f"EFT loaded: {os.path.basename(file_path)}", 5000)
             
             # Enable update button if CSV file is also loaded
-            if self.billing_df is not None:
+            if self.session.has_billing:
                 self.update_button.setEnabled(True)
+                self.dry_run_button.setEnabled(True)
             
             QMessageBox.information(self, "Success", "EFT file imported successfully!")
+            
+            # Summarise format issues; the full list is available from the Format Issues button
+            if len(format_issues):
+                counts = ", ".join(f"{name}: {count:,}" for name, count in format_issues.counts().items())
+                examples = "\n".join(format_issues.describe())
+                QMessageBox.warning(
+                    self, "Format Issues Detected",
+                    f"{len(format_issues):,} format issues on {format_issues.affected_lines():,} lines ({counts}).\n\n"
+                    f"{examples}\n\nUse 'Format Issues' to view or export them all."
+                )
 
         except Exception as e:
             self.eft_status.setText("Error")
             self.eft_status.setStyleSheet("color: #f44336;")
             QMessageBox.critical(self, "Error", f"Failed to load EFT file: {str(e)}")
         
+    def load_history(self):
+        """Load the archived .eft files used for the multi-month trends"""
+        try:
+            directory = QFileDialog.getExistingDirectory(self, "Select EFT Archive Folder")
+            if not directory:
+                return
+            
+            self.history_status.setText("Loading...")
+            self.history_status.setStyleSheet("color: #FF9800;")
+            QApplication.processEvents()
+            
+            self.history = trends.load_history(directory)
+            self.history_dir = directory
+            if not self.history.periods:
+                self.history = None
+                self.history_dir = None
+                self.history_status.setText("No archives found")
+                self.history_status.setStyleSheet("color: #f44336;")
+                return
+            
+            self.history_status.setText(f"{len(self.history.periods)} months, {len(self.history):,} accounts")
+            self.history_status.setStyleSheet("color: #4CAF50;")
+            
+        except Exception as e:
+            self.history = None
+            self.history_status.setText("Error")
+            self.history_status.setStyleSheet("color: #f44336;")
+            QMessageBox.critical(self, "Error", f"Failed to load history: {str(e)}")
+        
+    def open_customer_master(self):
+        """Open (or create) the customer master used to add billed customers missing from the EFT file"""
+        try:
+            db_path, _ = QFileDialog.getSaveFileName(
+                self, "Open or Create Customer Master", "", "Customer Master (*.db)",
+                options=QFileDialog.DontConfirmOverwrite
+            )
+            if not db_path:
+                return
+            
+            if self.session.master is not None:
+                self.session.master.close()
+            self.session.master = CustomerMaster(db_path)
+            self.master_status.setText(f"{os.path.basename(db_path)}: {len(self.session.master):,} customers")
+            self.master_status.setStyleSheet("color: #4CAF50;")
+            
+        except Exception as e:
+            self.session.master = None
+            self.master_status.setText("Error")
+            self.master_status.setStyleSheet("color: #f44336;")
+            QMessageBox.critical(self, "Error", f"Failed to open customer master: {str(e)}")
+        
+    def open_run_registry(self):
+        """Open (or create) the shared run registry that locks a client and period while its EFT file is created"""
+        try:
+            db_path, _ = QFileDialog.getSaveFileName(
+                self, "Open or Create Run Registry", "", "Run Registry (*.db)",
+                options=QFileDialog.DontConfirmOverwrite
+            )
+            if not db_path:
+                return
+            
+            # WAL is faster but breaks when several machines open the database over a network share
+            shared = "Shared folder, used from several machines"
+            local = "This machine only (faster)"
+            choice, ok = QInputDialog.getItem(self, "Run Registry", "Who uses this registry?", [shared, local], 0, False)
+            if not ok:
+                return
+            journal_mode = run_registry.DELETE if choice == shared else run_registry.WAL
+            
+            if self.registry is not None:
+                self.registry.close()
+            self.registry = run_registry.RunRegistry(db_path, journal_mode=journal_mode)
+            runs = self.registry.runs(limit=1)
+            last = f", last run {runs[0]['started'].replace('T', ' ')} by {runs[0]['operator']}" if runs else ""
+            self.registry_status.setText(f"{os.path.basename(db_path)}{last}")
+            self.registry_status.setStyleSheet("color: #4CAF50;")
+            
+        except Exception as e:
+            self.registry = None
+            self.registry_status.setText("Error")
+            self.registry_status.setStyleSheet("color: #f44336;")
+            QMessageBox.critical(self, "Error", f"Failed to open run registry: {str(e)}")
+    
+    def apply_period(self, file_path=None, reload_billing=True):
+        """Set the session's billing period from the period box, or from the file name when the box is empty.
+        
+        The bill run is reloaded when the period changes, since the period picks its VAT and rounding rule.
+        """
+        period = self.period_edit.text().strip()
+        if not period and file_path:
+            period = period_from_name(file_path) or ""
+            self.period_edit.setText(period)
+        period = period or None
+        parse_period(period)  # Refuse a malformed period before anything is locked or loaded
+        if period == self.session.period:
+            return
+        self.session.period = period
+        if reload_billing and self.session.has_billing and self.csv_path:
+            self.session.load_billing(self.csv_path)
+            self.enable_export_buttons(False)
+            self.update_status.setText("Not processed")
+            self.update_status.setStyleSheet("color: #f44336;")
+            self.save_snapshot()
+    
+    def change_period(self):
+        """Apply a period typed into the period box"""
+        try:
+            self.apply_period()
+        except Exception as e:
+            self.period_edit.setText(self.session.period or "")
+            QMessageBox.critical(self, "Error", f"Failed to set the billing period: {str(e)}")
+    
+    def registry_allows_processing(self):
+        """Refuse up front if another operator holds the registry lock of the session's client and period"""
+        if self.registry is None:
+            return True
+        held = self.registry.holder(self.session.policy, self.session.period)
+        if held is None:
+            return True
+        QMessageBox.warning(
+            self, "Run Locked",
+            f"{held['client']} {held['period']} is being processed by {held['operator']} on {held['host']} "
+            f"since {held['acquired'].replace('T', ' ')}.\n\nWait for that run to finish before processing it here."
+        )
+        return False
+    
+    def register_run(self, save_path):
+        """Take the registry lock of the session's client and period; returns the run id, None without a registry.
+        
+        Returns False if the operator decides not to process an already processed period again.
+        """
+        if self.registry is None:
+            return None
+        client = self.session.policy
+        period = run_registry.period_key(self.session.period)
+        rerun = False
+        done = self.registry.runs(client, period, status=run_registry.OK, limit=1)
+        if done:
+            answer = QMessageBox.question(
+                self, "Already Processed",
+                f"{client} {period} was already processed by {done[0]['operator']} on {done[0]['host']} "
+                f"at {done[0]['finished'].replace('T', ' ')}:\n{done[0]['output_path']}\n\nCreate another EFT file?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+            )
+            if answer != QMessageBox.Yes:
+                return False
+            rerun = True
+        return self.registry.acquire(client, period, self.csv_path, self.eft_path, rerun=rerun)
+    
+    def save_snapshot(self):
+        """Snapshot the session so it can be restored if the app is closed or crashes"""
+        try:
+            snapshot.save_session(self.session, extra={"duplicates": self.duplicates, "history_dir": self.history_dir,
+                                                       "csv_path": self.csv_path, "eft_path": self.eft_path})
+        except Exception as e:
+            # Losing the snapshot only loses the quick restore, the work itself is unaffected
+            logging.warning(f"Could not save the session snapshot: {e}")
+    
+    def offer_restore(self):
+        """Offer to restore the session snapshot of the previous run of the app"""
+        path = snapshot.default_snapshot_path()
+        if not os.path.exists(path):
+            return
+        try:
+            info = snapshot.read_snapshot_info(path)
+            if info["stage"] == "empty":
+                return
+            answer = QMessageBox.question(
+                self, "Restore Session",
+                f"The session of {info['saved'].replace('T', ' ')} was saved "
+                f"({info['records']:,} EFT records from {info['eft_source'] or 'no EFT file'}, "
+                f"{info['billing']:,} billed customers, {info['stage']}).\n\nRestore it?",
+                QMessageBox.Yes | QMessageBox.No, QMessageBox.Yes
+            )
+            if answer != QMessageBox.Yes:
+                snapshot.discard_snapshot(path)
+                return
+            self.session, extra = snapshot.restore_session(path)
+            self.duplicates = extra.get("duplicates")
+            self.csv_path = extra.get("csv_path")
+            self.eft_path = extra.get("eft_path")
+            history_dir = extra.get("history_dir")
+            if history_dir and os.path.isdir(history_dir):
+                self.history = trends.load_history(history_dir)
+                self.history_dir = history_dir
+            self.show_restored_session()
+            self.statusBar().showMessage("Session restored", 5000)
+        except Exception as e:
+            snapshot.discard_snapshot(path)
+            QMessageBox.critical(self, "Error", f"Failed to restore the session: {str(e)}")
+    
+    def show_restored_session(self):
+        """Bring the status labels and buttons in line with a restored session"""
+        loaded = "color: #4CAF50;"
+        self.period_edit.setText(self.session.period or "")
+        if self.session.has_billing:
+            self.csv_status.setText("Loaded (restored)")
+            self.csv_status.setStyleSheet(loaded)
+        if self.session.has_records:
+            self.eft_status.setText("Loaded (restored)")
+            self.eft_status.setStyleSheet(loaded)
+            self.issues_button.setEnabled(len(self.session.format_issues) > 0)
+        if self.history is not None:
+            self.history_status.setText(f"{len(self.history.periods)} months, {len(self.history):,} accounts")
+            self.history_status.setStyleSheet(loaded)
+        if self.session.master is not None:
+            self.master_status.setText(f"{os.path.basename(self.session.master.db_path)}: "
+                                       f"{len(self.session.master):,} customers")
+            self.master_status.setStyleSheet(loaded)
+        both = self.session.has_records and self.session.has_billing
+        self.update_button.setEnabled(both)
+        self.dry_run_button.setEnabled(both)
+        if self.session.reconciled:
+            self.update_status.setText("Complete (restored)")
+            self.update_status.setStyleSheet(loaded)
+        self.enable_export_buttons(self.session.reconciled)
+        
+    def show_format_issues(self):
+        """Open the format issues of the loaded EFT file"""
+        if self.session.format_issues is None:
+            return
+        self.issues_dialog = FormatIssuesDialog(self.session.format_issues, self)
+        self.issues_dialog.show()
+        
     def enable_export_buttons(self, enabled):
         """Enable or disable export buttons"""
         self.export_button.setEnabled(enabled)
         self.create_eft_button.setEnabled(enabled)
+        self.view_results_button.setEnabled(enabled)
         
     def update_data(self):
         """Update data by matching SabreCode"""
         try:
             # Check if both files are loaded
-            if self.eft_file_df is None or self.billing_df is None:
+            if not (self.session.has_records and self.session.has_billing):
                 QMessageBox.warning(self, "Warning", "Please load both files first")
                 return
+            
+            # Another operator processing the same client and period makes this run pointless
+            if not self.registry_allows_processing():
+                return
                 
             # Show processing state
             self.update_status.setText("Processing...")
@@ -423,32 +736,14 @@ class DebitOrderApp(QMainWindow):
             self.update_button.setEnabled(False)
             QApplication.processEvents()
             
-            print("Original EFT data:")
-            print(self.eft_file_df.head())
-            print("\nBilling data:")
-            print(self.billing_df.head())
-            
-            # Create updated_df by copying eft_file_df
-            self.updated_df = self.eft_file_df.copy()
-            
-            # Update TotalDue by matching SabreCode
-            print("\nMerging data on SabreCode...")
-            self.updated_df = self.updated_df.merge(
-                self.billing_df[['SabreCode', 'TotalDue']],
-                on='SabreCode',
-                how='left',
-                suffixes=('', '_billing')
-            )
-            
-            print("\nMerged data before processing:")
-            print(self.updated_df.head())
-            
-            # Handle unmatched records
-            self.updated_df['TotalDue'] = self.updated_df['TotalDue_billing'].fillna(0)
-            self.updated_df.drop(columns=['TotalDue_billing'], inplace=True)
+            # Look up the new TotalDue by SabreCode, unmatched records get 0
+            self.session.reconcile()
+            updated_df = self.session.updated_frame()
+            logging.info(f"Session data: {self.session.memory_usage() / 1e6:,.1f} MB")
             
-            print("\nFinal updated data:")
-            print(self.updated_df.head())
+            # Look for customers that the new file would debit more than once
+            self.duplicates = processing.check_duplicates(updated_df)
+            self.save_snapshot()
             
             # Update status
             self.update_status.setText("Complete")
@@ -458,7 +753,23 @@ class DebitOrderApp(QMainWindow):
             # Enable export buttons
             self.enable_export_buttons(True)
             
-            QMessageBox.information(self, "Success", "Data updated successfully!")
+            message = "Data updated successfully!"
+            if self.session.master_added:
+                message += f"\n\n{self.session.master_added:,} billed customers were added from the customer master."
+            gaps = self.session.gaps
+            message += (f"\n\n{len(gaps.eft_only):,} EFT records have no billing record and "
+                        f"{len(gaps.billing_only):,} billed customers have no EFT record.")
+            if len(gaps.uncollected()):
+                # Billed money without a record would silently drop out of the new file
+                dialog = QMessageBox(self)
+                dialog.setWindowTitle("Reconciliation Gaps")
+                dialog.setIcon(QMessageBox.Warning)
+                dialog.setText(message + f"\n\nR {gaps.billing_only_cents() / 100:,.2f} billed is not in the "
+                               f"new EFT file. The Excel export lists these customers.")
+                dialog.setDetailedText("\n".join(gaps.describe(limit=len(gaps.billing_only))))
+                dialog.exec_()
+            else:
+                QMessageBox.information(self, "Success", message)
             
         except Exception as e:
             self.update_status.setText("Error")
@@ -466,11 +777,49 @@ class DebitOrderApp(QMainWindow):
             QMessageBox.critical(self, "Error", f"Failed to update data: {str(e)}")
         finally:
             self.update_button.setEnabled(True)
+            
+    def dry_run(self):
+        """Show what the new EFT file would contain, without writing anything"""
+        try:
+            if not (self.session.has_records and self.session.has_billing):
+                QMessageBox.warning(self, "Warning", "Please load both files first")
+                return
+                
+            # Reconciling only fills in the new amounts in memory
+            if not self.session.reconciled:
+                self.session.reconcile()
+                self.duplicates = processing.check_duplicates(self.session.updated_frame())
+            summary = self.session.dry_run(duplicates=self.duplicates)
+            
+            dialog = QMessageBox(self)
+            dialog.setWindowTitle("Dry Run")
+            dialog.setIcon(QMessageBox.Information)
+            dialog.setText(format_dry_run(summary, sample=False))
+            dialog.setDetailedText("\n".join(summary["sample_lines"]))
+            dialog.setStyleSheet("QLabel { font-family: monospace; }")
+            dialog.exec_()
+            
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to run dry run: {str(e)}")
+        
+    def show_results(self):
+        """Open the reconciled results in a sortable, filterable table"""
+        try:
+            if not self.session.reconciled:
+                QMessageBox.warning(self, "Warning", "Please update data first")
+                return
+                
+            results_df = self.session.results_frame()
+            self.results_dialog = ResultsDialog(results_df, self)
+            self.results_dialog.show()
+            
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to show results: {str(e)}")
         
     def export_to_excel(self):
         """Export data to Excel"""
         try:
-            if self.updated_df is None:
+            if not self.session.reconciled:
                 QMessageBox.warning(self, "Warning", "Please update data first")
                 return
                 
@@ -480,11 +829,6 @@ class DebitOrderApp(QMainWindow):
             self.export_button.setEnabled(False)
             QApplication.processEvents()
             
-            print("\nExporting data to Excel...")
-            print("Updated DataFrame columns:", self.updated_df.columns)
-            print("Updated DataFrame head:")
-            print(self.updated_df.head())
-            
             # Get save location
             file_path, _ = QFileDialog.getSaveFileName(
                 self, "Save Excel File", "", "Excel Files (*.xlsx)"
@@ -496,61 +840,19 @@ class DebitOrderApp(QMainWindow):
                 self.export_button.setEnabled(True)
                 return
                 
-            # Prepare data for export
-            print("\nSelecting columns for export...")
-            required_cols = ["SabreCode", "BranchCode", "AccNumber", "CompanyName"]
-            print("Available columns:", self.updated_df.columns)
-            
             # Verify all required columns exist
-            missing_cols = [col for col in required_cols if col not in self.updated_df.columns]
+            required_cols = ["SabreCode", "BranchCode", "AccNumber", "CompanyName"]
+            missing_cols = [col for col in required_cols if col not in self.session.records.columns]
             if missing_cols:
                 raise ValueError(f"Missing required columns: {missing_cols}")
             
-            export_df = self.updated_df[required_cols].copy()
-            print("\nBase export data:")
-            print(export_df.head())
-            
-            print("\nProcessing numeric columns...")
-            export_df["TotalDue"] = pd.to_numeric(self.updated_df["TotalDue"], errors='coerce') / 100
-            export_df["PrevMonthTotalDue"] = pd.to_numeric(self.eft_file_df["TotalDue"], errors='coerce') / 100
-            
-            print("\nAfter numeric conversion:")
-            print(export_df.head())
-            
-            export_df["Difference"] = export_df["TotalDue"] - export_df["PrevMonthTotalDue"]
-            print("\nFinal export data with Difference:")
-            print(export_df.head())
-            
-            # Create Excel workbook
-            wb = openpyxl.Workbook()
-            ws = wb.active
-            ws.title = "Debit Order Data"
-            
-            # Write headers with styling
-            headers = ["SabreCode", "BranchCode", "AccNumber", "CompanyName", 
-                      "TotalDue", "PrevMonthTotalDue", "Difference"]
-            for col_num, header in enumerate(headers, 1):
-                cell = ws.cell(row=1, column=col_num, value=header)
-                cell.font = Font(bold=True)
-                cell.fill = PatternFill(start_color="CAF2F0", fill_type="solid")
-            
-            # Write data
-            for row_num, row in enumerate(export_df.itertuples(), 2):
-                ws.cell(row=row_num, column=1, value=row.SabreCode)
-                ws.cell(row=row_num, column=2, value=row.BranchCode)
-                ws.cell(row=row_num, column=3, value=row.AccNumber)
-                ws.cell(row=row_num, column=4, value=row.CompanyName)
-                ws.cell(row=row_num, column=5, value=row.TotalDue).number_format = FORMAT_NUMBER_00
-                ws.cell(row=row_num, column=6, value=row.PrevMonthTotalDue).number_format = FORMAT_NUMBER_00
-                diff_cell = ws.cell(row=row_num, column=7, value=row.Difference)
-                diff_cell.number_format = FORMAT_NUMBER_00
-                if row.Difference < 0:
-                    diff_cell.font = Font(color="FF0000")
-                elif row.Difference > 0:
-                    diff_cell.font = Font(color="0000FF")
+            # Build the detail data and the month-over-month summary
+            export_df = self.session.results_frame()
+            report = movers_report(export_df)
+            logging.info(format_movers_report(report))
             
             # Save file
-            wb.save(file_path)
+            processing.export_results_to_excel(file_path, export_df, report, self.history, self.session.gaps)
             
             # Update status
             self.export_status.setText("Exported")
@@ -568,10 +870,25 @@ class DebitOrderApp(QMainWindow):
     def create_new_eft_file(self):
         """Create new EFT file with proper fixed-width formatting that exactly matches the April 2024 2.eft format"""
         try:
-            if self.updated_df is None:
+            if not self.session.reconciled:
                 QMessageBox.warning(self, "Warning", "Please update data first")
                 return
                 
+            # Creating a file that debits an account twice needs explicit confirmation
+            blocking = self.duplicates.blocking() if self.duplicates is not None else []
+            if len(blocking):
+                examples = "\n".join(blocking.describe())
+                answer = QMessageBox.question(
+                    self, "Duplicate Debits",
+                    f"{blocking.group_count():,} accounts would be debited more than once:\n\n{examples}\n\n"
+                    f"Create the EFT file anyway?",
+                    QMessageBox.Yes | QMessageBox.No, QMessageBox.No
+                )
+                if answer != QMessageBox.Yes:
+                    self.eft_creation_status.setText("Cancelled")
+                    self.eft_creation_status.setStyleSheet("color: #FF9800;")
+                    return
+                
             # Show processing state
             self.eft_creation_status.setText("Creating...")
             self.eft_creation_status.setStyleSheet("color: #FF9800;")
@@ -600,52 +917,28 @@ class DebitOrderApp(QMainWindow):
                 self.create_eft_button.setEnabled(True)
                 return
                 
-            # Read original file to get the header
-            with open(original_path, 'r', encoding='utf-8') as file:
-                original_lines = file.readlines()
-                
-            header = original_lines[0]  # Preserve the header line
+            # Nobody else may create a file for the same client and period meanwhile
+            run_id = self.register_run(save_path)
+            if run_id is False:
+                self.eft_creation_status.setText("Cancelled")
+                self.eft_creation_status.setStyleSheet("color: #FF9800;")
+                return
             
-            # Create new EFT file with exact formatting as in the April 2024 2.eft file
-            with open(save_path, 'w', encoding='utf-8') as new_file:
-                new_file.write(header)  # Write the header line first
+            try:
+                # Read original file to get the header, encoding and line endings
+                eft_format, header = eft_io.read_header(original_path)
                 
-                # Process each row in the updated DataFrame
-                for idx, row in self.updated_df.iterrows():
-                    # Extract values for each field using iloc to avoid FutureWarning
-                    sabre_code = str(row.iloc[0]).strip() if len(row) > 0 else ""
-                    col2 = str(row.iloc[1]).strip() if len(row) > 1 else ""
-                    col3 = str(row.iloc[2]).strip() if len(row) > 2 else ""
-                    branch_code = str(row.iloc[3]).strip() if len(row) > 3 else ""
-                    acc_number = str(row.iloc[4]).strip() if len(row) > 4 else ""
-                    company_name = str(row.iloc[5]).strip() if len(row) > 5 else ""
-                    
-                    # Special handling for TotalDue field when it's 0
-                    total_due = str(row.iloc[6]).strip() if len(row) > 6 else ""
-                    if total_due == "0" or total_due == "":
-                        total_due = "00000000000"
-                        
-                    sabre_radio = str(row.iloc[7]).strip() if len(row) > 7 else "SABRE RADIO"
-                    n_value = str(row.iloc[8]).strip() if len(row) > 8 else "N"
-                    
-                    # Format the line exactly as in the April 2024 2.eft file
-                    # The April file format has each field with specific left-aligned width and proper spacing between fields
-                    
-                    # Format exactly as in the reference file with proper spacing between columns
-                    formatted_line = (
-                        f"{sabre_code:<7}  "              # SabreCode (7 chars, left-aligned) + 2 spaces
-                        f"{col2:<1}  "                    # Col2 (1 char) + 2 spaces
-                        f"{col3:<1}  "                    # Col3 (1 char) + 2 spaces
-                        f"{branch_code:<6}  "             # BranchCode (6 chars) + 2 spaces
-                        f"{acc_number:<19}  "             # AccNumber (19 chars) + 2 spaces
-                        f"{company_name:<20}  "           # CompanyName (20 chars, left-aligned) + 2 spaces
-                        f"{total_due:<11}  "          # TotalDue (11 chars) + 2 spaces
-                        f"{sabre_radio:<15}  "        # SabreRadio (15 chars, left-aligned) + 2 spaces
-                        f"{n_value}"                      # N (1 char)
-                    )
-                    
-                    # Write the formatted line to file
-                    new_file.write(formatted_line + '\n')
+                # Create new EFT file with exact formatting as in the April 2024 2.eft file
+                updated_df = self.session.updated_frame()
+                processing.write_eft_file(save_path, header, updated_df, layout=self.session.layout,
+                                          eft_format=eft_format)
+            except Exception as e:
+                if run_id is not None:
+                    self.registry.finish(run_id, save_path, error=str(e))
+                raise
+            if run_id is not None:
+                self.registry.finish(run_id, save_path, {"rows": len(updated_df),
+                                                         "total_due_cents": int(updated_df["TotalDue"].sum())})
                 
             # Update status
             self.eft_creation_status.setText("Created")
@@ -657,7 +950,7 @@ class DebitOrderApp(QMainWindow):
             self.eft_creation_status.setText("Error")
             self.eft_creation_status.setStyleSheet("color: #f44336;")
             QMessageBox.critical(self, "Error", f"Failed to create EFT file: {str(e)}")
-            print(f"Exception details: {e}")  # Print to console for debugging
+            logging.debug(f"Exception details: {e}", exc_info=True)
         finally:
             self.create_eft_button.setEnabled(True)
 
@@ -665,4 +958,5 @@ if __name__ == "__main__":
     app = QApplication(sys.argv)
     window = DebitOrderApp()
     window.show()
+    window.offer_restore()
     sys.exit(app.exec_())
@@ -0,0 +1,202 @@
+"""Progress and throughput metrics of bill runs, for unattended and batch runs.
+
+The pipeline stages add to counters once per stage or per batch (rows
+parsed, matched and written, bytes written, seconds spent per stage), never
+per row, so the metrics can stay on in production. They are exposed in the
+Prometheus text format, either over HTTP by a small server thread
+(serve_http) or in a file rewritten periodically (MetricsFileWriter, for
+node_exporter's textfile collector or for a human to look at).
+"""
+import contextlib
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+PREFIX = "debit_order_"
+
+COUNTER = "counter"
+GAUGE = "gauge"
+
+# Name (without PREFIX) -> (type, help)
+METRICS = {
+    "rows_parsed_total": (COUNTER, "EFT records parsed"),
+    "rows_matched_total": (COUNTER, "EFT records that found a billing record"),
+    "rows_unmatched_total": (COUNTER, "EFT records without a billing record"),
+    "rows_written_total": (COUNTER, "Records written to new .eft files"),
+    "bytes_written_total": (COUNTER, "Bytes written to new .eft files"),
+    "stage_rows_total": (COUNTER, "Rows processed per pipeline stage"),
+    "stage_seconds_total": (COUNTER, "Seconds spent per pipeline stage"),
+    "stage_rows_per_second": (GAUGE, "Throughput of the last completed pass of each stage"),
+    "runs_total": (COUNTER, "Bill runs finished, by status"),
+    "run_in_progress": (GAUGE, "1 while a bill run is in progress"),
+    "last_run_seconds": (GAUGE, "Duration of the last finished bill run"),
+    "last_run_timestamp_seconds": (GAUGE, "Unix time the last bill run finished"),
+}
+
+# Seconds between rewrites of a metrics file
+FILE_INTERVAL = 15.0
+
+
+def _label_text(labels):
+    if not labels:
+        return ""
+    escaped = (str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"') for _, value in labels)
+    return "{" + ",".join(f'{name}="{value}"' for (name, _), value in zip(labels, escaped)) + "}"
+
+
+class StageTimer:
+    """The rows handled by one pass of a stage; set rows before the stage ends"""
+
+    def __init__(self):
+        self.rows = 0
+
+
+class Metrics:
+    """Thread-safe counters and gauges keyed by metric name and labels"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def _key(self, name, labels):
+        if name not in METRICS:
+            raise ValueError(f"Unknown metric '{name}'")
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        """Add value to a counter"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        """Set a gauge"""
+        key = self._key(name, labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, name, **labels):
+        """Current value of a metric (0 if it was never set)"""
+        with self._lock:
+            return self._values.get(self._key(name, labels), 0)
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        """Time one pass of a pipeline stage; yields a StageTimer whose rows are counted when the pass ends"""
+        timer = StageTimer()
+        start = time.perf_counter()
+        try:
+            yield timer
+        finally:
+            seconds = time.perf_counter() - start
+            self.inc("stage_seconds_total", seconds, stage=name)
+            self.inc("stage_rows_total", timer.rows, stage=name)
+            if seconds > 0 and timer.rows:
+                self.set("stage_rows_per_second", timer.rows / seconds, stage=name)
+
+    @contextlib.contextmanager
+    def run(self):
+        """Track one bill run: in progress while running, then counted by status with its duration"""
+        start = time.perf_counter()
+        self.set("run_in_progress", 1)
+        status = "failed"
+        try:
+            yield
+            status = "ok"
+        finally:
+            self.set("run_in_progress", 0)
+            self.inc("runs_total", status=status)
+            self.set("last_run_seconds", time.perf_counter() - start)
+            self.set("last_run_timestamp_seconds", time.time())
+
+    def render(self):
+        """Return every metric in the Prometheus text exposition format"""
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = []
+        for name, (kind, description) in METRICS.items():
+            samples = [(labels, value) for (metric, labels), value in values if metric == name]
+            if not samples:
+                continue
+            lines.append(f"# HELP {PREFIX}{name} {description}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in samples:
+                text = value if isinstance(value, int) else repr(float(value))
+                lines.append(f"{PREFIX}{name}{_label_text(labels)} {text}")
+        return "\n".join(lines) + "\n"
+
+
+# The registry the pipeline reports to
+REGISTRY = Metrics()
+
+inc = REGISTRY.inc
+stage = REGISTRY.stage
+run = REGISTRY.run
+
+
+class _MetricsHandler(BaseHTTPRequestHandler):
+    registry = REGISTRY
+
+    def do_GET(self):
+        if self.path.split("?")[0] not in ("/metrics", "/"):
+            self.send_error(404)
+            return
+        body = self.registry.render().encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logging.debug(f"Metrics request: {format % args}")
+
+
+def serve_http(port, host="127.0.0.1", registry=REGISTRY):
+    """Serve the metrics at http://host:port/metrics from a daemon thread; returns the server (call shutdown)"""
+    handler = type("MetricsHandler", (_MetricsHandler,), {"registry": registry})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    logging.info(f"Serving metrics at http://{host}:{server.server_address[1]}/metrics")
+    return server
+
+
+class MetricsFileWriter:
+    """Rewrite a metrics file every interval seconds from a daemon thread (and once more on stop)"""
+
+    def __init__(self, file_path, interval=FILE_INTERVAL, registry=REGISTRY):
+        self.file_path = file_path
+        self.interval = interval
+        self.registry = registry
+        self._stop = threading.Event()
+        self._thread = None
+
+    def write(self):
+        """Write the current metrics, replacing the file atomically so readers never see half of it"""
+        temp_path = f"{self.file_path}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(self.registry.render())
+        os.replace(temp_path, self.file_path)
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.write()
+            except OSError as e:
+                logging.warning(f"Could not write metrics to {self.file_path}: {e}")
+
+    def start(self):
+        self.write()
+        self._thread = threading.Thread(target=self._loop, name="metrics-file", daemon=True)
+        self._thread.start()
+        logging.info(f"Writing metrics to {self.file_path} every {self.interval:g}s")
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.write()
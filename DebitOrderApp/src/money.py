@@ -0,0 +1,60 @@
+"""Integer-cents money helpers.
+
+Amounts are carried through the pipeline as int64 cents: parsed once from the
+bill run CSV or the .eft file, and only turned back into text when an EFT line
+is written or into Rands when the Excel sheet is written.
+"""
+import numpy as np
+import pandas as pd
+
+# Width of the TotalDue field in the .eft file
+EFT_AMOUNT_WIDTH = 11
+
+# Columns of a results frame holding its amounts as int64 cents (missing amounts are 0), next to the
+# Rand columns that are displayed; aggregations sum these rather than the Rands
+TOTAL_DUE_CENTS = "TotalDueCents"
+PREV_TOTAL_DUE_CENTS = "PrevMonthTotalDueCents"
+CENTS_COLUMNS = [TOTAL_DUE_CENTS, PREV_TOTAL_DUE_CENTS]
+
+_DECIMAL_PATTERN = r"^\s*([+-]?)(\d*)(?:\.(\d*))?\s*$"
+
+
+def parse_cents(values):
+    """Parse decimal Rand amounts (e.g. "1560.49") into int64 cents without going through floats.
+
+    Digits past the second decimal are rounded half away from zero and missing values count as 0.
+    Raises ValueError if any value is not a plain decimal number.
+    """
+    text = pd.Series(values, copy=False).fillna("0").astype(str)
+    parts = text.str.extract(_DECIMAL_PATTERN)
+    invalid = parts[1].isna() | ((parts[1] == "") & parts[2].fillna("").eq(""))
+    if invalid.any():
+        bad = text[invalid].iloc[0]
+        raise ValueError(f"Invalid amount '{bad}' in bill run data")
+
+    whole = pd.to_numeric(parts[1].replace("", "0")).to_numpy(dtype=np.int64)
+    fraction = parts[2].fillna("").str.ljust(3, "0")
+    cents = whole * 100 + pd.to_numeric(fraction.str[:2]).to_numpy(dtype=np.int64)
+    cents += (pd.to_numeric(fraction.str[2]).to_numpy(dtype=np.int64) >= 5)
+
+    negative = (parts[0] == "-").to_numpy()
+    return np.where(negative, -cents, cents)
+
+
+def parse_eft_cents(values):
+    """Parse the zero padded TotalDue field of .eft records into nullable Int64 cents"""
+    return pd.to_numeric(pd.Series(values, copy=False), errors='coerce').astype("Int64")
+
+
+def format_cents(cents):
+    """Format an amount in cents as the zero padded TotalDue field"""
+    if cents is None or pd.isna(cents):
+        cents = 0
+    return f"{int(cents):0{EFT_AMOUNT_WIDTH}d}"
+
+
+def cents_to_rands(cents):
+    """Convert cents to float Rands for display and Excel (missing values become NaN)"""
+    if isinstance(cents, pd.Series):
+        cents = cents.to_numpy(dtype=float, na_value=np.nan)
+    return np.asarray(cents, dtype=float) / 100
@@ -0,0 +1,171 @@
+"""VAT and rounding policies per client, declared as data.
+
+Each policy lives in DebitOrderApp/resources/policies/<name>.json and lists
+dated rules: the date a rule takes effect, the VAT rate (an exact fraction
+such as "15%", "0.15" or "3/20"), how the VAT inclusive amount is brought
+back to whole cents ("truncate" toward zero or "half_up") and the rounding
+rule. A rounding rule is one of ROUNDING_RULES or an object with a modulus
+and the adjustment in cents for each remainder, e.g. {"modulus": 10,
+"adjust": {"4": 1, "9": 1}} for the ends-in-4-or-9 rule.
+
+A rule is compiled once into integer constants and a lookup table indexed by
+the remainder, so applying it to any number of amounts is a multiply, an
+integer division and a table lookup over the whole array.
+"""
+import datetime
+import functools
+import glob
+import json
+import os
+from fractions import Fraction
+
+import numpy as np
+
+POLICY_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "policies")
+DEFAULT_POLICY = "default"
+
+TRUNCATE = "truncate"
+HALF_UP = "half_up"
+VAT_ROUNDINGS = [TRUNCATE, HALF_UP]
+
+# Named rounding rules: modulus and the adjustment (in cents) per remainder
+ROUNDING_RULES = {
+    "none": {"modulus": 1, "adjust": {}},
+    "up_4_9": {"modulus": 10, "adjust": {"4": 1, "9": 1}},
+    "nearest_5": {"modulus": 5, "adjust": {"1": -1, "2": -2, "3": 2, "4": 1}},
+    "up_5": {"modulus": 5, "adjust": {"1": 4, "2": 3, "3": 2, "4": 1}},
+    "up_10": {"modulus": 10, "adjust": {str(r): 10 - r for r in range(1, 10)}},
+}
+
+
+def parse_rate(value):
+    """Parse a VAT rate ("15%", "0.15", "3/20" or a number) into an exact Fraction"""
+    text = str(value).strip()
+    try:
+        rate = Fraction(text[:-1]) / 100 if text.endswith("%") else Fraction(text)
+    except (ValueError, ZeroDivisionError):
+        raise ValueError(f"Invalid VAT rate '{value}'")
+    if rate < 0:
+        raise ValueError(f"VAT rate '{value}' is negative")
+    return rate
+
+
+def _rounding_table(rounding):
+    """Compile a rounding rule (a name or a modulus/adjust object) into (modulus, adjustment per remainder)"""
+    if isinstance(rounding, str):
+        if rounding not in ROUNDING_RULES:
+            raise ValueError(f"Unknown rounding rule '{rounding}', available: {', '.join(ROUNDING_RULES)}")
+        rounding = ROUNDING_RULES[rounding]
+    modulus = int(rounding["modulus"])
+    if modulus < 1:
+        raise ValueError(f"Rounding modulus must be at least 1, got {modulus}")
+    table = np.zeros(modulus, dtype=np.int64)
+    for remainder, adjustment in rounding.get("adjust", {}).items():
+        if not 0 <= int(remainder) < modulus:
+            raise ValueError(f"Rounding remainder {remainder} is outside 0..{modulus - 1}")
+        table[int(remainder)] = int(adjustment)
+    return modulus, table
+
+
+class PolicyRule:
+    """One dated VAT and rounding rule, compiled into integer constants and a lookup table"""
+
+    def __init__(self, effective, vat_rate, vat_rounding=TRUNCATE, rounding="none"):
+        self.effective = datetime.date.fromisoformat(str(effective))
+        self.vat_rate = parse_rate(vat_rate)
+        if vat_rounding not in VAT_ROUNDINGS:
+            raise ValueError(f"Unknown VAT rounding '{vat_rounding}', use one of {', '.join(VAT_ROUNDINGS)}")
+        self.vat_rounding = vat_rounding
+        self.rounding = rounding
+
+        factor = 1 + self.vat_rate
+        self.numerator = factor.numerator
+        self.denominator = factor.denominator
+        self.modulus, self.table = _rounding_table(rounding)
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["effective"], data["vat_rate"], vat_rounding=data.get("vat_rounding", TRUNCATE),
+                   rounding=data.get("rounding", "none"))
+
+    def add_vat(self, cents):
+        """Add VAT to int64 cents with exact integer arithmetic (the sign is applied after rounding)"""
+        cents = np.asarray(cents, dtype=np.int64)
+        magnitude = np.abs(cents) * self.numerator
+        if self.vat_rounding == HALF_UP:
+            magnitude = (2 * magnitude + self.denominator) // (2 * self.denominator)
+        else:
+            magnitude //= self.denominator
+        return np.where(cents < 0, -magnitude, magnitude)
+
+    def round(self, cents):
+        """Apply the rounding rule: each amount moves by the table entry of its remainder"""
+        cents = np.asarray(cents, dtype=np.int64)
+        return cents + self.table[cents % self.modulus]
+
+    def apply(self, cents):
+        """VAT inclusive, rounded amounts in int64 cents"""
+        return self.round(self.add_vat(cents))
+
+    def describe(self):
+        rounding = self.rounding if isinstance(self.rounding, str) else f"modulus {self.modulus}"
+        return (f"from {self.effective.isoformat()}: VAT {float(self.vat_rate) * 100:g}% ({self.vat_rounding}), "
+                f"rounding {rounding}")
+
+
+class Policy:
+    """The dated rules of one client, the latest one in effect on a date applies"""
+
+    def __init__(self, name, rules, description=""):
+        if not rules:
+            raise ValueError(f"Policy '{name}' has no rules")
+        self.name = name
+        self.description = description
+        self.rules = sorted(rules, key=lambda rule: rule.effective)
+        if len({rule.effective for rule in self.rules}) < len(self.rules):
+            raise ValueError(f"Policy '{name}' has two rules taking effect on the same date")
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["name"], [PolicyRule.from_dict(rule) for rule in data["rules"]],
+                   description=data.get("description", ""))
+
+    def rule_for(self, date=None):
+        """Return the rule in effect on date (today by default)"""
+        date = date or datetime.date.today()
+        effective = [rule for rule in self.rules if rule.effective <= date]
+        if not effective:
+            raise ValueError(f"No rule of policy '{self.name}' is in effect on {date.isoformat()} "
+                             f"(the first takes effect on {self.rules[0].effective.isoformat()})")
+        return effective[-1]
+
+    def apply(self, cents, date=None):
+        """Add VAT and round amounts in int64 cents with the rule in effect on date"""
+        return self.rule_for(date).apply(cents)
+
+
+def parse_period(period):
+    """Return the date a billing period (YYYY-MM or YYYY-MM-DD) starts on, or None for None"""
+    if period is None or isinstance(period, datetime.date):
+        return period
+    text = str(period).strip()
+    try:
+        return datetime.date.fromisoformat(f"{text}-01" if len(text) == 7 else text)
+    except ValueError:
+        raise ValueError(f"Invalid billing period '{period}', use YYYY-MM or YYYY-MM-DD")
+
+
+def available_policies(policy_dir=POLICY_DIR):
+    """Return the names of the policies in policy_dir"""
+    return sorted(os.path.splitext(os.path.basename(path))[0]
+                  for path in glob.glob(os.path.join(policy_dir, "*.json")))
+
+
+@functools.lru_cache(maxsize=None)
+def get_policy(name=DEFAULT_POLICY, policy_dir=POLICY_DIR):
+    """Return the compiled policy with this name (or the policy in this .json file)"""
+    path = name if name.lower().endswith(".json") else os.path.join(policy_dir, f"{name}.json")
+    if not os.path.exists(path):
+        raise ValueError(f"Unknown policy '{name}', available: {', '.join(available_policies(policy_dir))}")
+    with open(path, encoding="utf-8") as file:
+        return Policy.from_dict(json.load(file))
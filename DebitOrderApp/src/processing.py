@@ -0,0 +1,287 @@
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+import customer_master
+import eft_io
+import metrics
+import report_builder
+import trends
+import verbatim
+from atomic_writer import AtomicEftWriter, CHECKPOINT_RECORDS, frame_fingerprint
+from duplicates import DuplicateRecordsError, find_duplicates
+from format_issues import collect_format_issues
+from gaps import find_gaps
+from layouts import DEFAULT_LAYOUT, get_layout
+from keys import sum_by_key, join_amounts
+from money import parse_cents, cents_to_rands, TOTAL_DUE_CENTS, PREV_TOTAL_DUE_CENTS
+from policy import DEFAULT_POLICY, get_policy, parse_period
+
+# Columns shown in the results view and written to the Excel export
+RESULT_COLUMNS = ["SabreCode", "BranchCode", "AccNumber", "CompanyName",
+                  "TotalDue", "PrevMonthTotalDue", "Difference"]
+
+
+def load_billing_csv(file_path, policy=DEFAULT_POLICY, period=None):
+    """Load the bill run CSV and consolidate it into one VAT inclusive amount per SabreCode.
+
+    VAT and rounding follow the named policy's rule in effect for the billing
+    period (YYYY-MM, today by default). TotalDue is returned as int64 cents.
+    """
+    # Check if file has a sep=, line at the beginning
+    with open(file_path, 'r', encoding='utf-8') as f:
+        first_line = f.readline().strip()
+
+    # Skip the first line if it's a separator definition, and keep amounts as text
+    # so they can be parsed straight into cents
+    skiprows = 1 if first_line.startswith('sep=') else 0
+    billing_df = pd.read_csv(file_path, skiprows=skiprows, dtype={'TotalDue': str})
+
+    # Rename CustomerCode to SabreCode for consistency
+    if 'CustomerCode' in billing_df.columns:
+        billing_df = billing_df.rename(columns={'CustomerCode': 'SabreCode'})
+
+    if 'SabreCode' not in billing_df.columns:
+        raise ValueError("Required column 'SabreCode' or 'CustomerCode' not found in CSV file")
+
+    # Consolidate on the canonical code so "1234", " 1234" and "0001234" are one customer
+    codes, totals = sum_by_key(billing_df['SabreCode'], parse_cents(billing_df['TotalDue']))
+    rule = get_policy(policy).rule_for(parse_period(period))
+    logging.debug(f"Bill run amounts use policy '{policy}' {rule.describe()}")
+    billing_df = pd.DataFrame({'SabreCode': codes, 'TotalDue': rule.apply(totals)})
+
+    return billing_df[billing_df['SabreCode'] != ""].reset_index(drop=True)
+
+
+def read_eft_records(file_path, layout=DEFAULT_LAYOUT):
+    """Read and parse an .eft file, returning its eft_io.EftText, layouts.ParsedRecords and format issues"""
+    layout = get_layout(layout)
+    eft_text = eft_io.read_eft(file_path)
+
+    parsed = layout.parse_lines(eft_text.lines, encoding=eft_text.encoding)
+    # Only the lines that do not match the layout exactly are scanned as text
+    format_issues = collect_format_issues(eft_text.header_line, eft_text.text_lines(~parsed.clean), parsed.rows,
+                                          eft_text.line_numbers, layout.widths, parsed.clean, layout.starts)
+    return eft_text, parsed, format_issues
+
+
+def load_eft_file(file_path, layout=DEFAULT_LAYOUT):
+    """Load an .eft file, returning its header line, the records as a DataFrame and the format issues.
+
+    Records are parsed with the named record layout. TotalDue is parsed into
+    nullable Int64 cents, all other fields stay text. The encoding and line
+    endings are detected (see eft_io); use eft_io.sniff_file to write a new
+    file in the same format.
+    """
+    eft_text, parsed, format_issues = read_eft_records(file_path, layout)
+    return eft_text.header_line, parsed.frame, format_issues
+
+
+def load_raw_eft_file(file_path, layout=DEFAULT_LAYOUT):
+    """Load an .eft file like load_eft_file, also keeping its original lines for verbatim writing.
+
+    Returns the header line, the records, the format issues, a
+    verbatim.RawRecords and the eft_io.EftFormat the lines are encoded in.
+    """
+    eft_text, parsed, format_issues = read_eft_records(file_path, layout)
+    raw = verbatim.RawRecords(eft_text.lines, parsed.aligned, eft_text.encoding)
+    return eft_text.header_line, parsed.frame, format_issues, raw, eft_text.format
+
+
+def update_data(eft_file_df, billing_df):
+    """Copy the EFT records with TotalDue taken from the billing data, matching on SabreCode.
+
+    Codes are matched on their canonical form, so padding and whitespace
+    differences between the two files do not cause misses. Returns the
+    updated frame and a boolean mask of the rows that found a billing match.
+    Unmatched rows get a TotalDue of 0 cents.
+    """
+    total_due, matched_mask = join_amounts(eft_file_df['SabreCode'], billing_df['SabreCode'], billing_df['TotalDue'])
+    # A shallow copy shares every other column with eft_file_df (copy-on-write keeps them apart)
+    updated_df = eft_file_df.copy(deep=False)
+    updated_df['TotalDue'] = total_due
+
+    return updated_df, matched_mask
+
+
+def add_master_records(eft_file_df, billing_df, master, source=""):
+    """Refresh the customer master from the loaded records and add the billed customers missing from them.
+
+    Customers that are billed but not in the .eft records get a record filled
+    from the master (banking details included). Billed customers the master
+    does not know either are logged, since they cannot be debited. Returns the
+    records and the number of records added.
+    """
+    master.refresh(eft_file_df, source)
+    records, unknown = customer_master.master_records(eft_file_df, billing_df, master)
+    if unknown:
+        logging.warning(f"{len(unknown):,} billed customers have no banking details: {', '.join(unknown[:10])}"
+                        f"{' ...' if len(unknown) > 10 else ''}")
+    if len(records):
+        logging.info(f"Added {len(records):,} billed customers from the customer master")
+        eft_file_df = pd.concat([eft_file_df, records], ignore_index=True)
+    return eft_file_df, len(records)
+
+
+def build_results_frame(eft_file_df, updated_df, matched=None):
+    """Build the reconciled results frame (amounts in Rands) from the loaded and updated data.
+
+    The amounts are also kept as int64 cents (money.CENTS_COLUMNS) for the
+    rollups and trends; the report and the results view leave them out.
+    """
+    results_df = updated_df[["SabreCode", "BranchCode", "AccNumber", "CompanyName"]]
+
+    # Subtract in cents and only convert to Rands for display
+    new_cents = updated_df["TotalDue"].astype("Int64").to_numpy(dtype=float, na_value=np.nan)
+    prev_cents = eft_file_df["TotalDue"].astype("Int64").to_numpy(dtype=float, na_value=np.nan)
+    results_df["TotalDue"] = cents_to_rands(new_cents)
+    results_df["PrevMonthTotalDue"] = cents_to_rands(prev_cents)
+    results_df["Difference"] = cents_to_rands(new_cents - prev_cents)
+    results_df[TOTAL_DUE_CENTS] = np.nan_to_num(new_cents).astype(np.int64)
+    results_df[PREV_TOTAL_DUE_CENTS] = np.nan_to_num(prev_cents).astype(np.int64)
+
+    # Keep track of which EFT rows found a billing record
+    if matched is not None:
+        results_df["Matched"] = np.asarray(matched, dtype=bool)
+
+    return results_df
+
+
+def write_eft_file(save_path, header_line, updated_df, checkpoint_every=CHECKPOINT_RECORDS, layout=DEFAULT_LAYOUT,
+                   eft_format=None, raw=None):
+    """Write the header line and one formatted line per updated record to save_path.
+
+    The file only appears at save_path once it is complete and verified. If an
+    earlier write of the same data to the same path was interrupted, writing
+    resumes after its last checkpoint. eft_format (an eft_io.EftFormat, UTF-8
+    with LF line endings by default) sets the encoding, BOM and line endings.
+    With raw (the verbatim.RawRecords the first records were loaded with),
+    their original lines are written with only TotalDue replaced.
+    """
+    layout = get_layout(layout)
+    eft_format = eft_format or eft_io.EftFormat()
+    fingerprint = frame_fingerprint(header_line, updated_df, eft_format, None if raw is None else raw.digest())
+    with metrics.stage("write") as stage, \
+            AtomicEftWriter(save_path, fingerprint, checkpoint_every, **eft_format.writer_options()) as writer:
+        offset = writer.offset
+        if not writer.resumed:
+            writer.write_header(header_line)
+        for start in range(writer.start_record, len(updated_df), checkpoint_every):
+            chunk = updated_df.iloc[start:start + checkpoint_every]
+            if raw is None:
+                writer.write_records(layout.format_frame(chunk))
+            else:
+                writer.write_records(verbatim.splice_records(raw, chunk, layout, start))
+            # Counted per chunk, so a long write shows its progress
+            metrics.inc("rows_written_total", len(chunk))
+            metrics.inc("bytes_written_total", writer.offset - offset)
+            offset = writer.offset
+            stage.rows += len(chunk)
+
+
+def check_duplicates(updated_df, block=False):
+    """Find the collision groups in the updated records and log the ones that would debit twice.
+
+    With block set, raises DuplicateRecordsError (a ValueError) instead of
+    returning when any group would debit an account more than once.
+    """
+    duplicates = find_duplicates(updated_df)
+    blocking = duplicates.blocking()
+    if len(blocking):
+        message = f"{blocking.group_count():,} duplicate groups would debit an account more than once"
+        if block:
+            raise DuplicateRecordsError(f"{message}: " + "; ".join(blocking.describe()), blocking)
+        logging.warning(message)
+        for description in blocking.describe():
+            logging.warning(description)
+    return duplicates
+
+
+def export_results_to_excel(file_path, results_df, movers_report=None, history=None, gaps=None):
+    """Save the reconciled results as the multi-sheet Excel report.
+
+    Trends are added if a History is given, the reconciliation gaps sheet if
+    the gaps.ReconciliationGaps of the run are given.
+    """
+    return report_builder.write_report(file_path, results_df, movers_report, history=history, gaps=gaps)
+
+
+def check_gaps(eft_file_df, billing_df):
+    """Find the reconciliation gaps of a bill run and log the billed amounts no record carries"""
+    gaps = find_gaps(eft_file_df, billing_df)
+    uncollected = gaps.uncollected()
+    if len(uncollected):
+        logging.warning(f"{len(uncollected):,} billed customers have no EFT record, "
+                        f"R {gaps.billing_only_cents() / 100:,.2f} is not in the new .eft file")
+        for description in gaps.describe():
+            logging.warning(description)
+    return gaps
+
+
+@metrics.run()
+def run_pipeline(csv_path, eft_path, eft_output_path, excel_output_path=None, layout=DEFAULT_LAYOUT,
+                 history_dir=None, block_duplicates=False, master_path=None, verbatim_records=False,
+                 policy=DEFAULT_POLICY, period=None):
+    """Run load, update, EFT write and (optionally) Excel export without any GUI.
+
+    With history_dir (an archive directory) the Excel export includes the
+    multi-month trends. With block_duplicates no .eft file is written if any
+    account would be debited more than once. With master_path (a customer
+    master database) billed customers missing from the .eft file are added
+    with their stored banking details. With verbatim_records the records that
+    fit the layout keep their original line with only TotalDue replaced (see
+    verbatim). policy and period select the VAT and rounding rule (see
+    load_billing_csv). Returns a dict summarising the run, including the
+    counts and totals of the reconciliation gaps (see gaps).
+    """
+    with metrics.stage("billing") as stage:
+        billing_df = load_billing_csv(csv_path, policy, period)
+        stage.rows = len(billing_df)
+    raw = None
+    with metrics.stage("parse") as stage:
+        if verbatim_records:
+            header_line, eft_file_df, format_issues, raw, eft_format = load_raw_eft_file(eft_path, layout)
+        else:
+            header_line, eft_file_df, format_issues = load_eft_file(eft_path, layout)
+            # The new file keeps the encoding and line endings of the previous one
+            eft_format = eft_io.sniff_file(eft_path)
+        stage.rows = len(eft_file_df)
+    metrics.inc("rows_parsed_total", len(eft_file_df))
+    master_added = 0
+    if master_path:
+        with metrics.stage("master") as stage, customer_master.CustomerMaster(master_path) as master:
+            eft_file_df, master_added = add_master_records(eft_file_df, billing_df, master, os.path.basename(eft_path))
+            stage.rows = len(eft_file_df)
+    with metrics.stage("match") as stage:
+        updated_df, matched_mask = update_data(eft_file_df, billing_df)
+        stage.rows = len(updated_df)
+    metrics.inc("rows_matched_total", int(matched_mask.sum()))
+    metrics.inc("rows_unmatched_total", int((~matched_mask).sum()))
+    with metrics.stage("gaps") as stage:
+        gaps = check_gaps(eft_file_df, billing_df)
+        stage.rows = len(eft_file_df) + len(billing_df)
+    with metrics.stage("duplicates") as stage:
+        duplicates = check_duplicates(updated_df, block=block_duplicates)
+        stage.rows = len(updated_df)
+    write_eft_file(eft_output_path, header_line, updated_df, layout=layout, eft_format=eft_format, raw=raw)
+
+    if excel_output_path:
+        with metrics.stage("excel") as stage:
+            results_df = build_results_frame(eft_file_df, updated_df, matched_mask)
+            history = trends.load_history(history_dir, layout=layout) if history_dir else None
+            export_results_to_excel(excel_output_path, results_df, history=history, gaps=gaps)
+            stage.rows = len(results_df)
+
+    return {
+        "rows": len(updated_df),
+        "matched": int(matched_mask.sum()),
+        "unmatched": int((~matched_mask).sum()),
+        "format_issues": len(format_issues),
+        "duplicate_groups": duplicates.group_count(),
+        "master_added": master_added,
+        **gaps.summary(),
+        "total_due_cents": int(updated_df["TotalDue"].sum()),
+        "eft_output": eft_output_path,
+        "excel_output": excel_output_path,
+    }
@@ -0,0 +1,144 @@
+"""Multi-sheet Excel report: detail, summary, unmatched, zeroed, gaps, branch and bank totals and trends.
+
+The data behind each sheet is computed on a thread pool (the work is mostly
+NumPy and pandas, which release the GIL), then the workbook is assembled by
+xlsx_stream, which writes each sheet straight into the file with a fixed set
+of shared styles.
+"""
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from rollups import rollup
+from trends import trend_frame, AMOUNT_COLUMNS as TREND_AMOUNT_COLUMNS
+from money import CENTS_COLUMNS
+from analytics import movers_report as build_movers_report, summary_lines, REPORT_SECTIONS, MOVER_COLUMNS
+from xlsx_stream import XlsxStreamWriter, HEADER, BOLD, AMOUNT, NEGATIVE, POSITIVE
+
+# A full report for 200k rows should be written within this many seconds
+REPORT_TIME_BUDGET = 10.0
+
+DETAIL_SHEET = "Debit Order Data"
+SUMMARY_SHEET = "Summary"
+UNMATCHED_SHEET = "Unmatched Accounts"
+ZEROED_SHEET = "Zeroed Accounts"
+GAPS_SHEET = "Reconciliation Gaps"
+BRANCH_SHEET = "Branch Totals"
+BANK_SHEET = "Bank Totals"
+TRENDS_SHEET = "Customer Trends"
+
+AMOUNT_COLUMNS = {"TotalDue", "PrevMonthTotalDue", "Difference", "PctChange"} | set(TREND_AMOUNT_COLUMNS)
+
+
+def detail_frame(results_df):
+    """Every reconciled record (without the Matched flag and the amounts in cents)"""
+    return results_df.drop(columns=["Matched"] + CENTS_COLUMNS, errors="ignore")
+
+
+def unmatched_frame(results_df):
+    """Records whose SabreCode has no billing record"""
+    if "Matched" not in results_df:
+        return detail_frame(results_df).iloc[:0]
+    return detail_frame(results_df)[~results_df["Matched"].to_numpy(dtype=bool)]
+
+
+def zeroed_frame(results_df):
+    """Records that owed something last month and owe nothing now"""
+    new = results_df["TotalDue"].to_numpy(dtype=float)
+    prev = results_df["PrevMonthTotalDue"].to_numpy(dtype=float)
+    return detail_frame(results_df)[(np.nan_to_num(new) == 0) & (np.nan_to_num(prev) > 0)]
+
+
+def column_styles(frame):
+    """Return the style of each column, with Difference coloured by sign per row"""
+    styles = {name: AMOUNT for name in frame.columns if name in AMOUNT_COLUMNS}
+    if "Difference" in styles:
+        difference = np.nan_to_num(frame["Difference"].to_numpy(dtype=float))
+        styles["Difference"] = np.where(difference < 0, NEGATIVE, np.where(difference > 0, POSITIVE, AMOUNT))
+    return styles
+
+
+def _frame_rows(frame):
+    """Yield (values, styles) rows for a small frame, header first"""
+    columns = list(frame.columns)
+    yield columns, (HEADER,) * len(columns)
+    styles = column_styles(frame)
+    for position, values in enumerate(frame.itertuples(index=False, name=None)):
+        yield values, tuple(_row_style(styles.get(name), position) for name in columns)
+
+
+def _row_style(style, position):
+    return style if style is None or isinstance(style, str) else style[position]
+
+
+def summary_rows(report):
+    """Return the rows of the movers summary sheet as (values, styles)"""
+    rows = []
+    for label, value in summary_lines(report):
+        rows.append(((label, value), (BOLD, AMOUNT if isinstance(value, float) else None)))
+
+    for title, key in REPORT_SECTIONS:
+        rows.append(((), ()))
+        rows.append(((title,), (BOLD,)))
+        rows.extend(_frame_rows(report[key][MOVER_COLUMNS]))
+    return rows
+
+
+def build_sheets(results_df, movers_report=None, history=None, gaps=None):
+    """Compute the data of every sheet in parallel.
+
+    Returns (sheet name, data) pairs in sheet order, where data is a DataFrame
+    or, for the summary sheet, the movers report. The trends sheet is only
+    built when a History of past runs is given, the gaps sheet only when the
+    gaps.ReconciliationGaps of the run are given.
+    """
+    builders = [
+        (DETAIL_SHEET, detail_frame),
+        (SUMMARY_SHEET, lambda frame: movers_report if movers_report is not None else build_movers_report(frame)),
+        (UNMATCHED_SHEET, unmatched_frame),
+        (ZEROED_SHEET, zeroed_frame),
+        (BRANCH_SHEET, rollup),
+    ]
+    if history is not None:
+        builders.append((TRENDS_SHEET, lambda frame: trend_frame(frame, history)))
+    with ThreadPoolExecutor(max_workers=len(builders)) as pool:
+        futures = [(name, pool.submit(builder, results_df)) for name, builder in builders]
+        sheets = [(name, future.result()) for name, future in futures]
+
+    trends = [sheets.pop()] if history is not None else []
+    gap_sheets = [(GAPS_SHEET, gaps.frame())] if gaps is not None else []
+
+    # Branch and bank totals come from the same rollup
+    totals = sheets.pop()[1]
+    return sheets + gap_sheets + [(BRANCH_SHEET, totals["branch"]), (BANK_SHEET, totals["bank"])] + trends
+
+
+def write_report(file_path, results_df, movers_report=None, detail_sheet=DETAIL_SHEET,
+                 time_budget=REPORT_TIME_BUDGET, history=None, gaps=None):
+    """Write the multi-sheet report for the reconciled results to an .xlsx file.
+
+    Returns the number of records written per sheet (the summary sheet excluded).
+    """
+    start = time.perf_counter()
+    sheets = build_sheets(results_df, movers_report, history, gaps)
+    computed = time.perf_counter()
+
+    row_counts = {}
+    with XlsxStreamWriter(file_path) as writer:
+        for name, data in sheets:
+            if name == SUMMARY_SHEET:
+                writer.write_rows(name, summary_rows(data))
+                continue
+            title = detail_sheet if name == DETAIL_SHEET else name
+            writer.write_frame(title, data, column_styles(data))
+            row_counts[title] = len(data)
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Excel report written to {file_path} in {elapsed:.2f}s "
+                 f"(sheets computed in {computed - start:.2f}s)")
+    if elapsed > time_budget:
+        logging.warning(f"Excel report took {elapsed:.2f}s, over the {time_budget:g}s budget "
+                        f"for {len(results_df):,} rows")
+    return row_counts
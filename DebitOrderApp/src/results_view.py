@@ -0,0 +1,285 @@
+"""Qt views of the reconciled results and of the format issues of an EFT file.
+
+ColumnarTableModel serves cells straight from a DataFrame's column arrays
+and formats only the rows on screen, so the view opens at once for hundreds
+of thousands of records. Filters are boolean masks over the columns and
+sorting is an np.lexsort over cached ranks, stable in both directions with
+missing values last; either only replaces the array of source rows shown.
+"""
+import numpy as np
+import pandas as pd
+from PyQt5.QtWidgets import (QDialog, QVBoxLayout, QHBoxLayout, QTableView,
+                             QHeaderView, QComboBox, QLineEdit, QLabel, QPushButton,
+                             QFileDialog, QMessageBox)
+from PyQt5.QtCore import Qt, QAbstractTableModel, QModelIndex, QVariant
+from PyQt5.QtGui import QColor
+
+from money import CENTS_COLUMNS
+
+# Columns rendered as amounts (2 decimals, right aligned)
+AMOUNT_COLUMNS = {"TotalDue", "PrevMonthTotalDue", "Difference"}
+
+
+def _difference_nonzero(columns):
+    difference = columns["Difference"]
+    return (difference != 0) & ~np.isnan(difference)
+
+
+def _unmatched(columns):
+    if "Matched" not in columns:
+        return np.zeros(len(columns["SabreCode"]), dtype=bool)
+    return ~columns["Matched"]
+
+
+def _zeroed(columns):
+    return (columns["TotalDue"] == 0) & (columns["PrevMonthTotalDue"] > 0)
+
+
+# Named filters evaluated on the column arrays, each returning a boolean mask
+RESULT_FILTERS = {
+    "All rows": None,
+    "Difference ≠ 0": _difference_nonzero,
+    "Unmatched SabreCode": _unmatched,
+    "Zeroed accounts": _zeroed,
+}
+
+
+class ColumnarTableModel(QAbstractTableModel):
+    """Read-only table model backed directly by the column arrays of a DataFrame.
+
+    Cells are formatted on demand for the visible rows only. Sorting and
+    filtering never copy the data, they only replace the row index array
+    mapping view rows to source rows. The sort key and string form of a
+    column are built the first time they are needed and kept.
+    """
+
+    def __init__(self, frame, parent=None):
+        super().__init__(parent)
+        self._headers = list(frame.columns)
+        # Categorical columns stay categorical: one small code per row instead of one string
+        self._columns = {name: frame[name].array if isinstance(frame[name].dtype, pd.CategoricalDtype)
+                         else frame[name].to_numpy() for name in self._headers}
+        self._row_count = len(frame)
+        self._mask = None
+        self._sort_column = None
+        self._sort_order = Qt.AscendingOrder
+        self._rows = np.arange(self._row_count)
+        self._text = {}
+        self._sort_keys = {}
+
+    def columns(self):
+        """Return the underlying column arrays keyed by column name"""
+        return self._columns
+
+    def text_column(self, name):
+        """Return a column as strings, blank where a value is missing"""
+        if name not in self._text:
+            series = pd.Series(self._columns[name])
+            self._text[name] = series.astype(str).where(series.notna(), "").to_numpy(dtype=object)
+        return self._text[name]
+
+    def _sort_key(self, name):
+        """Return the dense ascending rank of every value of a column and the mask of missing values"""
+        if name not in self._sort_keys:
+            values = self._columns[name]
+            if values.dtype == object or isinstance(values.dtype, pd.CategoricalDtype):
+                # Sort text columns on their string form so mixed types compare
+                text = self.text_column(name)
+                ranks, _ = pd.factorize(text, sort=True)
+                missing = text == ""
+            else:
+                ranks, _ = pd.factorize(values, sort=True)
+                missing = ranks < 0
+            self._sort_keys[name] = (ranks, np.asarray(missing, dtype=bool))
+        return self._sort_keys[name]
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._rows)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self._headers)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return QVariant()
+        if orientation == Qt.Horizontal:
+            return self._headers[section]
+        return str(section + 1)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return QVariant()
+
+        name = self._headers[index.column()]
+        value = self._columns[name][self._rows[index.row()]]
+
+        if role == Qt.DisplayRole:
+            if name in AMOUNT_COLUMNS:
+                return "" if pd.isna(value) else f"{value:,.2f}"
+            if isinstance(value, (bool, np.bool_)):
+                return "Yes" if value else "No"
+            return "" if value is None else str(value)
+
+        if role == Qt.TextAlignmentRole and name in AMOUNT_COLUMNS:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+
+        if role == Qt.ForegroundRole and name == "Difference" and not pd.isna(value):
+            if value < 0:
+                return QColor("#FF0000")
+            if value > 0:
+                return QColor("#0000FF")
+
+        return QVariant()
+
+    def set_filter(self, mask):
+        """Restrict the view to the rows where mask is True (None shows all rows)"""
+        self._mask = None if mask is None else np.asarray(mask, dtype=bool)
+        self._rebuild_rows()
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self._sort_column = column
+        self._sort_order = order
+        self._rebuild_rows()
+
+    def _rebuild_rows(self):
+        self.layoutAboutToBeChanged.emit()
+
+        if self._mask is None:
+            rows = np.arange(self._row_count)
+        else:
+            rows = np.flatnonzero(self._mask)
+
+        if self._sort_column is not None and len(rows) > 1:
+            ranks, missing = self._sort_key(self._headers[self._sort_column])
+            keys = ranks[rows]
+            if self._sort_order == Qt.DescendingOrder:
+                keys = -keys
+            # lexsort is stable and sorts on its last key first: equal values keep their order and
+            # missing values go last in both directions
+            rows = rows[np.lexsort((keys, missing[rows]))]
+
+        self._rows = rows
+        self.layoutChanged.emit()
+
+
+def make_table_view(model):
+    """Create a table view with fixed row heights so only visible rows are ever measured"""
+    table = QTableView()
+    table.setModel(model)
+    table.setSortingEnabled(True)
+    table.horizontalHeader().setSortIndicatorShown(True)
+    table.horizontalHeader().setSectionResizeMode(QHeaderView.Interactive)
+    table.horizontalHeader().setStretchLastSection(True)
+    table.verticalHeader().setSectionResizeMode(QHeaderView.Fixed)
+    table.verticalHeader().setDefaultSectionSize(22)
+    table.setWordWrap(False)
+    return table
+
+
+class ResultsDialog(QDialog):
+    """Window showing the reconciled data with filters, sorting and search"""
+
+    def __init__(self, results_df, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("Reconciled Results")
+        self.resize(1000, 600)
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        # Filter and search controls
+        controls = QHBoxLayout()
+        self.filter_combo = QComboBox()
+        self.filter_combo.addItems(list(RESULT_FILTERS))
+        self.filter_combo.currentIndexChanged.connect(self.apply_filters)
+        self.search_edit = QLineEdit()
+        self.search_edit.setPlaceholderText("Search SabreCode or CompanyName")
+        self.search_edit.returnPressed.connect(self.apply_filters)
+        self.count_label = QLabel()
+        controls.addWidget(QLabel("Show:"))
+        controls.addWidget(self.filter_combo)
+        controls.addWidget(self.search_edit)
+        controls.addWidget(self.count_label)
+        layout.addLayout(controls)
+
+        self.model = ColumnarTableModel(results_df.drop(columns=CENTS_COLUMNS, errors="ignore"), self)
+        self.table = make_table_view(self.model)
+        layout.addWidget(self.table)
+
+        self.update_count()
+
+    def apply_filters(self):
+        """Combine the selected filter and search text into one row mask"""
+        columns = self.model.columns()
+        mask = None
+
+        filter_func = RESULT_FILTERS[self.filter_combo.currentText()]
+        if filter_func is not None:
+            mask = filter_func(columns)
+
+        text = self.search_edit.text().strip()
+        if text:
+            search_mask = np.zeros(len(columns["SabreCode"]), dtype=bool)
+            for name in ("SabreCode", "CompanyName"):
+                values = pd.Series(self.model.text_column(name))
+                search_mask |= values.str.contains(text, case=False, regex=False).to_numpy()
+            mask = search_mask if mask is None else mask & search_mask
+
+        self.model.set_filter(mask)
+        self.update_count()
+
+    def update_count(self):
+        self.count_label.setText(f"{self.model.rowCount():,} rows")
+
+
+class FormatIssuesDialog(QDialog):
+    """Window listing the format issues of the loaded EFT file"""
+
+    def __init__(self, format_issues, parent=None):
+        super().__init__(parent)
+        self.setWindowTitle("EFT Format Issues")
+        self.resize(700, 500)
+        self.format_issues = format_issues
+
+        layout = QVBoxLayout()
+        self.setLayout(layout)
+
+        controls = QHBoxLayout()
+        self.code_combo = QComboBox()
+        self.code_combo.addItem("All issues")
+        self.code_combo.addItems(list(format_issues.counts()))
+        self.code_combo.currentIndexChanged.connect(self.apply_filter)
+        self.count_label = QLabel()
+        export_button = QPushButton("Export...")
+        export_button.clicked.connect(self.export_issues)
+        controls.addWidget(QLabel("Show:"))
+        controls.addWidget(self.code_combo)
+        controls.addWidget(self.count_label)
+        controls.addStretch()
+        controls.addWidget(export_button)
+        layout.addLayout(controls)
+
+        self.model = ColumnarTableModel(format_issues.to_frame(), self)
+        layout.addWidget(make_table_view(self.model))
+        self.update_count()
+
+    def apply_filter(self):
+        if self.code_combo.currentIndex() == 0:
+            self.model.set_filter(None)
+        else:
+            self.model.set_filter(self.model.columns()["Issue"] == self.code_combo.currentText())
+        self.update_count()
+
+    def export_issues(self):
+        file_path, _ = QFileDialog.getSaveFileName(
+            self, "Export Format Issues", "", "CSV Files (*.csv);;Excel Files (*.xlsx)"
+        )
+        if not file_path:
+            return
+        try:
+            self.format_issues.export(file_path)
+        except Exception as e:
+            QMessageBox.critical(self, "Error", f"Failed to export format issues: {str(e)}")
+
+    def update_count(self):
+        self.count_label.setText(f"{self.model.rowCount():,} issues")
@@ -0,0 +1,128 @@
+"""Per-branch and per-bank rollups of the reconciled results.
+
+BranchCode is factorized once into a GroupIndex and every aggregation (counts,
+current and previous totals, differences) is a bincount over those ids. The
+bank rollup never touches the records again: each branch maps to one bank, so
+bank figures are bincounts of the branch figures.
+"""
+import functools
+import os
+
+import numpy as np
+import pandas as pd
+
+from keys import normalize_codes
+from money import cents_to_rands, TOTAL_DUE_CENTS, PREV_TOTAL_DUE_CENTS
+
+# Branch codes are six digits
+BRANCH_CODE_WIDTH = 6
+
+# Local table of universal branch codes and the bank each one belongs to
+BRANCH_TABLE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "resources", "branch_codes.csv")
+
+UNKNOWN_BANK = "Unknown"
+
+
+@functools.lru_cache(maxsize=4)
+def load_branch_banks(path=BRANCH_TABLE_PATH):
+    """Return the branch code to bank name table as a dict"""
+    table = pd.read_csv(path, dtype=str)
+    codes = normalize_codes(table["BranchCode"], width=BRANCH_CODE_WIDTH)
+    return dict(zip(codes, table["Bank"].str.strip()))
+
+
+class GroupIndex:
+    """Factorized group ids for a column, reused by every aggregation"""
+
+    def __init__(self, ids, labels):
+        self.ids = np.asarray(ids, dtype=np.int32)
+        self.labels = np.asarray(labels, dtype=object)
+        self.counts = np.bincount(self.ids, minlength=len(self.labels))
+
+    @classmethod
+    def from_values(cls, values, width=BRANCH_CODE_WIDTH):
+        ids, labels = pd.factorize(normalize_codes(values, width=width), sort=True)
+        return cls(ids, labels)
+
+    def __len__(self):
+        return len(self.labels)
+
+    def sum(self, values):
+        """Sum int64 values per group"""
+        # Float weights are exact for any realistic cent total (below 2**53)
+        sums = np.bincount(self.ids, weights=np.asarray(values, dtype=np.float64), minlength=len(self.labels))
+        return np.rint(sums).astype(np.int64)
+
+    def count(self, mask):
+        """Count the rows per group where mask is True"""
+        return np.bincount(self.ids[np.asarray(mask, dtype=bool)], minlength=len(self.labels))
+
+    def regroup(self, mapping, default=UNKNOWN_BANK):
+        """Map every group label through mapping; returns (parent id of each group, parent labels)"""
+        mapped = pd.Series([mapping.get(label, default) for label in self.labels], dtype=object)
+        parent_ids, parent_labels = pd.factorize(mapped, sort=True)
+        return parent_ids, np.asarray(parent_labels, dtype=object)
+
+
+def _rollup_frame(labels, label_column, figures):
+    """Build a rollup frame from per-group integer figures (amounts in cents)"""
+    frame = pd.DataFrame({label_column: labels})
+    frame["Accounts"] = figures["accounts"]
+    frame["Changed"] = figures["changed"]
+    frame["Zeroed"] = figures["zeroed"]
+    frame["TotalDue"] = cents_to_rands(figures["total"])
+    frame["PrevMonthTotalDue"] = cents_to_rands(figures["prev"])
+    frame["Difference"] = cents_to_rands(figures["total"] - figures["prev"])
+    prev = figures["prev"].astype(float)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        frame["PctChange"] = np.where(prev > 0, (figures["total"] - prev) / prev * 100, np.nan)
+    return frame
+
+
+def rollup(results_df, branch_banks=None):
+    """Aggregate the reconciled results per BranchCode and per bank.
+
+    Returns a dict with "branch" and "bank" DataFrames.
+    """
+    if branch_banks is None:
+        branch_banks = load_branch_banks()
+
+    total = results_df[TOTAL_DUE_CENTS].to_numpy(dtype=np.int64)
+    prev = results_df[PREV_TOTAL_DUE_CENTS].to_numpy(dtype=np.int64)
+
+    branches = GroupIndex.from_values(results_df["BranchCode"])
+    branch_figures = {
+        "accounts": branches.counts,
+        "changed": branches.count(total != prev),
+        "zeroed": branches.count((total == 0) & (prev > 0)),
+        "total": branches.sum(total),
+        "prev": branches.sum(prev),
+    }
+
+    # Banks are rolled up from the branch figures, not from the records
+    bank_of_branch, banks = branches.regroup(branch_banks)
+    bank_figures = {
+        name: np.rint(np.bincount(bank_of_branch, weights=values, minlength=len(banks))).astype(np.int64)
+        for name, values in branch_figures.items()
+    }
+
+    branch_frame = _rollup_frame(branches.labels, "BranchCode", branch_figures)
+    branch_frame.insert(1, "Bank", banks[bank_of_branch])
+    return {
+        "branch": branch_frame,
+        "bank": _rollup_frame(banks, "Bank", bank_figures),
+    }
+
+
+def format_rollup(frame):
+    """Render a rollup frame as plain text for the console"""
+    label = frame.columns[0]
+    lines = [f"{label:<16}{'Accounts':>10}{'Changed':>10}{'Zeroed':>8}"
+             f"{'TotalDue':>18}{'PrevMonth':>18}{'Difference':>18}{'Change':>9}"]
+    lines.append("-" * len(lines[0]))
+    for row in frame.itertuples(index=False):
+        name = str(getattr(row, label)) or "(blank)"
+        pct = "" if pd.isna(row.PctChange) else f"{row.PctChange:+.1f}%"
+        lines.append(f"{name[:15]:<16}{row.Accounts:>10,}{row.Changed:>10,}{row.Zeroed:>8,}"
+                     f"{row.TotalDue:>18,.2f}{row.PrevMonthTotalDue:>18,.2f}{row.Difference:>+18,.2f}{pct:>9}")
+    return "\n".join(lines)
@@ -0,0 +1,276 @@
+"""Shared run registry: who generated which .eft file, for which client and period.
+
+Several operators can process the same month from different machines
+against a shared folder. The registry is a SQLite database in that folder
+with one lock row per (client, period) and one row per run, holding the
+operator, host, input and output hashes, status and timings.
+
+A run takes its lock with a single short write transaction before any heavy
+processing starts: the lock row is inserted only if none is held (or the one
+held has expired, e.g. after a crash), so two operators can never both
+proceed. A client and period that already has a finished run is refused as
+well unless a rerun is asked for. The inputs are hashed only once the lock
+is held, so a refused run costs one small transaction.
+
+The journal mode is "delete" by default, which relies on the file system's
+locking and so works for a database on a network share opened from several
+machines. When every operator runs on the same host, "wal" lets the readers
+(listing runs, checking a lock) and the writer proceed without waiting on
+each other; WAL needs the host's shared memory and must not be used on a
+share opened from several machines.
+"""
+import contextlib
+import datetime
+import getpass
+import logging
+import os
+import socket
+import sqlite3
+import time
+import uuid
+
+from golden import file_digest
+from policy import parse_period
+
+WAL = "wal"
+DELETE = "delete"
+JOURNAL_MODES = [WAL, DELETE]
+
+# Seconds after which a lock that was never released (crashed run) may be taken over
+LOCK_TTL = 4 * 3600
+
+# Seconds a transaction waits for another writer before giving up; every write is a few rows
+BUSY_TIMEOUT = 2.0
+
+RUNNING = "running"
+OK = "ok"
+FAILED = "failed"
+
+
+class RunLockError(ValueError):
+    """A run was refused: its client and period is locked by another run or already processed"""
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS run_locks (
+    client TEXT NOT NULL,
+    period TEXT NOT NULL,
+    run_id TEXT NOT NULL,
+    operator TEXT NOT NULL,
+    host TEXT NOT NULL,
+    acquired TEXT NOT NULL,
+    expires REAL NOT NULL,
+    PRIMARY KEY (client, period)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS runs (
+    run_id TEXT PRIMARY KEY,
+    client TEXT NOT NULL,
+    period TEXT NOT NULL,
+    operator TEXT NOT NULL,
+    host TEXT NOT NULL,
+    status TEXT NOT NULL,
+    started TEXT NOT NULL,
+    finished TEXT,
+    seconds REAL,
+    csv_path TEXT,
+    csv_sha256 TEXT,
+    eft_path TEXT,
+    eft_sha256 TEXT,
+    output_path TEXT,
+    output_sha256 TEXT,
+    rows INTEGER,
+    total_due_cents INTEGER,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_period ON runs (client, period, status);
+"""
+
+
+def period_key(period=None):
+    """The YYYY-MM key of a billing period (the current month by default)"""
+    return (parse_period(period) or datetime.date.today()).strftime("%Y-%m")
+
+
+def current_operator():
+    """The operator and host recorded with a run"""
+    return getpass.getuser(), socket.gethostname()
+
+
+def _hash(path):
+    return file_digest(path)[0] if path and os.path.exists(path) else None
+
+
+class RunRegistry:
+    """Run locks by (client, period) and the record of every run, in a shared SQLite database"""
+
+    def __init__(self, db_path, journal_mode=DELETE, lock_ttl=LOCK_TTL):
+        if journal_mode not in JOURNAL_MODES:
+            raise ValueError(f"Unknown journal mode '{journal_mode}', use one of {', '.join(JOURNAL_MODES)}")
+        self.db_path = db_path
+        self.lock_ttl = lock_ttl
+        self.operator, self.host = current_operator()
+        # Transactions are begun explicitly, so the lock check and insert are one write
+        self._connection = sqlite3.connect(db_path, timeout=BUSY_TIMEOUT, isolation_level=None)
+        self._connection.row_factory = sqlite3.Row
+        mode = self._connection.execute(f"PRAGMA journal_mode = {journal_mode}").fetchone()[0]
+        if mode.lower() != journal_mode:
+            # The mode cannot change while another connection has the database open in WAL mode
+            logging.warning(f"Run registry {db_path} stays in {mode} mode, {journal_mode} was asked for")
+        self._connection.execute("PRAGMA synchronous = NORMAL")
+        self._connection.executescript(_SCHEMA)
+
+    def close(self):
+        self._connection.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+        return False
+
+    def holder(self, client, period=None):
+        """The lock held on a client and period (a dict), or None; a read that never waits for writers"""
+        row = self._connection.execute("SELECT * FROM run_locks WHERE client = ? AND period = ? AND expires > ?",
+                                       (client, period_key(period), time.time())).fetchone()
+        return dict(row) if row is not None else None
+
+    def runs(self, client=None, period=None, status=None, limit=50):
+        """The most recent runs (dicts, newest first), optionally of one client, period or status"""
+        conditions, values = [], []
+        for column, value in (("client", client), ("period", period and period_key(period)), ("status", status)):
+            if value:
+                conditions.append(f"{column} = ?")
+                values.append(value)
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        query = f"SELECT * FROM runs {where} ORDER BY started DESC, rowid DESC LIMIT ?"
+        return [dict(row) for row in self._connection.execute(query, values + [limit])]
+
+    def acquire(self, client, period=None, csv_path=None, eft_path=None, rerun=False):
+        """Take the lock of a client and period and record the run as running; returns its run id.
+
+        Raises RunLockError without waiting if another run holds the lock, or if
+        a run of the client and period already finished and rerun is not set.
+        An expired lock is taken over with a warning. The input files are
+        only hashed once the lock is taken, so a refusal never reads them.
+        """
+        key = period_key(period)
+        run_id = uuid.uuid4().hex
+        now = time.time()
+        started = datetime.datetime.now().isoformat(timespec="seconds")
+
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            held = connection.execute("SELECT * FROM run_locks WHERE client = ? AND period = ?",
+                                      (client, key)).fetchone()
+            if held is not None and held["expires"] > now:
+                raise RunLockError(f"{client} {key} is being processed by {held['operator']} on {held['host']} "
+                                   f"since {held['acquired']} (run {held['run_id']})")
+            if not rerun:
+                done = connection.execute("SELECT operator, host, finished, output_path FROM runs "
+                                          "WHERE client = ? AND period = ? AND status = ? "
+                                          "ORDER BY finished DESC LIMIT 1", (client, key, OK)).fetchone()
+                if done is not None:
+                    raise RunLockError(f"{client} {key} was already processed by {done['operator']} "
+                                       f"on {done['host']} at {done['finished']} "
+                                       f"({done['output_path'] or 'no output recorded'}); rerun to replace it")
+            if held is not None:
+                logging.warning(f"Taking over the expired lock of {client} {key} held by {held['operator']} "
+                                f"on {held['host']} since {held['acquired']}")
+                connection.execute("UPDATE runs SET status = ?, error = ? WHERE run_id = ? AND status = ?",
+                                   (FAILED, "lock expired", held["run_id"], RUNNING))
+            connection.execute("INSERT OR REPLACE INTO run_locks VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (client, key, run_id, self.operator, self.host, started, now + self.lock_ttl))
+            connection.execute("INSERT INTO runs (run_id, client, period, operator, host, status, started, csv_path, "
+                               "eft_path) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                               (run_id, client, key, self.operator, self.host, RUNNING, started, csv_path, eft_path))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+        # Hashing reads both inputs in full, so it happens with the lock held rather than before the check
+        try:
+            connection.execute("UPDATE runs SET csv_sha256 = ?, eft_sha256 = ? WHERE run_id = ?",
+                               (_hash(csv_path), _hash(eft_path), run_id))
+        except BaseException as e:
+            self.finish(run_id, error=f"hashing the inputs failed: {e}")
+            raise
+        logging.info(f"Run {run_id} of {client} {key} registered in {self.db_path}")
+        return run_id
+
+    def finish(self, run_id, output_path=None, summary=None, error=None):
+        """Record the outcome of a run and release its lock"""
+        summary = summary or {}
+        finished = datetime.datetime.now()
+        output_sha256 = _hash(output_path) if error is None else None
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            started = connection.execute("SELECT started FROM runs WHERE run_id = ?", (run_id,)).fetchone()
+            if started is None:
+                raise ValueError(f"Unknown run {run_id}")
+            seconds = (finished - datetime.datetime.fromisoformat(started["started"])).total_seconds()
+            connection.execute("UPDATE runs SET status = ?, finished = ?, seconds = ?, output_path = ?, "
+                               "output_sha256 = ?, rows = ?, total_due_cents = ?, error = ? WHERE run_id = ?",
+                               (FAILED if error is not None else OK, finished.isoformat(timespec="seconds"),
+                                seconds, output_path, output_sha256, summary.get("rows"),
+                                summary.get("total_due_cents"), error, run_id))
+            connection.execute("DELETE FROM run_locks WHERE run_id = ?", (run_id,))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+
+    def release(self, client, period=None):
+        """Remove the lock of a client and period by hand (its run is marked failed); returns True if one was held"""
+        key = period_key(period)
+        connection = self._connection
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            held = connection.execute("SELECT run_id FROM run_locks WHERE client = ? AND period = ?",
+                                      (client, key)).fetchone()
+            if held is not None:
+                connection.execute("UPDATE runs SET status = ?, error = ? WHERE run_id = ? AND status = ?",
+                                   (FAILED, f"lock released by {self.operator}", held["run_id"], RUNNING))
+                connection.execute("DELETE FROM run_locks WHERE client = ? AND period = ?", (client, key))
+            connection.execute("COMMIT")
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        return held is not None
+
+    @contextlib.contextmanager
+    def run(self, client, period=None, csv_path=None, eft_path=None, output_path=None, rerun=False):
+        """Hold the lock of a client and period for a block; yields a dict to put the run summary in.
+
+        The run is recorded as ok when the block completes, or failed with
+        the error when it raises.
+        """
+        run_id = self.acquire(client, period, csv_path, eft_path, rerun)
+        summary = {}
+        try:
+            yield summary
+        except BaseException as e:
+            self.finish(run_id, output_path, summary, error=str(e) or type(e).__name__)
+            raise
+        self.finish(run_id, output_path, summary)
+
+
+def format_runs(runs):
+    """Render registry runs for the console, one line each"""
+    lines = []
+    for run in runs:
+        line = (f"{run['started']}  {run['client']} {run['period']}  {run['status']:<8}"
+                f"{run['operator']}@{run['host']}")
+        if run["seconds"] is not None:
+            line += f"  {run['seconds']:.1f}s"
+        if run["output_path"]:
+            line += f"  {run['output_path']}"
+        if run["output_sha256"]:
+            line += f" ({run['output_sha256'][:12]})"
+        if run["error"]:
+            line += f"  error: {run['error']}"
+        lines.append(line)
+    return "\n".join(lines)
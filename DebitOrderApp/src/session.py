@@ -0,0 +1,165 @@
+"""The data of one reconciliation session, held once.
+
+The loaded EFT records are the only full-size frame. Reconciling adds two
+arrays next to them, the new amounts (int64 cents) and the matched mask,
+instead of a copied and merged frame. The updated records and the results are
+built on demand as views that share the record columns (pandas copy-on-write
+only copies a column when it is modified), and every derived state such as
+unmatched or zeroed records is a boolean mask over the same rows.
+
+Text columns with few distinct values (the constant SABRE RADIO and N fields,
+branch codes, company names) are stored as categoricals, so they hold one
+small integer per record instead of one Python string per record.
+"""
+import logging
+import os
+
+import numpy as np
+import pandas as pd
+
+import dry_run
+import eft_io
+import processing
+from gaps import find_gaps
+from keys import join_amounts
+from layouts import DEFAULT_LAYOUT
+from policy import DEFAULT_POLICY
+
+# Text columns with at most this share of distinct values are stored as categoricals
+CATEGORY_RATIO = 0.5
+
+
+def compact_records(frame, max_ratio=CATEGORY_RATIO):
+    """Store the repetitive text columns of a frame as categoricals (in place) and return it"""
+    for name in frame.columns:
+        column = frame[name]
+        if isinstance(column.dtype, pd.CategoricalDtype) or not pd.api.types.is_string_dtype(column) \
+                or len(column) == 0:
+            continue
+        codes, uniques = pd.factorize(column)
+        if len(uniques) <= max_ratio * len(column):
+            frame[name] = pd.Categorical.from_codes(codes, categories=uniques)
+    return frame
+
+
+class Session:
+    """Loaded EFT records and bill run, and the reconciliation between them"""
+
+    def __init__(self, layout=DEFAULT_LAYOUT, policy=DEFAULT_POLICY, period=None):
+        self.layout = layout
+        self.policy = policy
+        self.period = period
+        self.header_line = None
+        self.eft_format = None
+        self.eft_source = ""
+        self.master = None
+        self.master_added = 0
+        self.records = None
+        self.format_issues = None
+        self.billing = None
+        self.new_cents = None
+        self.matched = None
+        self.gaps = None
+
+    @property
+    def has_records(self):
+        return self.records is not None
+
+    @property
+    def has_billing(self):
+        return self.billing is not None
+
+    @property
+    def reconciled(self):
+        return self.new_cents is not None
+
+    def load_billing(self, file_path):
+        """Load the bill run CSV (consolidated per SabreCode); any earlier reconciliation is dropped"""
+        self.release_reconciliation()
+        self.billing = processing.load_billing_csv(file_path, self.policy, self.period)
+        return self.billing
+
+    def load_eft(self, file_path):
+        """Load the previous .eft file; any earlier reconciliation is dropped"""
+        self.release_reconciliation()
+        self.records = None  # Let the old records go before the new ones are parsed
+        self.master_added = 0
+        self.header_line, records, self.format_issues = processing.load_eft_file(file_path, self.layout)
+        self.eft_format = eft_io.sniff_file(file_path)
+        self.eft_source = os.path.basename(file_path)
+        self.records = compact_records(records)
+        return self.records
+
+    def reconcile(self, release_billing=False):
+        """Look up the new TotalDue of every record; unmatched records get 0 cents.
+
+        Returns the matched mask and keeps the reconciliation gaps (see gaps).
+        With release_billing the bill run is dropped afterwards, since only
+        the looked up amounts are needed from then on.
+        With a customer master, billed customers missing from the records are
+        added first (see processing.add_master_records).
+        """
+        if self.master is not None:
+            records, added = processing.add_master_records(self.records, self.billing, self.master, self.eft_source)
+            if added:
+                self.records = compact_records(records)
+            self.master_added += added
+        self.new_cents, self.matched = join_amounts(self.records["SabreCode"], self.billing["SabreCode"],
+                                                    self.billing["TotalDue"])
+        logging.info(f"{int(self.matched.sum()):,} of {len(self.matched):,} EFT records matched a billing record")
+        self.gaps = find_gaps(self.records, self.billing)
+        if release_billing:
+            self.release_billing()
+        return self.matched
+
+    def updated_frame(self):
+        """The records with the new TotalDue, sharing every other column with the loaded records"""
+        updated = self.records.copy(deep=False)
+        updated["TotalDue"] = self.new_cents
+        return updated
+
+    def results_frame(self, mask=None):
+        """The reconciled results (amounts in Rands), optionally only the rows selected by mask"""
+        results = processing.build_results_frame(self.records, self.updated_frame(), self.matched)
+        return results if mask is None else results[np.asarray(mask, dtype=bool)].reset_index(drop=True)
+
+    def dry_run(self, sample_lines=dry_run.SAMPLE_LINES, duplicates=None):
+        """Project the new .eft file without writing it, see dry_run.simulate"""
+        return dry_run.simulate(self.records, self.updated_frame(), self.matched, layout=self.layout,
+                                header_line=self.header_line, eft_format=self.eft_format, sample_lines=sample_lines,
+                                duplicates=duplicates)
+
+    def unmatched_mask(self):
+        """Records whose SabreCode has no billing record"""
+        return ~self.matched
+
+    def zeroed_mask(self):
+        """Records that owed something last month and owe nothing now"""
+        prev = self.records["TotalDue"].to_numpy(dtype=float, na_value=0)
+        return (self.new_cents == 0) & (prev > 0)
+
+    def changed_mask(self):
+        """Records whose TotalDue differs from last month"""
+        prev = self.records["TotalDue"].astype("Int64").to_numpy(dtype=np.int64, na_value=0)
+        return self.new_cents != prev
+
+    def release_billing(self):
+        """Drop the bill run once its amounts have been looked up"""
+        self.billing = None
+
+    def release_reconciliation(self):
+        """Drop the looked up amounts, matched mask and gaps"""
+        self.new_cents = None
+        self.matched = None
+        self.gaps = None
+
+    def memory_usage(self):
+        """Bytes held by the session's records, bill run and reconciliation arrays"""
+        total = 0
+        for frame in (self.records, self.billing):
+            if frame is not None:
+                total += int(frame.memory_usage(index=True, deep=True).sum())
+        for array in (self.new_cents, self.matched):
+            if array is not None:
+                total += array.nbytes
+        return total
@@ -0,0 +1,172 @@
+"""Snapshots of a reconciliation session, so the app can resume after it is closed or crashes.
+
+A snapshot is written with pickle protocol 5 and out-of-band buffers: the
+bulk data of the session (numeric columns, categorical codes, the new amounts
+and the matched mask) is not copied into the pickle stream but written as raw
+buffers after it. Restoring reads the whole file into one bytearray and hands
+slices of it back to pickle, so the arrays are rebuilt on that memory without
+decoding or copying them again.
+
+File layout: MAGIC, the length of a JSON header (8 bytes, little endian), the
+header (version, stage and counts for the restore prompt, and the offset and
+length of the pickle stream and of every buffer), then the pickle stream and
+the buffers, each starting on a BUFFER_ALIGNMENT boundary.
+
+Snapshots are pickles: only restore snapshots this app wrote.
+"""
+import datetime
+import json
+import logging
+import os
+import pickle
+import struct
+import time
+
+from customer_master import CustomerMaster
+from session import Session
+
+MAGIC = b"DOSNAP\r\n"
+SNAPSHOT_VERSION = 1
+BUFFER_ALIGNMENT = 64
+
+# Default location of the GUI's snapshot
+SNAPSHOT_DIR = os.path.join(os.path.expanduser("~"), ".debit_order_app")
+SNAPSHOT_NAME = "session.snapshot"
+
+# Session attributes kept in a snapshot (the customer master is reopened from its path)
+SESSION_FIELDS = ["layout", "policy", "period", "header_line", "eft_format", "eft_source", "master_added",
+                  "records", "format_issues", "billing", "new_cents", "matched", "gaps"]
+
+_LENGTH = struct.Struct("<Q")
+
+
+def default_snapshot_path():
+    return os.path.join(SNAPSHOT_DIR, SNAPSHOT_NAME)
+
+
+def session_stage(session):
+    """The furthest stage the session reached: empty, loaded or reconciled"""
+    if session.reconciled:
+        return "reconciled"
+    return "loaded" if session.has_records or session.has_billing else "empty"
+
+
+def _padding(offset):
+    return -offset % BUFFER_ALIGNMENT
+
+
+def write_snapshot(file_path, state, info=None):
+    """Write a picklable state to file_path, replacing any earlier snapshot only once complete.
+
+    info is a small JSON-serialisable dict stored in the header, readable
+    without loading the state (see read_snapshot_info).
+    """
+    start = time.perf_counter()
+    buffers = []
+    payload = pickle.dumps(state, protocol=5, buffer_callback=buffers.append)
+    views = [buffer.raw() for buffer in buffers]
+
+    # Offsets are relative to the end of the header
+    offset = len(payload)
+    extents = []
+    for view in views:
+        offset += _padding(offset)
+        extents.append((offset, view.nbytes))
+        offset += view.nbytes
+    header = json.dumps({
+        "version": SNAPSHOT_VERSION,
+        "saved": datetime.datetime.now().isoformat(timespec="seconds"),
+        "info": info or {},
+        "payload": len(payload),
+        "buffers": extents,
+        "size": offset,
+    }).encode("utf-8")
+
+    os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+    temp_path = f"{file_path}.tmp"
+    with open(temp_path, "wb") as file:
+        file.write(MAGIC + _LENGTH.pack(len(header)) + header)
+        file.write(payload)
+        written = len(payload)
+        for (position, _), view in zip(extents, views):
+            file.write(b"\0" * (position - written))
+            file.write(view)
+            written = position + view.nbytes
+        file.flush()
+        os.fsync(file.fileno())
+    os.replace(temp_path, file_path)
+    logging.info(f"Snapshot of {offset / 1e6:,.1f} MB ({len(views)} buffers) written to {file_path} "
+                 f"in {time.perf_counter() - start:.2f}s")
+
+
+def _read_header(file):
+    magic = file.read(len(MAGIC))
+    if magic != MAGIC:
+        raise ValueError(f"{file.name} is not a session snapshot")
+    (length,) = _LENGTH.unpack(file.read(_LENGTH.size))
+    header = json.loads(file.read(length).decode("utf-8"))
+    if header.get("version") != SNAPSHOT_VERSION:
+        raise ValueError(f"Snapshot {file.name} has version {header.get('version')}, "
+                         f"this version of the app reads version {SNAPSHOT_VERSION}")
+    return header
+
+
+def read_snapshot_info(file_path):
+    """Return the saved time and info of a snapshot without loading its state"""
+    with open(file_path, "rb") as file:
+        header = _read_header(file)
+    return {"saved": header["saved"], **header["info"]}
+
+
+def read_snapshot(file_path):
+    """Load the state of a snapshot; its arrays share one buffer read from the file"""
+    start = time.perf_counter()
+    with open(file_path, "rb") as file:
+        header = _read_header(file)
+        data = bytearray(header["size"])
+        if file.readinto(data) != len(data):
+            raise ValueError(f"Snapshot {file_path} is truncated")
+    view = memoryview(data)
+    buffers = [view[offset:offset + length] for offset, length in header["buffers"]]
+    state = pickle.loads(view[:header["payload"]], buffers=buffers)
+    logging.info(f"Snapshot {file_path} restored in {time.perf_counter() - start:.2f}s")
+    return state
+
+
+def save_session(session, file_path=None, extra=None):
+    """Snapshot a Session (and any extra picklable state of the caller, such as its duplicate check)"""
+    state = {name: getattr(session, name) for name in SESSION_FIELDS}
+    state["master_path"] = session.master.db_path if session.master is not None else None
+    state["extra"] = extra or {}
+    info = {
+        "stage": session_stage(session),
+        "records": len(session.records) if session.has_records else 0,
+        "billing": len(session.billing) if session.has_billing else 0,
+        "eft_source": session.eft_source,
+    }
+    write_snapshot(file_path or default_snapshot_path(), state, info)
+
+
+def restore_session(file_path=None):
+    """Rebuild the Session of a snapshot; returns (session, extra).
+
+    The customer master is reopened if its database is still there.
+    """
+    state = read_snapshot(file_path or default_snapshot_path())
+    session = Session(state["layout"], state["policy"], state["period"])
+    for name in SESSION_FIELDS:
+        setattr(session, name, state[name])
+    master_path = state["master_path"]
+    if master_path and os.path.exists(master_path):
+        session.master = CustomerMaster(master_path)
+    elif master_path:
+        logging.warning(f"Customer master {master_path} of the snapshot no longer exists")
+    return session, state["extra"]
+
+
+def discard_snapshot(file_path=None):
+    """Remove a snapshot if there is one"""
+    try:
+        os.remove(file_path or default_snapshot_path())
+    except FileNotFoundError:
+        pass
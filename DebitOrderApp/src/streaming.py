@@ -0,0 +1,229 @@
+"""Streaming bill run: the .eft file flows through parse, lookup, format and write in batches.
+
+run_pipeline holds the whole bill run, the EFT records and the updated copy
+in memory at once. In streaming mode only the billing totals are held, as a
+hash index from canonical SabreCode to cents. The .eft file is read a block
+at a time, and each batch of records is parsed, looked up, formatted and
+written (and its rows appended to the Excel detail sheet) before the next
+batch is read. Peak memory is set by the batch size and the number of billed
+customers, not by the size of the .eft file, and the first records reach the
+output while the rest of the input is still unread.
+
+What needs every record at once is not available in this mode: the duplicate
+check, the summary, rollup and trend sheets of the Excel report and resuming
+an interrupted write. The reconciliation gaps are kept as the run goes (the
+unmatched records of each batch, then the billed codes never looked up), so
+the summary and the Excel report still show them. The .eft output is byte-identical to run_pipeline's,
+except that a file found not to be UTF-8 after its first block is still
+written as UTF-8, since its first batches may already be written.
+"""
+import logging
+import os
+import time
+
+import numpy as np
+import pandas as pd
+
+import customer_master
+import eft_io
+import metrics
+import processing
+import verbatim
+from atomic_writer import AtomicEftWriter
+from format_issues import collect_format_issues
+from gaps import RECORD_COLUMNS as GAP_RECORD_COLUMNS, ReconciliationGaps
+from keys import normalize_codes
+from layouts import DEFAULT_LAYOUT, get_layout
+from policy import DEFAULT_POLICY
+from report_builder import DETAIL_SHEET, GAPS_SHEET, column_styles, detail_frame
+from xlsx_stream import XlsxStreamWriter
+
+# Records per batch
+BATCH_LINES = 50_000
+
+
+class BillingIndex:
+    """Consolidated bill run amounts (int64 cents) by canonical SabreCode, as a hash index"""
+
+    def __init__(self, billing_df):
+        self.codes = pd.Index(billing_df["SabreCode"].to_numpy(dtype=object))
+        self.cents = np.asarray(billing_df["TotalDue"], dtype=np.int64)
+        self.seen = np.zeros(len(self.codes), dtype=bool)
+
+    @classmethod
+    def from_csv(cls, file_path, policy=DEFAULT_POLICY, period=None):
+        return cls(processing.load_billing_csv(file_path, policy, period))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def lookup(self, codes):
+        """Return the amounts of codes (0 where unbilled) and the matched mask, marking the billed codes as seen"""
+        positions = self.codes.get_indexer(normalize_codes(codes).to_numpy(dtype=object))
+        matched = positions >= 0
+        self.seen[positions[matched]] = True
+        return np.where(matched, self.cents[positions], 0), matched
+
+    def unseen(self):
+        """Return the canonical codes and amounts of the billed customers not looked up so far"""
+        return self.codes[~self.seen].tolist(), self.cents[~self.seen]
+
+
+def parse_batches(batches, layout):
+    """Parse each EftText batch, yielding (batch, ParsedRecords)"""
+    for batch in batches:
+        with metrics.stage("parse") as stage:
+            parsed = layout.parse_lines(batch.lines, encoding=batch.encoding)
+            stage.rows = len(batch.lines)
+        metrics.inc("rows_parsed_total", len(batch.lines))
+        yield batch, parsed
+
+
+def reconcile_batches(parsed_batches, billing, master=None, source=""):
+    """Look up the new amounts of each parsed batch, yielding (batch, parsed, updated records, matched mask)"""
+    for batch, parsed in parsed_batches:
+        if master is not None:
+            with metrics.stage("master") as stage:
+                master.refresh(parsed.frame, source)
+                stage.rows = len(parsed.frame)
+        with metrics.stage("match") as stage:
+            updated = parsed.frame.copy(deep=False)
+            updated["TotalDue"], matched = billing.lookup(parsed.frame["SabreCode"])
+            stage.rows = len(updated)
+        metrics.inc("rows_matched_total", int(matched.sum()))
+        metrics.inc("rows_unmatched_total", int((~matched).sum()))
+        yield batch, parsed, updated, matched
+
+
+@metrics.run()
+def run_streaming(csv_path, eft_path, eft_output_path, excel_output_path=None, layout=DEFAULT_LAYOUT,
+                  master_path=None, verbatim_records=False, policy=DEFAULT_POLICY, period=None,
+                  batch_lines=BATCH_LINES):
+    """Run a bill run in streaming mode, writing the .eft file (and the Excel detail sheet) batch by batch.
+
+    The options are those of processing.run_pipeline that work on one batch
+    at a time. Billed customers added from the customer master are written
+    after the last batch, as run_pipeline does. Returns a dict summarising
+    the run.
+    """
+    start = time.perf_counter()
+    layout = get_layout(layout)
+    with metrics.stage("billing") as stage:
+        billing = BillingIndex.from_csv(csv_path, policy, period)
+        stage.rows = len(billing)
+    eft_format = eft_io.sniff_file(eft_path)
+    master = customer_master.CustomerMaster(master_path) if master_path else None
+
+    summary = {"rows": 0, "matched": 0, "unmatched": 0, "format_issues": 0, "master_added": 0,
+               "total_due_cents": 0, "eft_output": eft_output_path, "excel_output": excel_output_path}
+    excel = XlsxStreamWriter(excel_output_path) if excel_output_path else None
+    sheet = None
+    eft_only = []
+    completed = False
+    try:
+        with AtomicEftWriter(eft_output_path, **eft_format.writer_options()) as writer:
+            batches = eft_io.read_eft_batches(eft_path, batch_lines)
+            stream = reconcile_batches(parse_batches(batches, layout), billing, master, os.path.basename(eft_path))
+            for batch, parsed, updated, matched in stream:
+                with metrics.stage("write") as stage:
+                    offset = writer.offset
+                    if writer.lines == 0:
+                        writer.write_header(batch.header_line)
+                    if verbatim_records:
+                        raw = verbatim.RawRecords(batch.lines, parsed.aligned, batch.encoding)
+                        writer.write_records(verbatim.splice_records(raw, updated, layout))
+                    else:
+                        writer.write_records(layout.format_frame(updated))
+                    stage.rows = len(updated)
+                metrics.inc("rows_written_total", len(updated))
+                metrics.inc("bytes_written_total", writer.offset - offset)
+                if summary["rows"] == 0 and len(updated):
+                    logging.info(f"First records written after {time.perf_counter() - start:.2f}s")
+
+                summary["format_issues"] += len(collect_format_issues(
+                    batch.header_line, batch.text_lines(~parsed.clean), parsed.rows, batch.line_numbers,
+                    layout.widths, parsed.clean, layout.starts))
+                sheet = _append_results(excel, sheet, parsed.frame, updated, matched)
+                _count(summary, updated, matched)
+                eft_only.append(parsed.frame.loc[~matched, GAP_RECORD_COLUMNS + ["TotalDue"]])
+
+            unknown = None
+            if master is not None:
+                records, updated, unknown = _master_records(billing, master, layout)
+                offset = writer.offset
+                writer.write_records(layout.format_frame(updated))
+                metrics.inc("rows_written_total", len(updated))
+                metrics.inc("bytes_written_total", writer.offset - offset)
+                sheet = _append_results(excel, sheet, records, updated, np.ones(len(updated), dtype=bool))
+                _count(summary, updated, np.ones(len(updated), dtype=bool))
+                summary["master_added"] = len(updated)
+            gaps = _gaps(billing, eft_only, unknown)
+            summary.update(gaps.summary())
+            if excel is not None:
+                if sheet is not None:
+                    sheet.close()
+                    sheet = None
+                frame = gaps.frame()
+                excel.write_frame(GAPS_SHEET, frame, column_styles(frame))
+        completed = True
+    finally:
+        if master is not None:
+            master.close()
+        if excel is not None:
+            if completed:
+                excel.close()
+            else:
+                excel.abort()  # A failed run leaves no partial report behind
+
+    logging.info(f"Streamed {summary['rows']:,} records to {eft_output_path} in {time.perf_counter() - start:.2f}s")
+    return summary
+
+
+def _master_records(billing, master, layout):
+    """Records for the billed customers that were in no batch, filled from the master, and their updated copy"""
+    codes, cents = billing.unseen()
+    records, unknown = customer_master.records_for_codes(codes, list(layout.names), master)
+    if unknown:
+        logging.warning(f"{len(unknown):,} billed customers have no banking details: {', '.join(unknown[:10])}"
+                        f"{' ...' if len(unknown) > 10 else ''}")
+    if len(records):
+        logging.info(f"Added {len(records):,} billed customers from the customer master")
+    known = ~np.isin(np.asarray(codes, dtype=object), np.asarray(unknown, dtype=object))
+    updated = records.copy(deep=False)
+    updated["TotalDue"] = cents[known]
+    return records, updated, unknown
+
+
+def _gaps(billing, eft_only, unknown=None):
+    """The reconciliation gaps: the unmatched records of every batch and the billed codes no record carries.
+
+    unknown are the billed codes the customer master had no record for, when
+    one was used; otherwise every billed code never looked up is billing-only.
+    """
+    codes, cents = billing.unseen()
+    if unknown is not None:
+        missing = np.isin(np.asarray(codes, dtype=object), np.asarray(unknown, dtype=object))
+        codes, cents = np.asarray(codes, dtype=object)[missing], cents[missing]
+    records = pd.concat(eft_only, ignore_index=True) if eft_only else \
+        pd.DataFrame(columns=GAP_RECORD_COLUMNS + ["TotalDue"])
+    return ReconciliationGaps(records, pd.DataFrame({"SabreCode": codes, "TotalDue": cents}))
+
+
+def _append_results(excel, sheet, records, updated, matched):
+    """Append the results rows of one batch to the Excel detail sheet (opened with the first batch)"""
+    if excel is None:
+        return None
+    with metrics.stage("excel") as stage:
+        results = detail_frame(processing.build_results_frame(records, updated, matched))
+        if sheet is None:
+            sheet = excel.open_frame_sheet(DETAIL_SHEET, results.columns)
+        sheet.append(results, column_styles(results))
+        stage.rows = len(results)
+    return sheet
+
+
+def _count(summary, updated, matched):
+    summary["rows"] += len(updated)
+    summary["matched"] += int(matched.sum())
+    summary["unmatched"] += int((~matched).sum())
+    summary["total_due_cents"] += int(np.asarray(updated["TotalDue"], dtype=np.int64).sum())
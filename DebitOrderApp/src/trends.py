@@ -0,0 +1,203 @@
+"""Multi-month trends of each customer's debit, from the archived .eft files.
+
+The archive is loaded once into an aligned customers x months matrix of
+amounts in cents (NaN where a customer has no debit that month). Rolling
+counts, means and standard deviations over any window come from cumulative
+sums along the month axis, so every statistic for every customer and month
+is a handful of whole-matrix operations. The new debits are compared with the
+windows ending at the latest archived month.
+"""
+import logging
+import time
+
+import numpy as np
+import pandas as pd
+
+import archive
+from keys import intern_codes, sum_by_key
+from layouts import DEFAULT_LAYOUT, get_layout
+from money import cents_to_rands, TOTAL_DUE_CENTS
+
+# Trailing windows, in months, that every new debit is compared with
+TREND_WINDOWS = (3, 6, 12)
+
+# A debit this many standard deviations away from its average is flagged
+Z_THRESHOLD = 3.0
+
+# Months of history a window needs before its z-score is used for flagging
+MIN_HISTORY_MONTHS = 3
+
+# Floor for the standard deviation, so a jump in a perfectly steady debit is still flagged
+STD_FLOOR_CENTS = 100
+
+AMOUNT_COLUMNS = [f"Avg{window}M" for window in TREND_WINDOWS] + ["Deviation"]
+
+
+class History:
+    """Archived amounts as a customers x months matrix of cents"""
+
+    def __init__(self, codes, periods, amounts):
+        self.codes = np.asarray(codes, dtype=object)
+        self.periods = list(periods)
+        self.amounts = np.asarray(amounts, dtype=np.float64)
+        self._cumulative = None
+
+    @classmethod
+    def from_periods(cls, period_amounts):
+        """Build the matrix from a dict of period to (codes, cents), in any order"""
+        periods = sorted(period_amounts)
+        code_columns = [period_amounts[period][0] for period in periods]
+        ids, categories = intern_codes(*code_columns) if periods else ([], np.array([], dtype=object))
+
+        amounts = np.full((len(categories), len(periods)), np.nan)
+        for month, (period_ids, period) in enumerate(zip(ids, periods)):
+            amounts[period_ids, month] = np.asarray(period_amounts[period][1], dtype=np.float64)
+
+        # Blank codes cannot be matched to anyone
+        keep = categories != ""
+        return cls(categories[keep], periods, amounts[keep])
+
+    def __len__(self):
+        return len(self.codes)
+
+    def rows_for(self, codes):
+        """Return the history row of each code (-1 where the customer has no history)"""
+        (history_ids, target_ids), categories = intern_codes(self.codes, codes)
+        row_of_id = np.full(len(categories), -1, dtype=np.int64)
+        row_of_id[history_ids] = np.arange(len(history_ids))
+        return row_of_id[target_ids]
+
+    def rolling(self, window):
+        """Rolling statistics over the trailing window months, see rolling_stats"""
+        if self._cumulative is None:
+            self._cumulative = cumulative_sums(self.amounts)
+        return rolling_stats(self._cumulative, window)
+
+
+def cumulative_sums(amounts):
+    """Prefix sums along the month axis that any rolling window is computed from.
+
+    Returns the row offsets and the prefix sums of the counts, the amounts and
+    their squares (each with a leading zero column). Rows are centred on their
+    first amount so the sums of squares stay well conditioned.
+    """
+    present = ~np.isnan(amounts)
+    first = np.where(present.any(axis=1), amounts[np.arange(len(amounts)), present.argmax(axis=1)], 0.0)
+    centred = np.where(present, amounts - first[:, None], 0.0)
+
+    prefix = np.zeros((3, amounts.shape[0], amounts.shape[1] + 1))
+    np.cumsum(present, axis=1, out=prefix[0, :, 1:])
+    np.cumsum(centred, axis=1, out=prefix[1, :, 1:])
+    np.cumsum(centred * centred, axis=1, out=prefix[2, :, 1:])
+    return first, prefix
+
+
+def rolling_stats(cumulative, window):
+    """Return the rolling count, mean and sample standard deviation of a customers x months matrix.
+
+    cumulative comes from cumulative_sums. Every month's window covers the
+    trailing window months (fewer at the start) and skips missing months. The
+    mean is NaN without any amounts in the window and the standard deviation
+    without at least two.
+    """
+    first, prefix = cumulative
+    ends = np.arange(1, prefix.shape[2])
+    counts, sums, squares = prefix[:, :, ends] - prefix[:, :, np.maximum(ends - window, 0)]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        means = sums / counts
+        variances = (squares - sums * means) / (counts - 1)
+    means = np.where(counts > 0, means + first[:, None], np.nan)
+    stds = np.where(counts > 1, np.sqrt(np.maximum(variances, 0.0)), np.nan)
+    return counts.astype(np.int64), means, stds
+
+
+def _period_amounts(archive_path, layout):
+    """Return (period, codes, cents) for one archived .eft file"""
+    eft_archive = archive.EftArchive(archive_path)
+    lines = eft_archive.read_text().splitlines()[1:]
+    frame = get_layout(layout).parse_lines([line for line in lines if line.strip()]).frame
+    cents = frame["TotalDue"].fillna(0).to_numpy(dtype=np.int64)
+    return eft_archive.period, frame["SabreCode"], cents
+
+
+def load_history(archive_dir, months=max(TREND_WINDOWS), layout=DEFAULT_LAYOUT):
+    """Load the latest months of archived .eft files into a History.
+
+    Archives of the same period are added together, as are repeated SabreCodes.
+    """
+    start = time.perf_counter()
+    by_period = {}
+    for path in archive.list_archives(archive_dir):
+        by_period.setdefault(archive.EftArchive(path).period, []).append(path)
+    periods = sorted(by_period)[-months:] if months else sorted(by_period)
+
+    period_amounts = {}
+    for period in periods:
+        parts = [_period_amounts(path, layout) for path in by_period[period]]
+        codes = pd.concat([part[1] for part in parts], ignore_index=True)
+        period_amounts[period] = sum_by_key(codes, np.concatenate([part[2] for part in parts]))
+
+    history = History.from_periods(period_amounts)
+    logging.info(f"Loaded {len(history):,} customers x {len(periods)} months of history from {archive_dir} "
+                 f"in {time.perf_counter() - start:.2f}s")
+    return history
+
+
+def trend_frame(results_df, history, windows=TREND_WINDOWS, z_threshold=Z_THRESHOLD):
+    """Compare every new debit with its trailing averages.
+
+    Returns one row per customer with history: the average and z-score of the
+    new TotalDue for each window, its deviation from the longest window's
+    average and TrendFlag where every window with enough history gives a
+    z-score of at least z_threshold. Flagged customers come first, largest deviation
+    first.
+    """
+    start = time.perf_counter()
+    rows = history.rows_for(results_df["SabreCode"])
+    known = rows >= 0
+    rows = rows[known]
+    current = results_df[TOTAL_DUE_CENTS].to_numpy(dtype=np.int64)[known].astype(np.float64)
+
+    frame = results_df.loc[known, ["SabreCode", "CompanyName", "TotalDue"]].reset_index(drop=True)
+    frame["Months"] = history.rolling(max(windows))[0][rows, -1]
+    flagged = np.zeros(len(rows), dtype=bool)
+    checked = np.zeros(len(rows), dtype=bool)
+    strongest = np.zeros(len(rows))
+    for window in windows:
+        counts, means, stds = history.rolling(window)
+        count, mean, std = counts[rows, -1], np.round(means[rows, -1]), stds[rows, -1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_scores = (current - mean) / np.maximum(std, STD_FLOOR_CENTS)
+        usable = (count >= MIN_HISTORY_MONTHS) & ~np.isnan(z_scores)
+        exceeds = np.abs(z_scores) >= z_threshold
+        flagged = np.where(usable, (flagged | ~checked) & exceeds, flagged)
+        checked |= usable
+        strongest = np.maximum(strongest, np.where(usable, np.abs(z_scores), 0))
+
+        frame[f"Avg{window}M"] = cents_to_rands(mean)
+        frame[f"Z{window}M"] = np.round(z_scores, 2)
+        if window == max(windows):
+            frame["Deviation"] = cents_to_rands(current - mean)
+    frame["TrendFlag"] = flagged
+
+    order = np.lexsort((-strongest, ~flagged))
+    logging.info(f"Trends for {len(frame):,} customers computed in {(time.perf_counter() - start) * 1000:.1f} ms "
+                 f"({int(flagged.sum()):,} flagged)")
+    return frame.iloc[order].reset_index(drop=True)
+
+
+def format_trend_flags(frame, limit=25):
+    """Render the flagged customers of a trend frame as plain text for the console"""
+    flagged = frame[frame["TrendFlag"]]
+    longest = max(TREND_WINDOWS)
+    lines = [f"Accounts deviating sharply from their trailing averages: {len(flagged):,}"]
+    if len(flagged):
+        lines.append(f"{'SabreCode':<10}{'CompanyName':<22}{'TotalDue':>14}{f'Avg{longest}M':>14}"
+                     f"{'Deviation':>14}{f'Z{longest}M':>9}")
+        for row in flagged.head(limit).itertuples(index=False):
+            average = getattr(row, f"Avg{longest}M")
+            z_score = getattr(row, f"Z{longest}M")
+            lines.append(f"{row.SabreCode:<10}{str(row.CompanyName)[:21]:<22}{row.TotalDue:>14,.2f}"
+                         f"{average:>14,.2f}{row.Deviation:>+14,.2f}{z_score:>9.1f}")
+    return "\n".join(lines)
@@ -0,0 +1,400 @@
+"""Watch-folder mode: process new bill runs as soon as they land in an inbox.
+
+A bill run is a CSV file plus the previous month's .eft file. They are paired
+by file name stem (billrun_2024-05.csv with billrun_2024-05.eft), or by the
+YYYY-MM in their names when exactly one unpaired file of each kind has it
+(billrun_2024-05.csv with SABRE_2024_05.eft). Files with nothing in common
+are only paired when the watcher is told to pair any lone CSV with any lone
+.eft. A pair is only processed once both files have stopped changing for the
+debounce interval. Outputs go to the outbox, the inputs are moved to
+inbox/processed (or inbox/failed), and every run is appended to
+outbox/runs.jsonl. With a run registry (see run_registry), each bill run
+also takes the registry lock of its client and period first, so operators
+watching other inboxes cannot process it at the same time; a bill run whose
+lock is held stays in the inbox and is tried again on the next scan. The
+period of a bill run is the YYYY-MM in its file name, or the watcher's
+period when the name has none.
+
+File system events come from watchdog when it is installed; otherwise the
+inbox is polled with os.scandir.
+"""
+import contextlib
+import datetime
+import json
+import logging
+import os
+import re
+import shutil
+import socket
+import threading
+import time
+
+import processing
+import run_registry
+from policy import DEFAULT_POLICY
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:  # watchdog is optional, polling works everywhere
+    Observer = None
+    FileSystemEventHandler = object
+
+# A billing period in a file name: 2024-05 or 2024_05
+PERIOD_PATTERN = re.compile(r"(?<!\d)(\d{4})[-_](0[1-9]|1[0-2])(?!\d)")
+
+LOCK_FILE_NAME = ".watcher.lock"
+
+# Age after which a watcher lock is stale even if its owner cannot be checked (another host)
+STALE_LOCK_SECONDS = 4 * 3600
+RUN_LOG_NAME = "runs.jsonl"
+
+
+class SingleFlightLock:
+    """Lock file that lets only one watcher process a given outbox at a time.
+
+    The lock file holds the host, PID and creation time of its owner. It is
+    written completely under a temporary name and then linked into place, so
+    another watcher never sees it half written. A lock from this host is stale
+    once its process is gone; a lock from another host (a shared outbox) can
+    only be judged by its age, so it is stale after STALE_LOCK_SECONDS.
+    """
+
+    def __init__(self, directory):
+        self.path = os.path.join(directory, LOCK_FILE_NAME)
+        self.host = socket.gethostname()
+        self._content = None
+
+    def _owner_text(self):
+        return json.dumps({"host": self.host, "pid": os.getpid(), "created": time.time()})
+
+    def _read(self, path):
+        with open(path, encoding="utf-8") as file:
+            return file.read()
+
+    def acquire(self):
+        """Try to take the lock without blocking; returns False if another process holds it"""
+        content = self._owner_text()
+        temp_path = f"{self.path}.{self.host}.{os.getpid()}.tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(content)
+        try:
+            _link_exclusive(temp_path, self.path)
+        except FileExistsError:
+            return self._take_over_stale()
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        self._content = content
+        return True
+
+    def _take_over_stale(self):
+        """Remove a stale lock and take it; returns False if the lock is live or another watcher got there first"""
+        try:
+            content = self._read(self.path)
+        except FileNotFoundError:
+            return self.acquire()  # Released in the meantime
+        if not self._is_stale(content):
+            return False
+
+        # Claim the stale file by renaming it, so two watchers cannot both remove it and both take the lock
+        claimed = f"{self.path}.{self.host}.{os.getpid()}.stale"
+        try:
+            os.replace(self.path, claimed)
+        except FileNotFoundError:
+            return False  # Another watcher claimed it first
+        try:
+            if self._read(claimed) != content:
+                # A fresh lock was taken after the check: put it back
+                try:
+                    _link_exclusive(claimed, self.path)
+                except FileExistsError:
+                    pass
+                return False
+        finally:
+            os.remove(claimed)
+        logging.warning(f"Removed the stale watcher lock {self.path}: {content}")
+        return self.acquire()
+
+    def release(self):
+        if self._content is None:
+            return
+        try:
+            if self._read(self.path) == self._content:
+                os.remove(self.path)
+        except FileNotFoundError:
+            pass
+        self._content = None
+
+    def _is_stale(self, content):
+        """A lock is stale when its process on this host is gone, or when it is older than STALE_LOCK_SECONDS"""
+        try:
+            owner = json.loads(content)
+            host, pid, created = owner["host"], int(owner["pid"]), float(owner["created"])
+        except (ValueError, KeyError, TypeError):
+            # Not written by this version: only its age can tell
+            return time.time() - os.path.getmtime(self.path) > STALE_LOCK_SECONDS
+        if time.time() - created > STALE_LOCK_SECONDS:
+            return True
+        if host != self.host:
+            return False
+        try:
+            os.kill(pid, 0)
+        except ProcessLookupError:
+            return True
+        except PermissionError:
+            return False
+        return False
+
+
+def _link_exclusive(source, destination):
+    """Give source the name destination too, failing with FileExistsError if destination exists"""
+    try:
+        os.link(source, destination)
+    except FileExistsError:
+        raise
+    except OSError:
+        if os.name != "nt":
+            raise
+        # Without hard links, Windows' rename also refuses to replace an existing file
+        os.rename(source, destination)
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_size, stat.st_mtime_ns
+
+
+def find_pairs(inbox, pair_any=False):
+    """Return (csv_path, eft_path) pairs waiting in the inbox.
+
+    Files pair on the same stem, then on the same YYYY-MM period when exactly
+    one unpaired CSV and one unpaired .eft have it. With pair_any, a lone CSV
+    and a lone .eft left over are paired whatever their names.
+    """
+    csv_files = {}
+    eft_files = {}
+    with os.scandir(inbox) as entries:
+        for entry in entries:
+            if not entry.is_file():
+                continue
+            stem, extension = os.path.splitext(entry.name)
+            if extension.lower() == ".csv":
+                csv_files[stem] = entry.path
+            elif extension.lower() == ".eft":
+                eft_files[stem] = entry.path
+
+    stems = csv_files.keys() & eft_files.keys()
+    pairs = [(csv_files[stem], eft_files[stem]) for stem in sorted(stems)]
+    lone_csv = {stem: path for stem, path in csv_files.items() if stem not in stems}
+    lone_eft = {stem: path for stem, path in eft_files.items() if stem not in stems}
+
+    csv_by_period = _by_period(lone_csv)
+    eft_by_period = _by_period(lone_eft)
+    for period in sorted(csv_by_period.keys() & eft_by_period.keys()):
+        if len(csv_by_period[period]) == 1 and len(eft_by_period[period]) == 1:
+            csv_stem, eft_stem = csv_by_period[period][0], eft_by_period[period][0]
+            pairs.append((lone_csv.pop(csv_stem), lone_eft.pop(eft_stem)))
+
+    if pair_any and len(lone_csv) == 1 and len(lone_eft) == 1:
+        csv_path, eft_path = next(iter(lone_csv.values())), next(iter(lone_eft.values()))
+        logging.warning(f"Pairing {os.path.basename(csv_path)} with {os.path.basename(eft_path)}, "
+                        f"which share neither a name nor a period")
+        pairs.append((csv_path, eft_path))
+    return pairs
+
+
+def _by_period(files):
+    """Group file name stems by the period in them; stems without one are left out"""
+    grouped = {}
+    for stem in sorted(files):
+        period = period_from_name(stem)
+        if period is not None:
+            grouped.setdefault(period, []).append(stem)
+    return grouped
+
+
+def period_from_name(file_name):
+    """Return the YYYY-MM billing period in a file name, or None"""
+    match = PERIOD_PATTERN.search(os.path.basename(file_name))
+    return f"{match.group(1)}-{match.group(2)}" if match else None
+
+
+class InboxWatcher:
+    """Process bill run pairs from an inbox into an outbox"""
+
+    def __init__(self, inbox, outbox, debounce=10.0, interval=5.0, excel=True, block_duplicates=False,
+                 master_path=None, verbatim_records=False, policy=DEFAULT_POLICY, registry_path=None, client=None,
+                 rerun=False, registry_journal=run_registry.DELETE, period=None, pair_any=False):
+        self.inbox = inbox
+        self.outbox = outbox
+        self.debounce = debounce
+        self.interval = interval
+        self.excel = excel
+        self.block_duplicates = block_duplicates
+        self.master_path = master_path
+        self.verbatim_records = verbatim_records
+        self.policy = policy
+        self.registry_path = registry_path
+        self.client = client or policy
+        self.rerun = rerun
+        self.registry_journal = registry_journal
+        self.period = period
+        self.pair_any = pair_any
+        self._signatures = {}
+        self._run_lock = threading.Lock()
+        self._wakeup = threading.Event()
+        os.makedirs(self.inbox, exist_ok=True)
+        os.makedirs(self.outbox, exist_ok=True)
+
+    def _is_settled(self, path, now):
+        """True once a file's size and mtime have not changed for the debounce interval"""
+        signature = _file_signature(path)
+        previous = self._signatures.get(path)
+        if previous is None:
+            # Files that were already quiet before the watcher saw them need no second look
+            self._signatures[path] = (signature, now)
+            return time.time() - signature[1] / 1e9 >= self.debounce
+        if previous[0] != signature:
+            self._signatures[path] = (signature, now)
+            return False
+        return now - previous[1] >= self.debounce
+
+    def scan_once(self):
+        """Process every settled pair in the inbox; returns the run records written"""
+        if not self._run_lock.acquire(blocking=False):
+            return []  # A scan is already running in this process
+        try:
+            now = time.monotonic()
+            ready = []
+            for csv_path, eft_path in find_pairs(self.inbox, self.pair_any):
+                try:
+                    # Check both files so each one's signature is recorded on the first pass
+                    settled = self._is_settled(csv_path, now) & self._is_settled(eft_path, now)
+                except FileNotFoundError:
+                    continue
+                if settled:
+                    ready.append((csv_path, eft_path))
+
+            if not ready:
+                return []
+
+            lock = SingleFlightLock(self.outbox)
+            if not lock.acquire():
+                logging.info("Another watcher is processing this outbox, skipping scan")
+                return []
+            try:
+                return [self.process_pair(csv_path, eft_path) for csv_path, eft_path in ready]
+            finally:
+                lock.release()
+        finally:
+            self._run_lock.release()
+
+    def process_pair(self, csv_path, eft_path):
+        """Run the pipeline for one pair, move the inputs away and record the run"""
+        stamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+        stem = os.path.splitext(os.path.basename(csv_path))[0]
+        eft_output = os.path.join(self.outbox, f"{stem}_{stamp}.eft")
+        excel_output = os.path.join(self.outbox, f"{stem}_{stamp}.xlsx") if self.excel else None
+
+        period = period_from_name(csv_path) or self.period
+
+        logging.info(f"Processing bill run {csv_path} with {eft_path}")
+        started = time.perf_counter()
+        record = {
+            "started": datetime.datetime.now().isoformat(timespec="seconds"),
+            "csv": os.path.basename(csv_path),
+            "eft": os.path.basename(eft_path),
+            "period": period,
+        }
+        try:
+            with self._registered(csv_path, eft_path, eft_output, period) as summary:
+                summary.update(processing.run_pipeline(csv_path, eft_path, eft_output, excel_output,
+                                                       block_duplicates=self.block_duplicates,
+                                                       master_path=self.master_path,
+                                                       verbatim_records=self.verbatim_records,
+                                                       policy=self.policy, period=period))
+            record.update(summary)
+            record["status"] = "ok"
+            destination = os.path.join(self.inbox, "processed", stamp)
+        except run_registry.RunLockError as e:
+            if self._lock_is_held(period):
+                # Another operator is processing this period: leave the files (and their signatures) for the next scan
+                logging.info(f"Bill run {csv_path} is waiting for the registry lock: {e}")
+                record["status"] = "busy"
+                record["error"] = str(e)
+                return record
+            # Already processed and no rerun asked for
+            logging.error(f"Bill run {csv_path} refused: {e}")
+            record["status"] = "failed"
+            record["error"] = str(e)
+            destination = os.path.join(self.inbox, "failed", stamp)
+        except Exception as e:
+            logging.error(f"Bill run {csv_path} failed: {e}", exc_info=True)
+            record["status"] = "failed"
+            record["error"] = str(e)
+            destination = os.path.join(self.inbox, "failed", stamp)
+        record["seconds"] = round(time.perf_counter() - started, 3)
+
+        os.makedirs(destination, exist_ok=True)
+        for path in (csv_path, eft_path):
+            shutil.move(path, os.path.join(destination, os.path.basename(path)))
+            self._signatures.pop(path, None)
+
+        with open(os.path.join(self.outbox, RUN_LOG_NAME), "a", encoding="utf-8") as log:
+            log.write(json.dumps(record) + "\n")
+        logging.info(f"Bill run {record['csv']} {record['status']} in {record['seconds']}s")
+        return record
+
+    def _lock_is_held(self, period):
+        """True if the registry lock of the bill run's client and period is held by a live run"""
+        with run_registry.RunRegistry(self.registry_path, self.registry_journal) as registry:
+            return registry.holder(self.client, period) is not None
+
+    @contextlib.contextmanager
+    def _registered(self, csv_path, eft_path, eft_output, period=None):
+        """Hold the registry lock of the bill run's period while it runs (if there is a registry)"""
+        if not self.registry_path:
+            yield {}
+            return
+        with run_registry.RunRegistry(self.registry_path, self.registry_journal) as registry, \
+                registry.run(self.client, period, csv_path, eft_path, eft_output, rerun=self.rerun) as summary:
+            yield summary
+
+    def run_forever(self):
+        """Watch the inbox until interrupted"""
+        observer = None
+        if Observer is not None:
+            observer = Observer()
+            observer.schedule(_WakeupHandler(self._wakeup), self.inbox, recursive=False)
+            observer.start()
+            logging.info(f"Watching {self.inbox} for file system events")
+        else:
+            logging.info(f"Polling {self.inbox} every {self.interval}s")
+
+        try:
+            while True:
+                self.scan_once()
+                # Re-check sooner while files are settling so the debounce is honoured
+                timeout = min(self.interval, self.debounce) if self._signatures else self.interval
+                if observer is not None and not self._signatures:
+                    timeout = None
+                self._wakeup.wait(timeout)
+                self._wakeup.clear()
+        except KeyboardInterrupt:
+            logging.info("Watcher stopped")
+        finally:
+            if observer is not None:
+                observer.stop()
+                observer.join()
+
+
+class _WakeupHandler(FileSystemEventHandler):
+    """Wake the watcher loop on any change in the inbox"""
+
+    def __init__(self, wakeup):
+        super().__init__()
+        self._wakeup = wakeup
+
+    def on_any_event(self, event):
+        self._wakeup.set()
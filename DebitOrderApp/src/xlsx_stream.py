@@ -0,0 +1,266 @@
+"""Minimal streaming .xlsx writer with a fixed set of shared styles.
+
+Worksheets are written straight into the zip archive in chunks of rows, and
+the cell XML of each chunk is built a whole column at a time with vectorized
+string operations, so a sheet never exists as per-cell Python objects.
+Strings are written inline, which keeps the workbook valid without a shared
+strings table. Only what the reports need is supported: text, numbers,
+booleans, blanks and the styles below.
+
+The workbook is written to a temporary file next to the destination and
+moved into place only once it is complete, so a failed report never leaves
+a truncated .xlsx behind (or replaces a good one).
+"""
+import os
+import re
+import zipfile
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+import pandas as pd
+
+# Shared cell styles, in cellXfs order (the position is the style id)
+HEADER = "header"
+BOLD = "bold"
+AMOUNT = "amount"
+NEGATIVE = "negative"
+POSITIVE = "positive"
+STYLE_IDS = {None: 0, HEADER: 1, BOLD: 2, AMOUNT: 3, NEGATIVE: 4, POSITIVE: 5}
+
+# Rows written per chunk of a frame
+CHUNK_ROWS = 50_000
+
+_INVALID_XML = r"[\x00-\x08\x0b\x0c\x0e-\x1f]"  # Control characters XML cannot hold
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/styles.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+    '{sheets}</Types>'
+)
+_SHEET_CONTENT_TYPE = (
+    '<Override PartName="/xl/worksheets/sheet{number}.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/></Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets>{sheets}</sheets></workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '{sheets}<Relationship Id="rId{styles_id}" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles" '
+    'Target="styles.xml"/></Relationships>'
+)
+# Fonts: regular, bold, red, blue. Fills: the two required ones plus the header colour.
+# Number format 2 is the built-in "0.00".
+_STYLES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<styleSheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<fonts count="4">'
+    '<font><sz val="11"/><name val="Calibri"/></font>'
+    '<font><b/><sz val="11"/><name val="Calibri"/></font>'
+    '<font><color rgb="FFFF0000"/><sz val="11"/><name val="Calibri"/></font>'
+    '<font><color rgb="FF0000FF"/><sz val="11"/><name val="Calibri"/></font>'
+    '</fonts>'
+    '<fills count="3">'
+    '<fill><patternFill patternType="none"/></fill>'
+    '<fill><patternFill patternType="gray125"/></fill>'
+    '<fill><patternFill patternType="solid"><fgColor rgb="FFCAF2F0"/><bgColor rgb="FFCAF2F0"/></patternFill></fill>'
+    '</fills>'
+    '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+    '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+    '<cellXfs count="6">'
+    '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+    '<xf numFmtId="0" fontId="1" fillId="2" borderId="0" xfId="0" applyFont="1" applyFill="1"/>'
+    '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+    '<xf numFmtId="2" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    '<xf numFmtId="2" fontId="2" fillId="0" borderId="0" xfId="0" applyNumberFormat="1" applyFont="1"/>'
+    '<xf numFmtId="2" fontId="3" fillId="0" borderId="0" xfId="0" applyNumberFormat="1" applyFont="1"/>'
+    '</cellXfs>'
+    '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+    '</styleSheet>'
+)
+_SHEET_START = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_SHEET_END = '</sheetData></worksheet>'
+
+
+def _style_attr(style):
+    style_id = STYLE_IDS[style]
+    return f' s="{style_id}"' if style_id else ""
+
+
+def _cell(value, style=None):
+    """Return the XML of one cell (used for small, row-by-row sheets)"""
+    attr = _style_attr(style)
+    if value is None or (isinstance(value, float) and np.isnan(value)):
+        return f"<c{attr}/>"
+    if isinstance(value, (bool, np.bool_)):
+        return f'<c{attr} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, np.integer)):
+        return f"<c{attr}><v>{int(value)}</v></c>"
+    if isinstance(value, (float, np.floating)):
+        return f"<c{attr}><v>{float(value)!r}</v></c>"
+    text = escape(re.sub(_INVALID_XML, "", str(value)))
+    return f'<c{attr} t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def _column_cells(values, style):
+    """Return the cell XML for every value of a column, as an object array"""
+    series = pd.Series(values)
+    missing = series.isna().to_numpy()
+    if isinstance(style, str) or style is None:
+        attrs = _style_attr(style)
+    else:
+        # One style per row, e.g. amounts coloured by their sign
+        attrs = pd.Series(np.asarray(style, dtype=object)).map(_style_attr)
+
+    if pd.api.types.is_bool_dtype(series):
+        cells = '<c' + attrs + ' t="b"><v>' + series.astype(int).astype(str) + '</v></c>'
+    elif pd.api.types.is_numeric_dtype(series):
+        cells = '<c' + attrs + '><v>' + series.astype(str) + '</v></c>'
+    else:
+        text = series.astype(str).str.replace(_INVALID_XML, "", regex=True)
+        for raw, entity in (("&", "&amp;"), ("<", "&lt;"), (">", "&gt;")):
+            text = text.str.replace(raw, entity, regex=False)
+        cells = '<c' + attrs + ' t="inlineStr"><is><t xml:space="preserve">' + text + '</t></is></c>'
+
+    cells = cells.to_numpy(dtype=object)
+    if missing.any():
+        blanks = '<c' + attrs + '/>'
+        cells[missing] = blanks if isinstance(blanks, str) else blanks.to_numpy(dtype=object)[missing]
+    return cells
+
+
+class FrameSheet:
+    """A sheet being written a chunk of rows at a time (see XlsxStreamWriter.open_frame_sheet)"""
+
+    def __init__(self, part):
+        self._part = part
+        self.rows = 0
+
+    def append(self, chunk, column_styles=None):
+        """Write the rows of a frame; column_styles is as for write_frame, relative to this chunk"""
+        column_styles = column_styles or {}
+        rows = np.full(len(chunk), "<row>", dtype=object)
+        for name in chunk.columns:
+            rows = rows + _column_cells(chunk[name].to_numpy(), column_styles.get(name))
+        if len(rows):
+            self._part.write(("</row>".join(rows) + "</row>").encode("utf-8"))
+        self.rows += len(chunk)
+
+    def close(self):
+        self._part.write(_SHEET_END.encode("utf-8"))
+        self._part.close()
+
+
+class XlsxStreamWriter:
+    """Write worksheets one after another into an .xlsx file.
+
+    Used as a context manager, the file is finished when the block completes
+    and discarded when it raises.
+    """
+
+    def __init__(self, file_path, compresslevel=1):
+        self.file_path = file_path
+        self.temp_path = f"{file_path}.tmp"
+        self._file = open(self.temp_path, "wb")
+        self._zip = zipfile.ZipFile(self._file, "w", zipfile.ZIP_DEFLATED, compresslevel=compresslevel)
+        self._titles = []
+        self._part = None
+
+    def _open_sheet(self, title):
+        self._titles.append(title)
+        self._part = self._zip.open(f"xl/worksheets/sheet{len(self._titles)}.xml", "w", force_zip64=True)
+        self._part.write(_SHEET_START.encode("utf-8"))
+        return self._part
+
+    def write_frame(self, title, frame, column_styles=None, header_style=HEADER):
+        """Write a DataFrame as a sheet with a header row.
+
+        column_styles maps column names to a style name, or to a sequence of
+        style names with one entry per row.
+        """
+        column_styles = column_styles or {}
+        sheet = self.open_frame_sheet(title, frame.columns, header_style)
+        for start in range(0, len(frame), CHUNK_ROWS):
+            styles = {name: style if isinstance(style, str) else style[start:start + CHUNK_ROWS]
+                      for name, style in column_styles.items() if style is not None}
+            sheet.append(frame.iloc[start:start + CHUNK_ROWS], styles)
+        sheet.close()
+
+    def open_frame_sheet(self, title, columns, header_style=HEADER):
+        """Start a sheet with a header row and return a FrameSheet to append chunks of rows to.
+
+        The sheet must be closed before the next one is started.
+        """
+        part = self._open_sheet(title)
+        header = "".join(_cell(str(name), header_style) for name in columns)
+        part.write(f"<row>{header}</row>".encode("utf-8"))
+        return FrameSheet(part)
+
+    def write_rows(self, title, rows):
+        """Write a sheet from (values, styles) rows, for small free-form sheets"""
+        part = self._open_sheet(title)
+        for values, styles in rows:
+            cells = "".join(_cell(value, style) for value, style in zip(values, styles))
+            part.write(f"<row>{cells}</row>".encode("utf-8"))
+        part.write(_SHEET_END.encode("utf-8"))
+        part.close()
+
+    def close(self):
+        """Write the workbook parts, finish the file and move it into place"""
+        count = len(self._titles)
+        numbers = range(1, count + 1)
+        self._zip.writestr("[Content_Types].xml", _CONTENT_TYPES.format(
+            sheets="".join(_SHEET_CONTENT_TYPE.format(number=n) for n in numbers)))
+        self._zip.writestr("_rels/.rels", _ROOT_RELS)
+        self._zip.writestr("xl/workbook.xml", _WORKBOOK.format(sheets="".join(
+            f'<sheet name={quoteattr(title[:31])} sheetId="{n}" r:id="rId{n}"/>'
+            for n, title in zip(numbers, self._titles))))
+        self._zip.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS.format(
+            styles_id=count + 1,
+            sheets="".join(
+                f'<Relationship Id="rId{n}" '
+                f'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+                f'Target="worksheets/sheet{n}.xml"/>' for n in numbers)))
+        self._zip.writestr("xl/styles.xml", _STYLES)
+        self._zip.close()
+        self._file.close()
+        os.replace(self.temp_path, self.file_path)
+
+    def abort(self):
+        """Discard the unfinished file; the destination is left as it was"""
+        if self._part is not None and not self._part.closed:
+            self._part.close()  # The zip cannot be closed while a sheet is open
+        self._zip.close()
+        self._file.close()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+        return False
@@ -0,0 +1,204 @@
+"""The .eft writer of the original app, kept to pin the golden files to it.
+
+write_baseline_eft is the load_csv_file, load_eft_file, update_data and
+create_new_eft_file path of the first version of DebitOrderApp/src/main.py,
+with the dialogs and widgets taken out and nothing else changed. The golden
+baseline.eft files are written by it once (tests/update_golden.py --baseline),
+and every line where the current output departs from it must be listed with
+one of the intended reasons in BASELINE_REASONS.
+"""
+import pandas as pd
+
+# Intended departures from the original writer, by the reason recorded in baseline_differences.json
+BASELINE_REASONS = {
+    "vat_cents": "VAT is applied to integer cents and rounded once, where the original truncated a float "
+                 "(amounts differ by a few cents)",
+    "unpadded_code": "Codes without leading zeros match their billing record, where the original wrote 0",
+    "field_split": "Records with a blank or extra field are parsed by position, where the original split on "
+                   "double spaces and shifted the remaining fields",
+}
+
+# Cents an amount may differ from the original's: its float product truncated at most one cent
+# too low, which the 4/9 rounding rule can turn into two
+VAT_CENTS_TOLERANCE = 2
+
+# Fields of the original writer's records, in order
+FIELD_COUNT = 9
+TOTAL_DUE_FIELD = 6
+
+
+def round_amount(amount):
+    """Round amount according to business rules"""
+    amount = int(amount)
+    last_digit = amount % 10
+
+    if last_digit in {4, 14, 24, 34, 44, 54, 64, 74, 84, 94}:
+        amount = (amount // 10) * 10 + 5
+    elif last_digit in {9, 19, 29, 39, 49, 59, 69, 79, 89, 99}:
+        amount = (amount // 10) * 10 + 10
+
+    return f"{amount:011d}"
+
+
+def load_billing(file_path):
+    with open(file_path, 'r', encoding='utf-8') as f:
+        first_line = f.readline().strip()
+    if first_line.startswith('sep='):
+        billing_df = pd.read_csv(file_path, skiprows=1)
+    else:
+        billing_df = pd.read_csv(file_path)
+    if 'CustomerCode' in billing_df.columns:
+        billing_df.rename(columns={'CustomerCode': 'SabreCode'}, inplace=True)
+    if 'SabreCode' not in billing_df.columns:
+        raise ValueError("Required column 'SabreCode' or 'CustomerCode' not found in CSV file")
+
+    billing_df = billing_df.groupby('SabreCode', as_index=False)['TotalDue'].sum()
+    billing_df['SabreCode'] = billing_df['SabreCode'].apply(lambda x: f"{str(x).zfill(7)}")
+    billing_df['TotalDue'] = billing_df['TotalDue'] * 1.15 * 100
+    billing_df['TotalDue'] = billing_df['TotalDue'].apply(round_amount)
+    return billing_df
+
+
+def split_record(line):
+    return [item.strip() for item in line.split('  ') if item.strip()]
+
+
+def load_eft(file_path):
+    with open(file_path, 'r', encoding='utf-8') as file:
+        lines = file.readlines()
+
+    processed_data = []
+    max_columns = 0
+    for line in lines[1:]:
+        line = line.strip()
+        if not line:
+            continue
+        split_line = split_record(line)
+        processed_data.append(split_line)
+        max_columns = max(max_columns, len(split_line))
+
+    for row in processed_data:
+        if len(row) < max_columns:
+            row.extend([''] * (max_columns - len(row)))
+
+    column_headings = [f"Column {i+1}" for i in range(max_columns)]
+    if max_columns >= 1: column_headings[0] = "SabreCode"  # noqa: E701
+    if max_columns >= 4: column_headings[3] = "BranchCode"  # noqa: E701
+    if max_columns >= 5: column_headings[4] = "AccNumber"  # noqa: E701
+    if max_columns >= 6: column_headings[5] = "CompanyName"  # noqa: E701
+    if max_columns >= 7: column_headings[6] = "TotalDue"  # noqa: E701
+    return pd.DataFrame(processed_data, columns=column_headings)
+
+
+def update(eft_file_df, billing_df):
+    updated_df = eft_file_df.copy()
+    updated_df = updated_df.merge(
+        billing_df[['SabreCode', 'TotalDue']],
+        on='SabreCode',
+        how='left',
+        suffixes=('', '_billing')
+    )
+    updated_df['TotalDue'] = updated_df['TotalDue_billing'].fillna(0)
+    updated_df.drop(columns=['TotalDue_billing'], inplace=True)
+    return updated_df
+
+
+def write_eft(updated_df, original_path, save_path):
+    with open(original_path, 'r', encoding='utf-8') as file:
+        original_lines = file.readlines()
+    header = original_lines[0]
+
+    with open(save_path, 'w', encoding='utf-8') as new_file:
+        new_file.write(header)
+        for idx, row in updated_df.iterrows():
+            sabre_code = str(row.iloc[0]).strip() if len(row) > 0 else ""
+            col2 = str(row.iloc[1]).strip() if len(row) > 1 else ""
+            col3 = str(row.iloc[2]).strip() if len(row) > 2 else ""
+            branch_code = str(row.iloc[3]).strip() if len(row) > 3 else ""
+            acc_number = str(row.iloc[4]).strip() if len(row) > 4 else ""
+            company_name = str(row.iloc[5]).strip() if len(row) > 5 else ""
+
+            total_due = str(row.iloc[6]).strip() if len(row) > 6 else ""
+            if total_due == "0" or total_due == "":
+                total_due = "00000000000"
+
+            sabre_radio = str(row.iloc[7]).strip() if len(row) > 7 else "SABRE RADIO"
+            n_value = str(row.iloc[8]).strip() if len(row) > 8 else "N"
+
+            formatted_line = (
+                f"{sabre_code:<7}  "
+                f"{col2:<1}  "
+                f"{col3:<1}  "
+                f"{branch_code:<6}  "
+                f"{acc_number:<19}  "
+                f"{company_name:<20}  "
+                f"{total_due:<11}  "
+                f"{sabre_radio:<15}  "
+                f"{n_value}"
+            )
+            new_file.write(formatted_line + '\n')
+
+
+def write_baseline_eft(csv_path, eft_path, output_path):
+    """Write the .eft file the original app made from a bill run and the previous .eft file"""
+    write_eft(update(load_eft(eft_path), load_billing(csv_path)), eft_path, output_path)
+
+
+def _amount(field):
+    return int(field) if field.isdigit() else None
+
+
+def classify_difference(source, baseline, current):
+    """Return the reason in BASELINE_REASONS for a record that differs from the original writer, or None.
+
+    source is the record as read from the previous .eft file, baseline and
+    current the record as the original writer and the current code wrote it.
+    """
+    source_fields = split_record(source.strip())
+    if len(source_fields) != FIELD_COUNT:
+        return "field_split"
+    baseline_fields, current_fields = split_record(baseline), split_record(current)
+    if len(current_fields) != FIELD_COUNT or len(baseline_fields) != FIELD_COUNT:
+        return None
+    others = [i for i in range(FIELD_COUNT) if i != TOTAL_DUE_FIELD]
+    if any(baseline_fields[i] != current_fields[i] for i in others):
+        return None
+    baseline_cents, current_cents = _amount(baseline_fields[TOTAL_DUE_FIELD]), _amount(current_fields[TOTAL_DUE_FIELD])
+    if baseline_cents is None or current_cents is None:
+        return None
+    code = source_fields[0]
+    if baseline_cents == 0 and current_cents != 0 and code != code.zfill(7):
+        return "unpadded_code"
+    if abs(baseline_cents - current_cents) <= VAT_CENTS_TOLERANCE:
+        return "vat_cents"
+    return None
+
+
+def record_lines(file_path):
+    """The non-blank record lines of an .eft file (after its header), decoded as the original app did"""
+    with open(file_path, 'r', encoding='utf-8') as file:
+        return [line for line in file.readlines()[1:] if line.strip()]
+
+
+def baseline_differences(source_path, baseline_path, current_path):
+    """Compare an output with the original writer's; returns {reason: [line numbers]} and the unexplained lines.
+
+    Line numbers count from the header (line 1), as in the output files.
+    """
+    with open(baseline_path, 'r', encoding='utf-8') as file:
+        baseline = file.readlines()
+    with open(current_path, 'r', encoding='utf-8', newline='') as file:
+        current = file.read().splitlines(keepends=True)
+    source = record_lines(source_path)
+    differences, unexplained = {}, []
+    if baseline[0].rstrip("\r\n") != current[0].rstrip("\r\n") or len(baseline) != len(current):
+        unexplained.append(1)
+    for number, (source_line, baseline_line, current_line) in enumerate(zip(source, baseline[1:], current[1:]), 2):
+        if baseline_line.rstrip("\r\n") == current_line.rstrip("\r\n"):
+            continue
+        reason = classify_difference(source_line, baseline_line, current_line)
+        if reason is None:
+            unexplained.append(number)
+        else:
+            differences.setdefault(reason, []).append(number)
+    return differences, unexplained
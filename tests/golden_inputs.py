@@ -0,0 +1,103 @@
+"""Deterministic synthetic bill runs for the golden-file regression suite.
+
+Every input is generated from a seed, so the large parity runs never need a
+stored input file: the same seed and record count always give the same bytes.
+The records cover the cases the writer has to get exactly right: padded and
+unpadded codes, empty and overlong fields, zero and missing amounts, billed
+customers without a record, records without billing and repeated bill lines
+that are consolidated, rounded and VAT'd.
+"""
+import random
+
+HEADER = "HDR  SABRE RADIO  20240401  PAYMENTS"
+
+COMPANY_NAMES = ["ACME TRADING", "BOBS AUTO", "CAFE DU MONDE", "ZULU PTY LTD", "O'BRIEN & SONS",
+                 "A", "SIXTEEN CHARS CO", "TWENTY CHARACTERS CO"]
+BRANCH_CODES = ["250655", "632005", "051001", "198765", "470010", "", "7"]
+
+
+def eft_line(code, branch, account, name, cents, col2="A", col3="1"):
+    """One record in the sabre_standard layout, as the April 2024 file has it"""
+    return (f"{code:<7}  {col2:<1}  {col3:<1}  {branch:<6}  {account:<19}  {name:<20}  {cents:011d}  "
+            f"{'SABRE RADIO':<15}  N")
+
+
+def eft_records(count, seed=1):
+    """Yield (code, record line) for count synthetic records"""
+    rng = random.Random(seed)
+    for i in range(count):
+        code = f"{i + 1000:07d}" if rng.random() < 0.9 else str(i + 1000)
+        line = eft_line(code, rng.choice(BRANCH_CODES), str(rng.randint(10 ** 8, 10 ** 11)),
+                        rng.choice(COMPANY_NAMES), rng.choice([0, rng.randint(1, 5_000_000)]))
+        yield code, line
+
+
+def bill_lines(codes, seed=2, new_customers=20):
+    """Yield bill run CSV lines for most of codes, some twice, and a few codes without a record"""
+    rng = random.Random(seed)
+    yield "sep=,"
+    yield "CustomerCode,TotalDue,Item"
+    for code in codes:
+        if rng.random() < 0.05:
+            continue
+        for _ in range(rng.choice([1, 1, 1, 2])):
+            amount = rng.choice([f"{rng.randint(0, 2_000_000) / 100:.2f}", str(rng.randint(0, 20_000)),
+                                 f"{rng.randint(0, 2_000_000) / 1000:.3f}"])
+            yield f"{int(code)},{amount},subscription"
+    for j in range(new_customers):
+        yield f"{900000 + j},12.50,new"
+
+
+def write_inputs(directory, count, seed=1, newline="\n"):
+    """Write previous.eft and billrun.csv for count records into directory, returning their paths"""
+    eft_path = f"{directory}/previous.eft"
+    csv_path = f"{directory}/billrun.csv"
+    codes = []
+    with open(eft_path, "w", encoding="utf-8", newline="") as eft:
+        eft.write(HEADER + newline)
+        for code, line in eft_records(count, seed):
+            codes.append(code)
+            eft.write(line + newline)
+    with open(csv_path, "w", encoding="utf-8", newline="") as csv:
+        for line in bill_lines(codes, seed + 1):
+            csv.write(line + "\n")
+    return csv_path, eft_path
+
+
+def write_messy_inputs(directory, count, seed=3):
+    """Like write_inputs, with the hand-edited lines real files contain: shifted fields, extra
+    columns, blank lines and trailing spaces"""
+    csv_path, eft_path = write_inputs(directory, count, seed)
+    with open(eft_path, encoding="utf-8") as eft:
+        lines = eft.read().split("\n")[:-1]
+    for i in range(1, len(lines)):
+        if i % 17 == 0:
+            lines[i] = lines[i].replace("  A  1  ", "  A  1   ", 1)
+        elif i % 23 == 0:
+            lines[i] += "  EXTRA"
+        elif i % 29 == 0:
+            lines[i] += "   "
+    for i in range(len(lines) - 1, 1, -31):
+        lines.insert(i, "")
+    with open(eft_path, "w", encoding="utf-8", newline="") as eft:
+        eft.write("\n".join(lines) + "\n")
+    return csv_path, eft_path
+
+
+def write_legacy_inputs(directory, count, seed=4):
+    """Like write_inputs, as a Windows-1252 export with CRLF line endings and accented names"""
+    csv_path, eft_path = write_inputs(directory, count, seed, newline="\r\n")
+    with open(eft_path, encoding="utf-8", newline="") as eft:
+        text = eft.read()
+    text = text.replace("CAFE DU MONDE", "CAFÉ DU MONDE").replace("BOBS AUTO", "BÖBS AUTO")
+    with open(eft_path, "w", encoding="cp1252", newline="") as eft:
+        eft.write(text)
+    return csv_path, eft_path
+
+
+# Stored golden cases: name -> (input writer, record count, whether an Excel report is expected)
+CASES = {
+    "standard": (write_inputs, 400, True),
+    "messy": (write_messy_inputs, 200, True),
+    "legacy_crlf": (write_legacy_inputs, 200, True),
+}
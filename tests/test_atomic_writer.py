@@ -0,0 +1,87 @@
+"""Unit tests of crash-safe .eft writing and resuming from checkpoints."""
+import json
+
+import pytest
+
+from atomic_writer import AtomicEftWriter
+
+HEADER = "HDR  SABRE RADIO  20240401  PAYMENTS"
+RECORDS = [f"{i:07d}  A  1  250655  {i:<19}  ACME TRADING          {i * 100:011d}  SABRE RADIO      N"
+           for i in range(1, 26)]
+
+
+class Crash(Exception):
+    pass
+
+
+def write(path, records=RECORDS, fingerprint="input-1", crash_after=None, checkpoint_every=4):
+    """Write the records, resuming where an interrupted run left off; returns the record resumed after"""
+    with AtomicEftWriter(str(path), fingerprint=fingerprint, checkpoint_every=checkpoint_every) as writer:
+        start = writer.start_record
+        if start == 0:
+            writer.write_header(HEADER)
+        for number, line in enumerate(records[start:], start + 1):
+            writer.write_record(line)
+            if number == crash_after:
+                raise Crash()
+    return start
+
+
+def expected_bytes():
+    return ("\n".join([HEADER] + RECORDS) + "\n").encode("utf-8")
+
+
+def test_a_complete_write_replaces_the_destination(tmp_path):
+    path = tmp_path / "new.eft"
+    path.write_text("old contents")
+    write(path)
+    assert path.read_bytes() == expected_bytes()
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.eft"]
+
+
+def test_a_crash_never_leaves_a_partial_file_under_the_name(tmp_path):
+    path = tmp_path / "new.eft"
+    path.write_text("old contents")
+    with pytest.raises(Crash):
+        write(path, crash_after=10)
+    assert path.read_text() == "old contents"
+    checkpoint = json.loads((tmp_path / ".new.eft.ckpt").read_text())
+    assert checkpoint["records"] == 8
+
+
+def test_a_rerun_resumes_after_the_last_checkpoint(tmp_path):
+    path = tmp_path / "new.eft"
+    with pytest.raises(Crash):
+        write(path, crash_after=10)
+    assert write(path) == 8
+    assert path.read_bytes() == expected_bytes()
+    # The checkpoint and partial file are gone once the file is in place
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["new.eft"]
+
+
+def test_different_input_starts_over(tmp_path):
+    path = tmp_path / "new.eft"
+    with pytest.raises(Crash):
+        write(path, crash_after=10)
+    changed = RECORDS[:3] + ["0000099  A  1  250655  99  ZULU PTY LTD  00000000001  SABRE RADIO  N"] + RECORDS[4:]
+    assert write(path, records=changed, fingerprint="input-2") == 0
+    assert path.read_text().splitlines()[1:] == changed
+
+
+def test_a_damaged_partial_file_starts_over(tmp_path):
+    path = tmp_path / "new.eft"
+    with pytest.raises(Crash):
+        write(path, crash_after=10)
+    partial = tmp_path / ".new.eft.part"
+    data = bytearray(partial.read_bytes())
+    data[len(HEADER) + 5] ^= 0xFF
+    partial.write_bytes(bytes(data))
+    assert write(path) == 0
+    assert path.read_bytes() == expected_bytes()
+
+
+def test_without_a_fingerprint_nothing_is_kept_after_a_crash(tmp_path):
+    path = tmp_path / "new.eft"
+    with pytest.raises(Crash):
+        write(path, fingerprint=None, crash_after=10)
+    assert list(tmp_path.iterdir()) == []
@@ -0,0 +1,85 @@
+"""Unit tests of duplicate SabreCode and shared bank account detection."""
+import pandas as pd
+import pytest
+
+import processing
+from duplicates import DuplicateRecordsError, find_duplicates
+
+
+def records(rows):
+    """EFT records from (SabreCode, BranchCode, AccNumber, cents) tuples"""
+    codes, branches, accounts, cents = zip(*rows)
+    return pd.DataFrame({
+        "SabreCode": list(codes),
+        "BranchCode": list(branches),
+        "AccNumber": list(accounts),
+        "CompanyName": [f"COMPANY {i}" for i in range(len(rows))],
+        "TotalDue": pd.array(list(cents), dtype="Int64"),
+    })
+
+
+def groups(duplicates):
+    """The collision groups as {kind: [record numbers of each group]}"""
+    frame = duplicates.to_frame()
+    found = {}
+    for _, members in frame.groupby("Group", sort=True):
+        found.setdefault(str(members["Kind"].iloc[0]), []).append(members["Record"].tolist())
+    return found
+
+
+def test_a_code_on_two_lines_is_found_padded_or_not():
+    duplicates = find_duplicates(records([
+        ("0001001", "250655", "111", 100),
+        ("1001", "250655", "111", 200),
+        ("0001002", "250655", "999", 300),
+    ]))
+    assert groups(duplicates) == {"DUPLICATE_CODE": [[1, 2]]}
+    assert duplicates.describe() == ["SabreCode 0001001 appears on records 1, 2"]
+
+
+def test_an_account_under_two_codes_is_found_across_branch_code_forms():
+    duplicates = find_duplicates(records([
+        ("0001002", "632005", "222", 300),
+        ("0001003", " 632005", "222", 400),
+        ("0001004", "51001", "333", 500),
+        ("0001005", "051001", "333", 600),
+        ("0001006", "051001", "444", 700),
+    ]))
+    assert groups(duplicates) == {"SHARED_ACCOUNT": [[1, 2], [3, 4]]}
+    assert duplicates.counts() == {"SHARED_ACCOUNT": 2}
+
+
+def test_blank_codes_and_accounts_are_never_collisions():
+    duplicates = find_duplicates(records([
+        ("", "051001", "333", 100),
+        ("", "051001", "333", 200),
+        ("0001007", "051001", "", 300),
+        ("0001008", "051001", "", 400),
+    ]))
+    assert len(duplicates) == 0
+
+
+def test_only_groups_debiting_more_than_once_block():
+    duplicates = find_duplicates(records([
+        ("0001001", "250655", "111", 100),
+        ("0001001", "250655", "111", 0),
+        ("0001002", "632005", "222", 300),
+        ("0001003", "632005", "222", 400),
+        ("0001004", "470010", "555", None),
+        ("0001004", "470010", "555", 100),
+    ]))
+    assert duplicates.group_count() == 3
+    assert groups(duplicates.blocking()) == {"SHARED_ACCOUNT": [[3, 4]]}
+
+
+def test_blocking_duplicates_stop_the_run_with_their_groups():
+    updated = records([
+        ("0001001", "250655", "111", 100),
+        ("1001", "250655", "111", 200),
+    ])
+    with pytest.raises(DuplicateRecordsError) as raised:
+        processing.check_duplicates(updated, block=True)
+    assert isinstance(raised.value, ValueError)
+    assert raised.value.blocking.group_count() == 1
+    # Without blocking the groups are only logged
+    assert processing.check_duplicates(updated).group_count() == 1
@@ -0,0 +1,142 @@
+"""Golden-file regression tests: the outputs must stay byte-identical to the stored ones.
+
+Regenerate the golden files with tests/update_golden.py only for a deliberate
+format change. Each case's baseline.eft is the output of the original app's
+writer and every line where expected.eft departs from it is listed, with its
+reason, in baseline_differences.json. The scale run generates its inputs from a seed and checks the
+output digest recorded in golden/scale.json; set GOLDEN_SCALE_RECORDS to run
+it at another recorded size (e.g. 1000000).
+"""
+import io
+import json
+import os
+
+import pytest
+
+import baseline_writer
+import golden
+import processing
+import streaming
+from golden_inputs import CASES, eft_records, write_inputs
+from layouts import get_layout
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+SCALE_RECORDS = int(os.environ.get("GOLDEN_SCALE_RECORDS", "200000"))
+
+
+def assert_identical(expected_path, actual_path):
+    differences = golden.compare_outputs(expected_path, actual_path)
+    assert not differences, "\n".join(difference.describe() for difference in differences)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_golden_case(name, tmp_path):
+    directory = os.path.join(GOLDEN_DIR, name)
+    excel = CASES[name][2]
+    output = str(tmp_path / "new.eft")
+    excel_path = str(tmp_path / "report.xlsx") if excel else None
+    processing.run_pipeline(os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft"),
+                            output, excel_path)
+    assert_identical(os.path.join(directory, "expected.eft"), output)
+    if excel:
+        assert_identical(os.path.join(directory, "expected.xlsx"), excel_path)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_departures_from_original_writer_are_intended(name):
+    directory = os.path.join(GOLDEN_DIR, name)
+    with open(os.path.join(directory, "baseline_differences.json"), encoding="utf-8") as file:
+        recorded = json.load(file)
+    csv_path, eft_path = os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft")
+    if "baseline_error" in recorded:
+        # The original writer cannot read this case at all (e.g. a Windows-1252 file)
+        with pytest.raises((UnicodeDecodeError, ValueError)):
+            baseline_writer.write_baseline_eft(csv_path, eft_path, os.devnull)
+        return
+    differences, unexplained = baseline_writer.baseline_differences(
+        eft_path, os.path.join(directory, "baseline.eft"), os.path.join(directory, "expected.eft"))
+    assert not unexplained
+    assert differences == recorded["differences"]
+    assert set(differences) <= set(baseline_writer.BASELINE_REASONS)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_streaming_matches_golden(name, tmp_path):
+    directory = os.path.join(GOLDEN_DIR, name)
+    output = str(tmp_path / "new.eft")
+    # Small batches put batch boundaries all through the file
+    streaming.run_streaming(os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft"),
+                            output, batch_lines=37)
+    assert_identical(os.path.join(directory, "expected.eft"), output)
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_gaps_account_for_every_billed_cent(name, tmp_path):
+    directory = os.path.join(GOLDEN_DIR, name)
+    csv_path, eft_path = os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft")
+    billed = int(processing.load_billing_csv(csv_path)["TotalDue"].sum())
+    summary = processing.run_pipeline(csv_path, eft_path, str(tmp_path / "new.eft"))
+    assert summary["total_due_cents"] + summary["billing_only_cents"] == billed
+    assert summary["eft_only"] == summary["unmatched"]
+    streamed = streaming.run_streaming(csv_path, eft_path, str(tmp_path / "streamed.eft"), batch_lines=37)
+    for key in ("eft_only", "eft_only_cents", "billing_only", "billing_only_cents", "uncollected"):
+        assert streamed[key] == summary[key]
+
+
+def test_scale(tmp_path):
+    with open(os.path.join(GOLDEN_DIR, "scale.json"), encoding="utf-8") as file:
+        digests = json.load(file)
+    if str(SCALE_RECORDS) not in digests:
+        pytest.skip(f"No digest recorded for {SCALE_RECORDS:,} records (see update_golden.py --scale)")
+    expected = digests[str(SCALE_RECORDS)]
+    csv_path, eft_path = write_inputs(str(tmp_path), SCALE_RECORDS)
+    output = str(tmp_path / "new.eft")
+    processing.run_pipeline(csv_path, eft_path, output)
+    assert golden.file_digest(output) == (expected["sha256"], expected["size"], expected["lines"])
+
+
+def test_format_frame_matches_format_record():
+    layout = get_layout()
+    lines = [line for _, line in eft_records(2000, seed=7)]
+    frame = layout.parse_lines(lines).frame
+    assert layout.format_frame(frame) == [layout.format_record(row) for row in frame.itertuples(index=False)]
+
+
+def test_compare_streams_reports_first_difference():
+    expected = b"".join(b"line %06d\n" % i for i in range(10_000))
+    actual = expected.replace(b"line 007001", b"line 007X01")
+    difference = golden.compare_streams(io.BytesIO(expected), io.BytesIO(actual), chunk_size=4096)
+    assert difference.line == 7002
+    assert difference.offset == expected.index(b"line 007001") + 8
+    assert (difference.expected, difference.actual) == (b"line 007001", b"line 007X01")
+
+    assert golden.compare_streams(io.BytesIO(expected), io.BytesIO(expected), chunk_size=4096) is None
+    truncated = golden.compare_streams(io.BytesIO(expected), io.BytesIO(expected[:-5]), chunk_size=4096)
+    assert truncated.offset == len(expected) - 5
+
+
+@pytest.mark.parametrize("name", sorted(CASES))
+def test_verbatim_matches_golden(name, tmp_path):
+    # The stored inputs only hold fields the layout writes back unchanged
+    directory = os.path.join(GOLDEN_DIR, name)
+    output = str(tmp_path / "new.eft")
+    processing.run_pipeline(os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft"),
+                            output, verbatim_records=True)
+    assert_identical(os.path.join(directory, "expected.eft"), output)
+
+
+def test_verbatim_only_replaces_total_due(tmp_path):
+    lines = [line for _, line in eft_records(50, seed=5)]
+    lines[3] = lines[3][:44] + " " + lines[3][44:63] + lines[3][64:]  # CompanyName shifted by a space
+    lines[7] = lines[7][:23] + lines[7][23:42].replace(" ", "_") + lines[7][42:]  # AccNumber padded by hand
+    eft_path = tmp_path / "previous.eft"
+    eft_path.write_text("HDR\n" + "\n".join(lines) + "\n", encoding="utf-8")
+    csv_path = tmp_path / "billrun.csv"
+    csv_path.write_text("CustomerCode,TotalDue\n" + "".join(f"{line[:7]},10.00\n" for line in lines),
+                        encoding="utf-8")
+    output = tmp_path / "new.eft"
+    processing.run_pipeline(str(csv_path), str(eft_path), str(output), verbatim_records=True)
+
+    written = output.read_text(encoding="utf-8").splitlines()[1:]
+    assert [line[:66] + line[77:] for line in written] == [line[:66] + line[77:] for line in lines]
+    assert {line[66:77] for line in written} == {"00000001150"}
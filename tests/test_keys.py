@@ -0,0 +1,47 @@
+"""Unit tests of the canonical SabreCode keys and the joins on interned ids."""
+import numpy as np
+
+from keys import intern_codes, join_amounts, normalize_code, normalize_codes, sum_by_key
+
+
+def test_every_form_of_a_code_normalizes_to_one_key():
+    codes = [" 1234 ", 1234, 1234.0, "0001234", "1234.00", "\t1234"]
+    assert normalize_codes(codes).tolist() == ["0001234"] * len(codes)
+
+
+def test_missing_codes_normalize_to_blank():
+    assert normalize_codes([None, np.nan, "nan", "None", "<NA>", "", "  "]).tolist() == [""] * 7
+
+
+def test_letters_are_upper_cased_and_long_codes_kept():
+    assert normalize_codes(["abc1", "12345678"]).tolist() == ["000ABC1", "12345678"]
+
+
+def test_scalar_normalization_matches_the_vectorized_one():
+    codes = [" 1234 ", 1234, 1234.0, "abc1", None, float("nan"), "", "12345678"]
+    assert [normalize_code(code) for code in codes] == normalize_codes(codes).tolist()
+
+
+def test_branch_codes_use_their_own_width():
+    assert normalize_codes(["7", "632005"], width=6).tolist() == ["000007", "632005"]
+
+
+def test_interned_ids_agree_across_columns():
+    (left, right), categories = intern_codes(["1", "0000002", "3"], [2, "0000001", "4"])
+    assert left.dtype == np.int32
+    assert left[0] == right[1] and left[1] == right[0]
+    assert categories[right[2]] == "0000004"
+    assert len(categories) == 4
+
+
+def test_join_matches_unpadded_codes_and_never_blanks():
+    amounts, matched = join_amounts(["1", "0000002", "", "3"], ["0000001", "2", "2", ""], [10, 20, 30, 40])
+    # The last amount of a repeated source key wins
+    np.testing.assert_array_equal(amounts, [10, 30, 0, 0])
+    np.testing.assert_array_equal(matched, [True, True, False, False])
+
+
+def test_sum_by_key_adds_every_form_of_a_code():
+    codes, sums = sum_by_key(["1", "0000001", 2, "1.0"], [5, 6, 7, 8])
+    assert codes.tolist() == ["0000001", "0000002"]
+    np.testing.assert_array_equal(sums, [19, 7])
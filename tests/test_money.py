@@ -0,0 +1,47 @@
+"""Unit tests of the integer-cents parsing and formatting of amounts."""
+import numpy as np
+import pytest
+
+from money import cents_to_rands, format_cents, parse_cents, parse_eft_cents
+
+
+def test_decimal_amounts_parse_to_exact_cents():
+    values = ["1560.49", "12", "+2.50", "5.", ".5", " 7.1 ", "0.1", "0.29"]
+    np.testing.assert_array_equal(parse_cents(values), [156049, 1200, 250, 500, 50, 710, 10, 29])
+
+
+def test_amounts_that_floats_cannot_hold_exactly():
+    # 0.29 * 100 is 28.999999999999996 as a float, 1.15 * 100 is 114.99999999999999
+    np.testing.assert_array_equal(parse_cents(["0.29", "1.15", "4.35", "99999999.99"]),
+                                  [29, 115, 435, 9999999999])
+
+
+def test_third_decimal_rounds_half_away_from_zero():
+    np.testing.assert_array_equal(parse_cents(["0.005", "0.004", "1.999", "-3.125", "-3.124"]),
+                                  [1, 0, 200, -313, -312])
+
+
+def test_missing_amounts_count_as_zero():
+    np.testing.assert_array_equal(parse_cents([None, np.nan, "1.00"]), [0, 0, 100])
+
+
+@pytest.mark.parametrize("bad", ["abc", "1,000.00", "", ".", "1.2.3", "R10"])
+def test_invalid_amounts_are_refused(bad):
+    with pytest.raises(ValueError, match="Invalid amount"):
+        parse_cents(["1.00", bad])
+
+
+def test_eft_amounts_parse_to_nullable_cents():
+    parsed = parse_eft_cents(["00000012345", "00000000000", "", "abc"])
+    assert str(parsed.dtype) == "Int64"
+    assert parsed.fillna(-1).tolist() == [12345, 0, -1, -1]
+
+
+def test_eft_amounts_format_zero_padded():
+    assert format_cents(12345) == "00000012345"
+    assert format_cents(None) == "00000000000"
+    assert format_cents(np.nan) == "00000000000"
+
+
+def test_cents_convert_to_rands_for_display():
+    np.testing.assert_array_equal(cents_to_rands(np.array([156049, 0, -5])), [1560.49, 0.0, -0.05])
@@ -0,0 +1,88 @@
+"""Unit tests of the dated VAT and rounding policies."""
+import datetime
+
+import numpy as np
+import pytest
+
+from baseline_writer import round_amount
+from policy import HALF_UP, TRUNCATE, Policy, PolicyRule, get_policy, parse_period, parse_rate
+
+
+def test_rates_are_exact_fractions():
+    assert parse_rate("15%") == parse_rate("0.15") == parse_rate("3/20") == parse_rate(0.15)
+    with pytest.raises(ValueError):
+        parse_rate("-1%")
+    with pytest.raises(ValueError):
+        parse_rate("fifteen")
+
+
+def test_up_4_9_matches_the_original_round_amount():
+    rule = PolicyRule("2018-04-01", "15%", rounding="up_4_9")
+    cents = np.arange(0, 200_000)
+    expected = np.array([int(round_amount(amount)) for amount in cents])
+    np.testing.assert_array_equal(rule.round(cents), expected)
+
+
+def test_default_policy_is_the_original_vat_and_rounding_on_exact_cents():
+    rule = get_policy().rule_for(datetime.date(2024, 4, 1))
+    cents = np.arange(0, 200_000)
+    # The original multiplied float Rands by 1.15 and truncated; on exact cents that is c * 115 // 100
+    expected = np.array([int(round_amount(amount * 115 // 100)) for amount in cents])
+    np.testing.assert_array_equal(rule.apply(cents), expected)
+
+
+@pytest.mark.parametrize("cents, truncated, half_up", [
+    (3, 3, 3),  # 3.45
+    (7, 8, 8),  # 8.05
+    (10, 11, 12),  # 11.5
+    (30, 34, 35),  # 34.5
+    (100, 115, 115),
+])
+def test_half_up_and_truncate(cents, truncated, half_up):
+    assert PolicyRule("2018-04-01", "15%", vat_rounding=TRUNCATE).add_vat(cents) == truncated
+    assert PolicyRule("2018-04-01", "15%", vat_rounding=HALF_UP).add_vat(cents) == half_up
+
+
+@pytest.mark.parametrize("vat_rounding", [TRUNCATE, HALF_UP])
+def test_negative_amounts_mirror_positive_ones(vat_rounding):
+    rule = PolicyRule("2018-04-01", "15%", vat_rounding=vat_rounding)
+    cents = np.arange(1, 10_000)
+    np.testing.assert_array_equal(rule.add_vat(-cents), -rule.add_vat(cents))
+
+
+def test_negative_amounts_are_rounded_on_their_remainder():
+    rule = PolicyRule("2018-04-01", "15%", rounding="up_4_9")
+    # A credit of R10.00 is -11.50 with VAT; -1150 ends in 0 and is left alone
+    assert rule.apply(-1000) == -1150
+    # -6 leaves remainder 4 (modulus 10), so it moves up to -5 like any amount ending in 4
+    assert rule.round(-6) == -5
+
+
+def test_the_rule_in_effect_on_the_period_applies():
+    policy = Policy("client", [
+        PolicyRule("2025-05-01", "15.5%"),
+        PolicyRule("2018-04-01", "15%"),
+    ])
+    assert policy.rule_for(parse_period("2025-04")).vat_rate == parse_rate("15%")
+    assert policy.rule_for(datetime.date(2025, 4, 30)).vat_rate == parse_rate("15%")
+    assert policy.rule_for(parse_period("2025-05")).vat_rate == parse_rate("15.5%")
+    assert policy.apply(1000, parse_period("2025-04")) == 1150
+    assert policy.apply(1000, parse_period("2025-05")) == 1155
+
+
+def test_no_rule_before_the_first_effective_date():
+    policy = Policy("client", [PolicyRule("2018-04-01", "15%")])
+    with pytest.raises(ValueError):
+        policy.rule_for(datetime.date(2018, 3, 31))
+
+
+def test_two_rules_on_one_date_are_refused():
+    with pytest.raises(ValueError):
+        Policy("client", [PolicyRule("2018-04-01", "15%"), PolicyRule("2018-04-01", "14%")])
+
+
+def test_invalid_periods_are_refused():
+    assert parse_period("2024-04") == datetime.date(2024, 4, 1)
+    assert parse_period(None) is None
+    with pytest.raises(ValueError):
+        parse_period("April 2024")
@@ -0,0 +1,55 @@
+"""Unit tests of the shared run registry's locks and run records."""
+import os
+
+import pytest
+
+import golden
+import run_registry
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+
+def test_registry_refuses_competing_runs(tmp_path):
+    directory = os.path.join(GOLDEN_DIR, "standard")
+    csv_path, eft_path = os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft")
+    path = str(tmp_path / "runs.db")
+    with run_registry.RunRegistry(path) as first, run_registry.RunRegistry(path) as second:
+        run_id = first.acquire("default", "2025-05", csv_path, eft_path)
+        with pytest.raises(run_registry.RunLockError):
+            second.acquire("default", "2025-05")
+        assert second.acquire("default", "2025-06")
+        first.finish(run_id, os.path.join(directory, "expected.eft"), {"rows": 400})
+        with pytest.raises(run_registry.RunLockError):
+            second.acquire("default", "2025-05")
+        second.acquire("default", "2025-05", rerun=True)
+
+        run = first.runs("default", "2025-05", status=run_registry.OK)[0]
+        assert run["csv_sha256"] == golden.file_digest(csv_path)[0]
+        assert run["output_sha256"] == golden.file_digest(os.path.join(directory, "expected.eft"))[0]
+
+
+def test_an_expired_lock_is_taken_over(tmp_path, caplog):
+    path = str(tmp_path / "runs.db")
+    # A lock that expires at once stands for a run that crashed four hours ago
+    with run_registry.RunRegistry(path, lock_ttl=-1) as crashed, run_registry.RunRegistry(path) as second:
+        stale_id = crashed.acquire("default", "2025-05")
+        assert second.holder("default", "2025-05") is None
+        run_id = second.acquire("default", "2025-05")
+        assert "Taking over the expired lock" in caplog.text
+        assert second.holder("default", "2025-05")["run_id"] == run_id
+        [stale] = second.runs("default", "2025-05", status=run_registry.FAILED)
+        assert stale["run_id"] == stale_id
+        assert stale["error"] == "lock expired"
+
+
+def test_release_removes_the_lock_and_fails_its_run(tmp_path):
+    with run_registry.RunRegistry(str(tmp_path / "runs.db")) as registry:
+        run_id = registry.acquire("default", "2025-05")
+        assert registry.release("default", "2025-05")
+        assert registry.holder("default", "2025-05") is None
+        [run] = registry.runs("default", "2025-05")
+        assert (run["run_id"], run["status"]) == (run_id, run_registry.FAILED)
+        assert run["error"].startswith("lock released by")
+        assert not registry.release("default", "2025-05")
+        # Nothing finished, so the period can be processed again without a rerun
+        assert registry.acquire("default", "2025-05")
@@ -0,0 +1,28 @@
+"""Unit tests of saving and restoring a GUI session snapshot."""
+import os
+
+import golden
+import processing
+import snapshot
+from session import Session
+
+GOLDEN_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden")
+
+
+def test_restored_session_writes_golden_file(tmp_path):
+    directory = os.path.join(GOLDEN_DIR, "messy")
+    session = Session()
+    session.load_billing(os.path.join(directory, "billrun.csv"))
+    session.load_eft(os.path.join(directory, "previous.eft"))
+    session.reconcile()
+    path = str(tmp_path / "session.snapshot")
+    snapshot.save_session(session, path, extra={"note": "kept"})
+    assert snapshot.read_snapshot_info(path)["stage"] == "reconciled"
+
+    restored, extra = snapshot.restore_session(path)
+    assert extra == {"note": "kept"}
+    assert restored.gaps.summary() == session.gaps.summary()
+    output = str(tmp_path / "new.eft")
+    processing.write_eft_file(output, restored.header_line, restored.updated_frame(), layout=restored.layout,
+                              eft_format=restored.eft_format)
+    assert not golden.compare_outputs(os.path.join(directory, "expected.eft"), output)
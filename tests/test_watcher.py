@@ -0,0 +1,76 @@
+"""Unit tests of the watch-folder pairing and of bill runs that meet a registry lock."""
+import os
+import shutil
+
+import run_registry
+from watcher import InboxWatcher, find_pairs
+
+STANDARD_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "golden", "standard")
+
+
+def touch(directory, *names):
+    for name in names:
+        with open(os.path.join(directory, name), "w", encoding="utf-8") as file:
+            file.write("x")
+
+
+def names(pairs):
+    return [(os.path.basename(csv_path), os.path.basename(eft_path)) for csv_path, eft_path in pairs]
+
+
+def test_files_pair_on_their_stem_or_their_period(tmp_path):
+    touch(tmp_path, "billrun_2025-05.csv", "billrun_2025-05.eft", "billrun_2025-06.csv", "SABRE_2025_06.eft")
+    assert names(find_pairs(tmp_path)) == [("billrun_2025-05.csv", "billrun_2025-05.eft"),
+                                           ("billrun_2025-06.csv", "SABRE_2025_06.eft")]
+
+
+def test_a_stale_eft_file_is_not_paired_with_a_new_bill_run(tmp_path):
+    touch(tmp_path, "billrun_2025-06.csv", "SABRE_2025_04.eft")
+    assert find_pairs(tmp_path) == []
+    touch(tmp_path, "billrun.csv", "previous.eft")
+    assert find_pairs(tmp_path) == []
+
+
+def test_lone_files_pair_only_when_asked(tmp_path, caplog):
+    touch(tmp_path, "billrun.csv", "previous.eft")
+    assert names(find_pairs(tmp_path, pair_any=True)) == [("billrun.csv", "previous.eft")]
+    assert "share neither a name nor a period" in caplog.text
+
+
+def test_two_files_of_one_period_are_not_guessed_between(tmp_path):
+    touch(tmp_path, "billrun_2025-06.csv", "a_2025-06.eft", "b_2025-06.eft")
+    assert find_pairs(tmp_path) == []
+
+
+def watch(tmp_path):
+    inbox = tmp_path / "inbox"
+    inbox.mkdir()
+    shutil.copy(os.path.join(STANDARD_DIR, "billrun.csv"), inbox / "billrun_2025-05.csv")
+    shutil.copy(os.path.join(STANDARD_DIR, "previous.eft"), inbox / "billrun_2025-05.eft")
+    return InboxWatcher(str(inbox), str(tmp_path / "outbox"), debounce=0, excel=False,
+                        registry_path=str(tmp_path / "runs.db")), inbox
+
+
+def test_a_locked_period_stays_in_the_inbox_until_its_lock_is_released(tmp_path):
+    inbox_watcher, inbox = watch(tmp_path)
+    with run_registry.RunRegistry(inbox_watcher.registry_path) as registry:
+        run_id = registry.acquire("default", "2025-05")
+        [record] = inbox_watcher.scan_once()
+        assert record["status"] == "busy"
+        assert sorted(os.listdir(inbox)) == ["billrun_2025-05.csv", "billrun_2025-05.eft"]
+        assert not os.path.exists(tmp_path / "outbox" / "runs.jsonl")
+        registry.finish(run_id, error="given up")
+
+    [record] = inbox_watcher.scan_once()
+    assert record["status"] == "ok"
+    assert sorted(os.listdir(inbox)) == ["processed"]
+
+
+def test_an_already_processed_period_fails(tmp_path):
+    inbox_watcher, inbox = watch(tmp_path)
+    with run_registry.RunRegistry(inbox_watcher.registry_path) as registry:
+        registry.finish(registry.acquire("default", "2025-05"))
+    [record] = inbox_watcher.scan_once()
+    assert record["status"] == "failed"
+    assert "already processed" in record["error"]
+    assert sorted(os.listdir(inbox)) == ["failed"]
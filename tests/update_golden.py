@@ -0,0 +1,123 @@
+"""Regenerate the golden files of the regression suite from the current code.
+
+Only run this for a deliberate change of the output format, and review the
+diff of tests/golden before committing it:
+
+    python tests/update_golden.py                  # expected outputs of every case
+    python tests/update_golden.py --inputs         # also regenerate the synthetic inputs
+    python tests/update_golden.py --scale 1000000  # record the digest of a large generated run
+    python tests/update_golden.py --baseline       # rewrite baseline.eft with the original app's writer
+
+Each case also holds baseline.eft, the file the original app's writer makes
+from the same inputs (tests/baseline_writer.py), written once. Updating a case
+records in baseline_differences.json which lines of expected.eft depart from
+it and for which intended reason, and refuses an update that departs from it
+for any other reason.
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+
+TESTS_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(TESTS_DIR, "..", "DebitOrderApp", "src"))
+sys.path.insert(0, TESTS_DIR)
+
+import golden  # noqa: E402
+import processing  # noqa: E402
+from baseline_writer import baseline_differences, write_baseline_eft  # noqa: E402
+from golden_inputs import CASES, write_inputs  # noqa: E402
+
+GOLDEN_DIR = os.path.join(TESTS_DIR, "golden")
+SCALE_FILE = os.path.join(GOLDEN_DIR, "scale.json")
+BASELINE_NAME = "baseline.eft"
+DIFFERENCES_NAME = "baseline_differences.json"
+
+
+def update_baseline(directory):
+    """Write baseline.eft with the original app's writer; returns the error if it cannot read the inputs"""
+    baseline_path = os.path.join(directory, BASELINE_NAME)
+    try:
+        write_baseline_eft(os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft"),
+                           baseline_path)
+    except (UnicodeDecodeError, ValueError) as e:
+        if os.path.exists(baseline_path):
+            os.remove(baseline_path)
+        return f"{type(e).__name__}: {e}"
+    return None
+
+
+def record_differences(name, directory, baseline_error=None):
+    """Record how expected.eft departs from baseline.eft, refusing departures without an intended reason"""
+    baseline_path = os.path.join(directory, BASELINE_NAME)
+    if os.path.exists(baseline_path):
+        differences, unexplained = baseline_differences(os.path.join(directory, "previous.eft"), baseline_path,
+                                                        os.path.join(directory, "expected.eft"))
+        if unexplained:
+            raise SystemExit(f"{name}: expected.eft departs from {BASELINE_NAME} for no intended reason at lines "
+                             f"{', '.join(str(line) for line in unexplained[:20])}")
+        record = {"differences": differences}
+    else:
+        record = {"baseline_error": baseline_error or "no baseline.eft, run with --baseline"}
+    with open(os.path.join(directory, DIFFERENCES_NAME), "w", encoding="utf-8") as file:
+        json.dump(record, file, indent=2, sort_keys=True)
+        file.write("\n")
+
+
+def update_case(name, inputs=False, baseline=False):
+    writer, count, excel = CASES[name]
+    directory = os.path.join(GOLDEN_DIR, name)
+    os.makedirs(directory, exist_ok=True)
+    if inputs or not os.path.exists(os.path.join(directory, "previous.eft")):
+        writer(directory, count)
+    baseline_error = None
+    if baseline:
+        baseline_error = update_baseline(directory)
+    elif os.path.exists(os.path.join(directory, DIFFERENCES_NAME)):
+        with open(os.path.join(directory, DIFFERENCES_NAME), encoding="utf-8") as file:
+            baseline_error = json.load(file).get("baseline_error")
+    excel_path = os.path.join(directory, "expected.xlsx") if excel else None
+    processing.run_pipeline(os.path.join(directory, "billrun.csv"), os.path.join(directory, "previous.eft"),
+                            os.path.join(directory, "expected.eft"), excel_path)
+    record_differences(name, directory, baseline_error)
+    print(f"{name}: expected outputs written to {directory}")
+
+
+def scale_digest(records):
+    """Run the pipeline on a generated bill run of the given size and return the digest of the new .eft file"""
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path, eft_path = write_inputs(directory, records)
+        output = os.path.join(directory, "new.eft")
+        processing.run_pipeline(csv_path, eft_path, output)
+        sha256, size, lines = golden.file_digest(output)
+    return {"sha256": sha256, "size": size, "lines": lines}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Regenerate the golden files")
+    parser.add_argument("--inputs", action="store_true", help="Also regenerate the synthetic inputs")
+    parser.add_argument("--baseline", action="store_true",
+                        help="Also rewrite baseline.eft with the original app's writer (only for new inputs)")
+    parser.add_argument("--scale", type=int, action="append", default=[],
+                        help="Record the output digest of a generated run with this many records")
+    args = parser.parse_args()
+
+    for name in CASES:
+        update_case(name, args.inputs, args.baseline or args.inputs)
+
+    if args.scale:
+        digests = {}
+        if os.path.exists(SCALE_FILE):
+            with open(SCALE_FILE, encoding="utf-8") as file:
+                digests = json.load(file)
+        for records in args.scale:
+            digests[str(records)] = scale_digest(records)
+            print(f"{records:,} records: {digests[str(records)]['sha256']}")
+        with open(SCALE_FILE, "w", encoding="utf-8") as file:
+            json.dump(digests, file, indent=2, sort_keys=True)
+            file.write("\n")
+
+
+if __name__ == "__main__":
+    main()